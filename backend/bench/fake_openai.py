@@ -0,0 +1,208 @@
+"""Локальный OpenAI-совместимый сервер для нагрузочных тестов.
+
+Отвечает на те же эндпоинты, что использует бэкенд:
+    POST /v1/chat/completions       (в т.ч. stream=true, SSE-чанки)
+    POST /v1/audio/speech           (WAV, отдаётся чанками)
+    POST /v1/audio/transcriptions   (multipart, JSON {"text": ...})
+    GET  /stats                     (число вызовов по эндпоинтам)
+
+Задержка, размер аудио и доля ошибок настраиваются переменными окружения
+(или флагами при запуске как скрипта):
+    FAKE_OPENAI_LATENCY_CHAT=0.8      средняя задержка, сек
+    FAKE_OPENAI_LATENCY_SPEECH=1.2
+    FAKE_OPENAI_LATENCY_TRANSCRIPTION=0.6
+    FAKE_OPENAI_JITTER=0.2            +/- доля от задержки
+    FAKE_OPENAI_ERROR_RATE=0.0        доля ответов 500/429
+    FAKE_OPENAI_AUDIO_SECONDS=8       длина синтезируемого аудио
+    FAKE_OPENAI_CHUNK_BYTES=16384     размер чанка потоковых ответов
+
+Запуск:
+    python -m bench.fake_openai --port 8100 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import time
+import wave
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+
+CALLS = {"chat": 0, "speech": 0, "transcription": 0}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _latency(kind: str) -> float:
+    base = _env_float(f"FAKE_OPENAI_LATENCY_{kind.upper()}", 0.5)
+    jitter = _env_float("FAKE_OPENAI_JITTER", 0.2)
+    return max(0.0, base * (1 + random.uniform(-jitter, jitter)))
+
+
+def _injected_error() -> Optional[JSONResponse]:
+    if random.random() >= _env_float("FAKE_OPENAI_ERROR_RATE", 0.0):
+        return None
+    status = random.choice([429, 500])
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": "Injected failure", "type": "server_error", "code": status}},
+    )
+
+
+def _wav_bytes(seconds: float, sample_rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(bytes(int(seconds * sample_rate) * 2))
+    return buffer.getvalue()
+
+
+_WAV_CACHE: dict = {}
+
+
+def _cached_wav() -> bytes:
+    seconds = _env_float("FAKE_OPENAI_AUDIO_SECONDS", 8.0)
+    if seconds not in _WAV_CACHE:
+        _WAV_CACHE[seconds] = _wav_bytes(seconds)
+    return _WAV_CACHE[seconds]
+
+
+async def _chunked(data: bytes, total_delay: float):
+    """Отдать данные чанками, растянув задержку на весь поток"""
+    chunk = max(1, int(_env_float("FAKE_OPENAI_CHUNK_BYTES", 16384)))
+    parts = [data[i:i + chunk] for i in range(0, len(data), chunk)] or [b""]
+    pause = total_delay / len(parts)
+    for part in parts:
+        await asyncio.sleep(pause)
+        yield part
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    CALLS["chat"] += 1
+    delay = _latency("chat")
+    error = _injected_error()
+    if error is not None:
+        await asyncio.sleep(delay / 2)
+        return error
+
+    question_full = ""
+    for message in body.get("messages", []):
+        if message.get("role") == "user":
+            question_full = str(message.get("content", ""))
+    question = question_full[-200:]
+    answer = "Это ответ тестового сервера. " + " ".join(question.split()[:20])
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        # Пакетный QA: нумерованные вопросы -> {"answers": [...]}
+        numbered = re.findall(r"^\d+\. (.+)$", question_full, flags=re.MULTILINE)
+        answer = json.dumps(
+            {"answers": ["Это ответ тестового сервера. " + " ".join(q.split()[:20]) for q in numbered]},
+            ensure_ascii=False,
+        )
+    model = body.get("model", "gpt-4o-mini")
+    created = int(time.time())
+
+    if body.get("stream"):
+        async def events():
+            words = answer.split(" ")
+            pause = delay / max(1, len(words))
+            for word in words:
+                await asyncio.sleep(pause)
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(delay)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}
+        ],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 30, "total_tokens": 130},
+    }
+
+
+@app.post("/v1/audio/speech")
+async def audio_speech(request: Request):
+    await request.body()
+    CALLS["speech"] += 1
+    delay = _latency("speech")
+    error = _injected_error()
+    if error is not None:
+        await asyncio.sleep(delay / 2)
+        return error
+    return StreamingResponse(_chunked(_cached_wav(), delay), media_type="audio/wav")
+
+
+@app.post("/v1/audio/transcriptions")
+async def audio_transcriptions(request: Request):
+    form = await request.form()
+    CALLS["transcription"] += 1
+    delay = _latency("transcription")
+    error = _injected_error()
+    await asyncio.sleep(delay)
+    if error is not None:
+        return error
+    upload = form.get("file")
+    size = len(await upload.read()) if hasattr(upload, "read") else 0
+    return {"text": f"Тестовая транскрипция ({size} байт)"}
+
+
+@app.get("/stats")
+async def stats():
+    return CALLS
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-chat", type=float, default=None)
+    parser.add_argument("--latency-speech", type=float, default=None)
+    parser.add_argument("--latency-transcription", type=float, default=None)
+    parser.add_argument("--jitter", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=None)
+    parser.add_argument("--audio-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    for flag, env_name in [
+        ("latency_chat", "FAKE_OPENAI_LATENCY_CHAT"),
+        ("latency_speech", "FAKE_OPENAI_LATENCY_SPEECH"),
+        ("latency_transcription", "FAKE_OPENAI_LATENCY_TRANSCRIPTION"),
+        ("jitter", "FAKE_OPENAI_JITTER"),
+        ("error_rate", "FAKE_OPENAI_ERROR_RATE"),
+        ("audio_seconds", "FAKE_OPENAI_AUDIO_SECONDS"),
+    ]:
+        value = getattr(args, flag)
+        if value is not None:
+            os.environ[env_name] = str(value)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
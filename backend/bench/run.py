@@ -0,0 +1,423 @@
+"""Нагрузочный тест бэкенда полностью офлайн.
+
+Поднимает локальный OpenAI-совместимый сервер (bench/fake_openai.py),
+запускает main:app через uvicorn с OPENAI_BASE_URL, указывающим на него,
+и прогоняет типичные для урока нагрузки с заданным параллелизмом:
+    slides  — загрузка колоды и отдельных слайдов
+    tts     — всплеск озвучки слайдов (+ доля уникальных текстов)
+    qa      — вопросы к /api/qa
+    stt     — загрузка записей в /api/stt
+
+Для каждого эндпоинта выводит p50/p95/p99, пропускную способность, долю
+ошибок и память сервера (RSS, сумма по процессу uvicorn и его воркерам).
+Результаты сохраняются в bench/results/, базовая линия — в
+bench/baselines/<name>.json.
+
+Каждый прогон начинается с чистого состояния: общий кеш, хранилище колод,
+базы задач и сессий, трейсы и профили лежат во временной папке прогона,
+иначе следующий прогон попадал бы в кеш, прогретый предыдущим, и
+сравнение с базовой линией теряло бы смысл.
+
+Примеры (из папки backend):
+    python -m bench.run
+    python -m bench.run --workloads tts,qa --concurrency 32 --requests 400
+    python -m bench.run --save-baseline main
+    python -m bench.run --compare main --max-regression 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+BASELINES_DIR = BENCH_DIR / "baselines"
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services import decks  # noqa: E402
+
+QUESTIONS = [
+    "Что такое права человека?",
+    "Какие права есть у задержанного?",
+    "Когда была принята Конституция Кыргызской Республики?",
+    "Что делать, если нарушены мои права?",
+    "Какова роль МВД в защите прав человека?",
+    "Чем отличаются гражданские и политические права?",
+    "Можно ли ограничить право на свободу собрания?",
+    "Что такое презумпция невиновности?",
+]
+
+WORKLOADS = ("slides", "tts", "qa", "stt")
+
+Request = Tuple[str, str, Dict]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> List[int]:
+    """Все потомки процесса (Linux /proc): воркеры uvicorn --workers N"""
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as f:
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    found: List[int] = []
+    stack = [pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    """RSS процесса и его потомков в МБ (Linux /proc); None, если недоступно"""
+    total = None
+    for process in [pid] + (_children(pid) if os.path.isdir("/proc") else []):
+        try:
+            with open(f"/proc/{process}/status", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total = (total or 0.0) + int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def _rejected_share(result: Dict) -> float:
+    return result["statuses"].get("429", 0) / result["requests"] if result["requests"] else 0.0
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _recording_wav(seconds: float = 2.0) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(bytes(int(seconds * 16000) * 2))
+    return buffer.getvalue()
+
+
+def _build_requests(workload: str, count: int, tts_unique: float) -> List[Request]:
+    slides = decks.load_slides("ru", "rights")
+    texts = [decks.speak_text(slide) for slide in slides if decks.speak_text(slide)]
+    requests: List[Request] = []
+
+    for i in range(count):
+        if workload == "slides":
+            if i % 4 == 0:
+                requests.append(("GET", "/api/slides", {"params": {"lang": "ru"}}))
+            else:
+                slide_id = random.randint(1, len(slides))
+                requests.append(("GET", f"/api/slides/{slide_id}", {"params": {"lang": "ru"}}))
+        elif workload == "tts":
+            if random.random() < tts_unique:
+                text = f"Уникальная фраза номер {i} {random.random()}"
+            else:
+                text = random.choice(texts)
+            requests.append(("POST", "/api/tts", {"json": {"text": text, "language": "ru"}}))
+        elif workload == "qa":
+            question = random.choice(QUESTIONS)
+            requests.append(("POST", "/api/qa", {"json": {
+                "question": question,
+                "slide_context": random.choice(texts)[:500],
+                "slide_id": random.randint(1, len(slides)),
+                "language": "ru",
+            }}))
+        elif workload == "stt":
+            requests.append(("POST", "/api/stt", {
+                "files": {"audio": ("recording.wav", _recording_wav(), "audio/wav")},
+                "data": {"language": "ru"},
+            }))
+    return requests
+
+
+async def _run_workload(
+    client: httpx.AsyncClient,
+    requests: List[Request],
+    concurrency: int,
+    server_pid: int,
+) -> Dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    rss_before = _rss_mb(server_pid)
+    rss_peak = rss_before or 0.0
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while not done.is_set():
+            rss = _rss_mb(server_pid)
+            if rss is not None:
+                rss_peak = max(rss_peak, rss)
+            await asyncio.sleep(0.05)
+
+    async def worker():
+        while True:
+            try:
+                method, path, kwargs = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                key = str(response.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    sampler = asyncio.create_task(sample_memory())
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+    done.set()
+    await sampler
+
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "statuses": statuses,
+        "rss_before_mb": round(rss_before, 1) if rss_before is not None else None,
+        "rss_peak_mb": round(rss_peak, 1) if rss_before is not None else None,
+        "rss_after_mb": round(_rss_mb(server_pid) or 0.0, 1) if rss_before is not None else None,
+    }
+
+
+def _start(cmd: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=str(BACKEND_DIR), env=env)
+
+
+async def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+def _print_report(results: Dict[str, Dict]):
+    header = f"{'workload':<8} {'reqs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err%':>6} {'rss peak':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        rss = f"{r['rss_peak_mb']:.0f} MB" if r.get("rss_peak_mb") is not None else "n/a"
+        print(
+            f"{name:<8} {r['requests']:>5} {r['throughput_rps']:>8.1f} {r['p50_ms']:>9.1f} "
+            f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['error_rate'] * 100:>5.1f}% {rss:>9}"
+        )
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    """Список регрессий: рост p95/p99 или падение пропускной способности сверх порога"""
+    regressions: List[str] = []
+    checks: List[Tuple[str, Callable[[float, float], float]]] = [
+        ("p95_ms", lambda new, old: (new - old) / old),
+        ("p99_ms", lambda new, old: (new - old) / old),
+        ("throughput_rps", lambda new, old: (old - new) / old),
+    ]
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, change in checks:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            delta = change(new, old)
+            marker = "REGRESSION" if delta > max_regression else "ok"
+            print(f"  {name:<8} {metric:<15} {old:>9} -> {new:>9} ({delta * 100:+.1f}% worse) {marker}")
+            if delta > max_regression:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = [w for w in workloads if w not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Unknown workloads: {unknown}. Available: {', '.join(WORKLOADS)}")
+
+    fake_port = _free_port()
+    app_port = _free_port()
+
+    fake_env = dict(os.environ)
+    fake_env.update({
+        "FAKE_OPENAI_LATENCY_CHAT": str(args.latency_chat),
+        "FAKE_OPENAI_LATENCY_SPEECH": str(args.latency_speech),
+        "FAKE_OPENAI_LATENCY_TRANSCRIPTION": str(args.latency_transcription),
+        "FAKE_OPENAI_ERROR_RATE": str(args.error_rate),
+        "FAKE_OPENAI_AUDIO_SECONDS": str(args.audio_seconds),
+    })
+
+    state_dir = tempfile.TemporaryDirectory(prefix="bench_")
+    state = Path(state_dir.name)
+    app_env = dict(os.environ)
+    app_env.update({
+        "OPENAI_API_KEY": "sk-bench-offline",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        # Заведомо недоступный Redis: измеряем бэкенд без внешнего кеша
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": "1",
+        # Состояние — только этого прогона
+        "SHARED_CACHE_PATH": str(state / "shared_cache.sqlite3"),
+        "DECK_STORE_PATH": str(state / "decks.sqlite3"),
+        "JOBS_DB_PATH": str(state / "jobs.sqlite3"),
+        "SESSIONS_DB_PATH": str(state / "sessions.sqlite3"),
+        "TRACE_FILE": str(state / "traces.jsonl"),
+        "PROFILE_DIR": str(state / "profiles"),
+        # Все клиенты теста — один IP: лимиты клиента и IP срезали бы
+        # почти все запросы в 429. Очереди допуска (параллелизм) остаются
+        "RATE_LIMIT_PER_MINUTE": "1000000",
+        "RATE_LIMIT_BURST": "1000000",
+        "RATE_LIMIT_IP_PER_MINUTE": "1000000",
+        "RATE_LIMIT_IP_BURST": "1000000",
+    })
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+
+    fake = _start([sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port)], fake_env)
+    app = _start(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning"] + (["--workers", str(args.workers)] if args.workers > 1 else []),
+        app_env,
+    )
+
+    results: Dict[str, Dict] = {}
+    aborted: Optional[str] = None
+    try:
+        await _wait_ready(f"http://127.0.0.1:{fake_port}/docs")
+        await _wait_ready(f"http://127.0.0.1:{app_port}/health")
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=args.timeout
+        ) as client:
+            for workload in workloads:
+                requests = _build_requests(workload, args.requests, args.tts_unique)
+                print(f"Running {workload}: {len(requests)} requests, concurrency {args.concurrency}...")
+                results[workload] = await _run_workload(client, requests, args.concurrency, app.pid)
+                rejected = _rejected_share(results[workload])
+                if rejected > args.max_rejected:
+                    # Замеры отказов 429 — это замеры лимитов, а не бэкенда
+                    aborted = (
+                        f"{workload}: {rejected:.0%} of responses are 429 (allowed {args.max_rejected:.0%}); "
+                        "check ADMISSION_*/RATE_LIMIT_* in --app-env"
+                    )
+                    break
+    finally:
+        for proc in (app, fake):
+            proc.terminate()
+        for proc in (app, fake):
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        state_dir.cleanup()
+
+    print()
+    _print_report(results)
+    if aborted:
+        print(f"\nRun aborted, results not saved: {aborted}")
+        return 2
+
+    report = {
+        "created_at": int(time.time()),
+        "settings": {
+            k: v for k, v in vars(args).items() if k not in {"save_baseline", "compare"}
+        },
+        "results": results,
+    }
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_file = RESULTS_DIR / f"bench_{report['created_at']}.json"
+    result_file.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nResults saved to {result_file}")
+
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+        baseline_file = BASELINES_DIR / f"{args.save_baseline}.json"
+        baseline_file.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {baseline_file}")
+
+    if args.compare:
+        baseline_file = BASELINES_DIR / f"{args.compare}.json"
+        baseline = json.loads(baseline_file.read_text(encoding="utf-8"))
+        print(f"\nComparison with baseline '{args.compare}':")
+        regressions = compare_to_baseline(results, baseline.get("results", {}), args.max_regression)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the backend")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="Comma-separated: slides,tts,qa,stt")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout, seconds")
+    parser.add_argument("--tts-unique", type=float, default=0.3, help="Share of never-repeated TTS texts")
+    parser.add_argument("--latency-chat", type=float, default=0.8)
+    parser.add_argument("--latency-speech", type=float, default=1.0)
+    parser.add_argument("--latency-transcription", type=float, default=0.6)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--audio-seconds", type=float, default=8.0)
+    parser.add_argument("--app-env", action="append", default=[], help="Extra KEY=VALUE for the backend")
+    parser.add_argument("--max-rejected", type=float, default=0.02, help="Abort if a larger share of responses is 429")
+    parser.add_argument("--save-baseline", default=None, help="Save results as bench/baselines/<name>.json")
+    parser.add_argument("--compare", default=None, help="Compare with bench/baselines/<name>.json")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="Allowed relative regression")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,371 @@
+"""export_bundle.py
+
+Экспорт колоды в статический бандл: слайды и озвучка раздаются любым
+статическим сервером или CDN, бэкенд нужен только для QA и STT.
+
+    python export_bundle.py --lang ru --deck rights
+    python export_bundle.py --all --out /srv/kiosk --audio-format mp3
+
+Результат (по умолчанию в dist/bundles/):
+
+    index.json                              список бандлов (язык, колода, манифест)
+    ru_rights/manifest.json                 точка входа колоды: пути к файлам, размеры, хеши
+    ru_rights/slides.3f9a1c0b2e.json        слайды с метаданными озвучки (+ .gz, .br)
+    ru_rights/faq.7c21d0e4aa.json           готовые ответы FAQ (+ .gz, .br)
+    ru_rights/audio/slide_01.5d0e9b7c41.ogg
+    ru_rights/audio/faq/slide_01_q01.a1b2c3d4e5.ogg
+
+Имена файлов содержат хеш содержимого, их можно кешировать навсегда
+(Cache-Control: immutable); без кеширования отдаются только index.json
+и manifest.json. .gz/.br рядом с JSON — для gzip_static / brotli_static
+nginx и аналогов; .br пишется, если установлен пакет brotli.
+
+Озвучка: --audio-format auto (по умолчанию) кодирует в Opus через ffmpeg,
+если он есть в PATH, иначе оставляет WAV. Громкость выравнивается при
+экспорте по метаданным (services/audio_meta), поэтому в бандле gain_db = 0.
+
+Повторный экспорт в тот же каталог дописывает новые файлы и последним
+подменяет manifest.json, так что клиенты всегда видят целую версию.
+Файлы, на которые не ссылаются ни новый, ни предыдущий манифест,
+удаляются — клиенты со старым манифестом успевают его дочитать.
+
+Фронтенд собирается с VITE_BUNDLE_URL=<адрес каталога с index.json>.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services import audio_meta, decks
+from services.audio_pack import AudioPackRegistry
+from services.deck_store import get_deck_store
+from services.faq import normalize_question
+from services.warmup import PRERENDERED_MIN_BYTES
+
+load_dotenv()
+
+_stdout_reconfigure = getattr(sys.stdout, "reconfigure", None)
+if callable(_stdout_reconfigure):
+    _stdout_reconfigure(encoding="utf-8", errors="replace")
+
+BUNDLE_FORMAT = 1
+DEFAULT_OUT = Path(__file__).resolve().parent.parent / "dist" / "bundles"
+
+# формат -> (расширение, MIME, аргументы ffmpeg, битрейт по умолчанию, кбит/с)
+AUDIO_FORMATS = {
+    "opus": ("ogg", "audio/ogg", ["-c:a", "libopus", "-f", "ogg"], 32),
+    "mp3": ("mp3", "audio/mpeg", ["-c:a", "libmp3lame", "-f", "mp3"], 64),
+    "wav": ("wav", "audio/wav", None, 0),
+}
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class BundleWriter:
+    """Файлы одного бандла: имена с хешем, учёт размеров для манифеста"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.files: Dict[str, Dict] = {}
+
+    def put(self, stem: str, ext: str, data: bytes, precompress: bool = False) -> str:
+        """Записать файл stem.<хеш>.ext (если такого ещё нет); вернуть путь в бандле"""
+        digest = _digest(data)
+        rel = f"{stem}.{digest[:10]}.{ext}"
+        path = self.root / rel
+        if not path.exists():
+            _write_atomic(path, data)
+        self.files[rel] = {"bytes": len(data), "sha256": digest}
+        if precompress:
+            variants = {"gz": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+            brotli = _brotli()
+            if brotli is not None:
+                variants["br"] = lambda: brotli.compress(data, quality=11)
+            for suffix, compress in variants.items():
+                compressed_path = path.with_name(f"{path.name}.{suffix}")
+                if not compressed_path.exists():
+                    _write_atomic(compressed_path, compress())
+                self.files[rel].setdefault("encodings", {})[suffix] = compressed_path.stat().st_size
+        return rel
+
+    def put_json(self, stem: str, document: Dict) -> str:
+        data = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self.put(stem, "json", data, precompress=True)
+
+
+def _gained_meta(meta: Optional[Dict], gain_db: float) -> Optional[Dict]:
+    """Метаданные после усиления на gain_db: громкость и пики сдвигаются, gain_db = 0"""
+    if meta is None:
+        return None
+    meta = dict(meta)
+    factor = 10 ** (gain_db / 20)
+    if meta.get("loudness_lufs") is not None:
+        meta["loudness_lufs"] = round(meta["loudness_lufs"] + gain_db, 2)
+    if meta.get("peak_db") is not None:
+        meta["peak_db"] = round(meta["peak_db"] + gain_db, 2)
+    if meta.get("peaks"):
+        meta["peaks"] = [round(min(p * factor, 1.0), 3) for p in meta["peaks"]]
+    meta["gain_db"] = 0.0
+    return meta
+
+
+def _encode_audio(data: bytes, meta: Optional[Dict], fmt: str, bitrate: int) -> Tuple[bytes, str, Optional[Dict]]:
+    """WAV -> (данные, формат, метаданные) с выравниванием громкости.
+
+    Если ffmpeg не справился, файл остаётся WAV — бандл не должен
+    теряться из-за одного файла.
+    """
+    gain_db = float((meta or {}).get("gain_db") or 0.0)
+    if fmt != "wav":
+        _, _, codec_args, default_bitrate = AUDIO_FORMATS[fmt]
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0"]
+        if abs(gain_db) >= 0.1:
+            command += ["-af", f"volume={gain_db:.2f}dB"]
+        command += codec_args + ["-b:a", f"{bitrate or default_bitrate}k", "pipe:1"]
+        result = subprocess.run(command, input=data, capture_output=True)
+        if result.returncode == 0 and result.stdout:
+            encoded_meta = _gained_meta(meta, gain_db) if abs(gain_db) >= 0.1 else meta
+            return result.stdout, fmt, encoded_meta
+        print(f"   ⚠️ ffmpeg ({fmt}) failed, keeping WAV: {result.stderr.decode(errors='replace').strip()[:200]}")
+
+    normalized = audio_meta.normalize(data)
+    if normalized is not data:
+        return normalized, "wav", _gained_meta(meta, gain_db)
+    return data, "wav", meta
+
+
+def _public_meta(meta: Optional[Dict]) -> Dict:
+    """Поля метаданных для клиента (без служебных version/bytes исходного WAV)"""
+    return {k: v for k, v in (meta or {}).items() if k not in {"version", "bytes"}}
+
+
+def _resolve_format(requested: str) -> str:
+    if requested == "auto":
+        return "opus" if shutil.which("ffmpeg") else "wav"
+    if requested != "wav" and not shutil.which("ffmpeg"):
+        raise SystemExit(f"--audio-format {requested} requires ffmpeg in PATH")
+    return requested
+
+
+def _slide_audio(registry: AudioPackRegistry, language: str, deck_name: str, slide_id: int) -> Optional[Tuple[bytes, Optional[Dict]]]:
+    """Готовая озвучка слайда (из архива колоды или файла) и её метаданные"""
+    filename = decks.audio_filename(slide_id)
+    if registry.asset_size(language, deck_name, filename) <= PRERENDERED_MIN_BYTES:
+        return None
+    found = registry.lookup(language, deck_name, filename)
+    data = bytes(found[0]) if found is not None else (decks.audio_dir(language, deck_name) / filename).read_bytes()
+    return data, registry.asset_meta(language, deck_name, filename)
+
+
+def _faq_audio(rel: Optional[str]) -> Optional[Tuple[bytes, Optional[Dict]]]:
+    if not rel:
+        return None
+    path = decks.AUDIO_DIR / rel
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    return data, audio_meta.read_sidecar(path) or audio_meta.analyze(data)
+
+
+def export_deck(
+    lang: str,
+    deck: Optional[str],
+    out_dir: Path,
+    audio_format: str = "auto",
+    bitrate: int = 0,
+    jobs: int = 0,
+) -> Path:
+    """Собрать бандл колоды в out_dir/<язык>_<колода>/; вернуть путь манифеста"""
+    language, deck_name = decks.resolve_deck(lang, deck)
+    fmt = _resolve_format(audio_format)
+    root = out_dir / f"{language}_{deck_name}"
+    writer = BundleWriter(root)
+    registry = AudioPackRegistry()
+    slides = decks.load_slides(language, deck_name)
+    title = next(
+        (info.get("title") for info in get_deck_store().list_decks(language) if info.get("deck") == deck_name),
+        None,
+    )
+
+    print("=" * 80)
+    print(f"Bundle export: lang={language}, deck={deck_name}, {len(slides)} slides, audio={fmt}")
+    print("=" * 80)
+
+    # Фактические форматы: часть файлов могла остаться WAV
+    used_formats = set()
+
+    def export_audio(stem: str, source: Optional[Tuple[bytes, Optional[Dict]]]) -> Optional[Dict]:
+        if source is None:
+            return None
+        data, meta = source
+        encoded, encoded_fmt, encoded_meta = _encode_audio(data, meta, fmt, bitrate)
+        used_formats.add(encoded_fmt)
+        ext, mime, _, _ = AUDIO_FORMATS[encoded_fmt]
+        rel = writer.put(stem, ext, encoded)
+        print(f"   🔊 {rel} ({len(data) / 1024:.0f} KB -> {len(encoded) / 1024:.0f} KB)")
+        return dict(_public_meta(encoded_meta), url=rel, mime=mime)
+
+    # Кодирование идёт во внешнем ffmpeg, поэтому потоков хватает
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 4) as pool:
+        slide_audio = []
+        for position, slide in enumerate(slides, 1):
+            slide_id = int(slide.get("id", position))
+            source = _slide_audio(registry, language, deck_name, slide_id)
+            slide_audio.append(pool.submit(export_audio, f"audio/slide_{slide_id:02d}", source))
+
+        faq_entries: List[Dict] = []
+        faq_audio = []
+        index_file = decks.faq_index_file(language, deck_name)
+        if index_file.exists():
+            with open(index_file, "r", encoding="utf-8") as f:
+                faq_entries = json.load(f).get("entries", [])
+            for entry in faq_entries:
+                stem = "audio/faq/" + Path(entry.get("audio") or "answer").stem
+                faq_audio.append(pool.submit(export_audio, stem, _faq_audio(entry.get("audio"))))
+
+        exported_slides = []
+        for slide, future in zip(slides, slide_audio):
+            exported = {k: v for k, v in slide.items() if k != "faq"}
+            exported["audio"] = future.result()
+            exported_slides.append(exported)
+
+        exported_faq = []
+        for entry, future in zip(faq_entries, faq_audio):
+            questions = [entry.get("question", "")] + list(entry.get("variants") or [])
+            exported_faq.append({
+                "slide_id": entry.get("slide_id"),
+                "question": entry.get("question"),
+                "variants": entry.get("variants") or [],
+                # Нормализованные формулировки — для точного совпадения на клиенте
+                "normalized": sorted({normalize_question(q) for q in questions if q}),
+                "answer": entry.get("answer"),
+                "audio": future.result(),
+            })
+
+    slides_rel = writer.put_json("slides", {
+        "language": language,
+        "deck": deck_name,
+        "title": title,
+        "total": len(exported_slides),
+        "slides": exported_slides,
+    })
+    faq_rel = writer.put_json("faq", {"language": language, "deck": deck_name, "entries": exported_faq}) if exported_faq else None
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "language": language,
+        "deck": deck_name,
+        "title": title,
+        "created_at": int(time.time()),
+        "total": len(exported_slides),
+        "audio_formats": sorted(used_formats),
+        "slides": slides_rel,
+        "faq": faq_rel,
+        "files": writer.files,
+    }
+    manifest_path = root / "manifest.json"
+    previous = _read_json(manifest_path)
+    _write_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+    removed = _prune(root, set(writer.files) | set((previous or {}).get("files", {})))
+
+    total_bytes = sum(info["bytes"] for info in writer.files.values())
+    print("\n" + "=" * 80)
+    print(f"Bundle: {root.absolute()} ({len(writer.files)} files, {total_bytes / 1024 / 1024:.1f} MB, {removed} stale removed)")
+    print("=" * 80)
+    return manifest_path
+
+
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _prune(root: Path, keep: set) -> int:
+    """Удалить файлы бандла, на которые не ссылаются манифесты из keep"""
+    removed = 0
+    for path in root.rglob("*"):
+        if not path.is_file() or path.name == "manifest.json":
+            continue
+        rel = path.relative_to(root).as_posix()
+        base = rel.rsplit(".", 1)[0] if rel.endswith((".gz", ".br")) else rel
+        if base not in keep and rel not in keep:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+def write_index(out_dir: Path) -> Path:
+    """Пересобрать out_dir/index.json по манифестам всех бандлов каталога"""
+    bundles = []
+    for manifest_path in sorted(out_dir.glob("*/manifest.json")):
+        manifest = _read_json(manifest_path)
+        if not manifest:
+            continue
+        language, deck_name = manifest["language"], manifest["deck"]
+        try:
+            default = decks.resolve_deck(language, None)[1] == deck_name
+        except KeyError:
+            default = False
+        bundles.append({
+            "language": language,
+            "deck": deck_name,
+            "title": manifest.get("title"),
+            "total": manifest.get("total"),
+            "default": default,
+            "manifest": manifest_path.relative_to(out_dir).as_posix(),
+        })
+    index_path = out_dir / "index.json"
+    _write_atomic(index_path, json.dumps({"format": BUNDLE_FORMAT, "bundles": bundles}, ensure_ascii=False, indent=2).encode("utf-8"))
+    return index_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export decks as static bundles (slides, audio, FAQ)")
+    parser.add_argument("--lang", default="ru", help="Language to export (ky, ru, ...)")
+    parser.add_argument("--deck", default=None, help="Deck name (e.g. rights, mvd; optional)")
+    parser.add_argument("--all", action="store_true", help="Export every deck of every language")
+    parser.add_argument("--out", default=str(DEFAULT_OUT), help="Output directory (bundles root)")
+    parser.add_argument("--audio-format", default="auto", choices=["auto", *AUDIO_FORMATS], help="Audio format in the bundle")
+    parser.add_argument("--bitrate", type=int, default=0, help="Audio bitrate, kbit/s (default: 32 for opus, 64 for mp3)")
+    parser.add_argument("--jobs", type=int, default=0, help="Parallel audio encoders (default: CPU count)")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    if args.all:
+        targets = [(info["language"], info["deck"]) for info in get_deck_store().list_decks(None)]
+    else:
+        targets = [(args.lang, args.deck)]
+    for target_lang, target_deck in targets:
+        export_deck(target_lang, target_deck, out, audio_format=args.audio_format, bitrate=args.bitrate, jobs=args.jobs)
+    print(f"Index: {write_index(out).absolute()}")
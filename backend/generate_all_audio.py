@@ -10,16 +10,38 @@
 
 Для русской презентации про МВД:
     backend/data/audio/ru/mvd/slide_01.wav
+
+Рядом с каждым файлом пишутся метаданные (длительность, громкость,
+пики для waveform — см. services/audio_meta.py):
+    backend/data/audio/ru/slide_01.wav.json
+Для уже готовых файлов без метаданных они досчитываются при запуске.
+Синтезированная озвучка сразу приводится к единой громкости; файлы,
+сгенерированные раньше, выравниваются флагом --normalize.
+
+С флагом --pack после генерации собирается архив колоды, который сервер
+отдаёт через mmap (см. services/audio_pack.py):
+    backend/data/audio/packs/ru_rights_onyx_wav.pack
+
+С флагом --faq дополнительно готовит ответы на частые вопросы из поля
+`faq` слайдов (ответ + озвучка) и индекс для /api/qa:
+    backend/data/faq/ru_rights.json
+    backend/data/audio/faq/ru/rights/slide_01_q01.wav
 """
 import asyncio
 import argparse
 import json
 import os
 import sys
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from services.huggingface_tts import HuggingFaceTTS
+from services.openai_qa import OpenAIQA
+from services import decks
+from services import audio_meta
+from services.audio_pack import build_deck_pack
+from services.faq import iter_slide_faq
 
 load_dotenv()
 
@@ -33,22 +55,17 @@ _stderr_reconfigure = getattr(sys.stderr, "reconfigure", None)
 if callable(_stderr_reconfigure):
     _stderr_reconfigure(encoding="utf-8", errors="replace")
 
-def _resolve_paths(lang: str, deck: Optional[str] = None) -> tuple[Path, Path, str]:
-    language = (lang or "ky").strip().lower()
-    if language == "ru":
-        normalized_deck = (deck or "rights").strip().lower()
-        if normalized_deck == "mvd":
-            slides_file = Path("data") / "slides_ru_mvd.json"
-            audio_dir = Path("data") / "audio" / "ru" / "mvd"
-            return slides_file, audio_dir, "ru"
+def _write_atomic(path: Path, data: bytes):
+    """Запись через временный файл: сервер не отдаст недописанный WAV"""
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
 
-        slides_file = Path("data") / "slides_ru.json"
-        audio_dir = Path("data") / "audio" / "ru"
-        return slides_file, audio_dir, "ru"
 
-    slides_file = Path("data") / "slides.json"
-    audio_dir = Path("data") / "audio"
-    return slides_file, audio_dir, "ky"
+def _resolve_paths(lang: str, deck: Optional[str] = None) -> tuple[Path, Path, str]:
+    language, deck_name = decks.resolve_deck(lang, deck)
+    return decks.slides_file(language, deck_name), decks.audio_dir(language, deck_name), language
 
 
 async def generate_all_slides(
@@ -57,19 +74,19 @@ async def generate_all_slides(
     force: bool = False,
     voice: Optional[str] = None,
     require_openai: bool = False,
+    pack: bool = False,
+    normalize: bool = False,
 ):
     """Генерирует аудио для всех слайдов выбранного языка"""
 
     if voice:
         os.environ["TTS_VOICE"] = voice
     
-    slides_file, audio_dir, language = _resolve_paths(lang, deck)
+    _, audio_dir, language = _resolve_paths(lang, deck)
+    deck_name = decks.resolve_deck(lang, deck)[1]
 
     # Загрузить слайды
-    with open(slides_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    slides = data['slides']
+    slides = decks.load_slides(language, deck_name)
     
     # Создать папку для аудио
     audio_dir.mkdir(parents=True, exist_ok=True)
@@ -90,7 +107,7 @@ async def generate_all_slides(
         )
     
     for i, slide in enumerate(slides, 1):
-        speak_text = slide.get('tts') or slide.get('content') or ''
+        speak_text = decks.speak_text(slide)
 
         slide_id = int(slide.get('id', i))
         filename = f"slide_{slide_id:02d}.wav"
@@ -104,6 +121,15 @@ async def generate_all_slides(
                     if filepath.stat().st_size > 120 * 1024:
                         print(f"\n[{i}/{len(slides)}] {slide['title']}")
                         print(f"   ✅ Уже есть: {filename} (skip)")
+                        if normalize:
+                            data = filepath.read_bytes()
+                            normalized = audio_meta.normalize(data)
+                            if normalized is not data:
+                                _write_atomic(filepath, normalized)
+                                print(f"   🔊 Громкость выровнена: {filename}")
+                            audio_meta.write_sidecar(filepath, normalized)
+                        elif audio_meta.read_sidecar(filepath) is None:
+                            audio_meta.write_sidecar(filepath)
                         continue
                 except OSError:
                     pass
@@ -113,35 +139,166 @@ async def generate_all_slides(
         
         # Синтезировать
         try:
-            audio_data = await tts.synthesize(speak_text, language=language)
+            audio_data, cacheable = await tts.synthesize_cacheable(speak_text, language=language)
+            if not cacheable:
+                # Заглушку (тишину) вместо озвучки не сохраняем
+                print("   ❌ Ошибка: TTS providers are unavailable (placeholder audio, not saved)")
+                continue
             
-            with open(filepath, 'wb') as f:
-                f.write(audio_data)
+            _write_atomic(filepath, audio_data)
+            meta = audio_meta.write_sidecar(filepath, audio_data) or {}
             
             size_kb = len(audio_data) / 1024
-            print(f"   ✅ Сохранено: {filename} ({size_kb:.1f} KB)")
+            print(f"   ✅ Сохранено: {filename} ({size_kb:.1f} KB, {meta.get('duration', 0):.1f} s)")
             
         except Exception as e:
             print(f"   ❌ Ошибка: {e}")
             continue
     
+    if pack:
+        pack_file, entries = build_deck_pack(language, deck_name)
+        print(f"\n📦 Архив колоды: {pack_file} ({len(entries)} файлов)")
+
     print("\n" + "=" * 80)
     print("Generation finished")
     print(f"Files saved to: {audio_dir.absolute()}")
     print("=" * 80)
 
+async def generate_faq(
+    lang: str = "ky",
+    deck: Optional[str] = None,
+    force: bool = False,
+    voice: Optional[str] = None,
+    require_openai: bool = False,
+    concurrency: int = 4,
+):
+    """Готовит ответы и озвучку для FAQ всех слайдов и сохраняет индекс"""
+
+    if voice:
+        os.environ["TTS_VOICE"] = voice
+
+    language, deck_name = decks.resolve_deck(lang, deck)
+    slides = decks.load_slides(language, deck_name)
+    index_file = decks.faq_index_file(language, deck_name)
+    faq_audio_dir = decks.faq_audio_dir(language, deck_name)
+    faq_audio_dir.mkdir(parents=True, exist_ok=True)
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # Уже готовые записи переиспользуем, если вопрос и ответ не менялись
+    previous: Dict[tuple, Dict] = {}
+    if index_file.exists() and not force:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            for entry in json.load(f).get("entries", []):
+                previous[(entry.get("slide_id"), entry.get("question"))] = entry
+
+    qa = OpenAIQA()
+    tts = HuggingFaceTTS()
+
+    if require_openai and not (getattr(tts, "client", None) and qa.available):
+        raise SystemExit(
+            "OpenAI TTS or QA client is not available. "
+            "Check OPENAI_API_KEY and that the 'openai' package is installed."
+        )
+
+    jobs = []
+    for i, slide in enumerate(slides, 1):
+        slide_id = int(slide.get('id', i))
+        for n, item in enumerate(iter_slide_faq(slide), 1):
+            jobs.append((slide_id, n, slide, item))
+
+    print("=" * 80)
+    print(f"FAQ generation: {len(jobs)} questions (lang={language}, deck={deck_name})")
+    print("=" * 80)
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def build_entry(slide_id: int, n: int, slide: Dict, item: Dict) -> Optional[Dict]:
+        question = item["question"]
+        filename = f"slide_{slide_id:02d}_q{n:02d}.wav"
+        filepath = faq_audio_dir / filename
+        rel_audio = filepath.relative_to(decks.AUDIO_DIR).as_posix()
+
+        old = previous.get((slide_id, question))
+        if old and filepath.exists() and (not item.get("answer") or item["answer"] == old.get("answer")):
+            print(f"   ✅ Уже есть: slide {slide_id}, {question[:60]} (skip)")
+            return {**old, "variants": item["variants"], "audio": rel_audio}
+
+        async with semaphore:
+            try:
+                answer, cacheable = item.get("answer"), True
+                if not answer:
+                    answer, cacheable = await qa.answer(
+                        question=question,
+                        context=decks.speak_text(slide),
+                        slide_id=slide_id,
+                        language=language,
+                    )
+                # Заглушку или текст ошибки в индекс не пишем: иначе он
+                # попадёт в ответы и переиспользуется следующими запусками
+                if not cacheable:
+                    print(f"   ⚠️ Нет ответа (slide {slide_id}, {question[:60]}): {answer[:80]}")
+                    return None
+                audio_data, cacheable = await tts.synthesize_cacheable(answer, language=language)
+                if not cacheable:
+                    print(f"   ⚠️ TTS вернул заглушку (slide {slide_id}, {question[:60]}), пропуск")
+                    return None
+            except Exception as e:
+                print(f"   ❌ Ошибка (slide {slide_id}, {question[:60]}): {e}")
+                return None
+
+        _write_atomic(filepath, audio_data)
+        audio_meta.write_sidecar(filepath, audio_data)
+        print(f"   ✅ slide {slide_id}: {question[:60]} -> {filename} ({len(audio_data) / 1024:.1f} KB)")
+
+        return {
+            "slide_id": slide_id,
+            "question": question,
+            "variants": item["variants"],
+            "answer": answer,
+            "audio": rel_audio,
+        }
+
+    results = await asyncio.gather(*(build_entry(*job) for job in jobs))
+    entries: List[Dict] = [entry for entry in results if entry]
+
+    # Атомарная запись индекса, чтобы сервер не прочитал его наполовину
+    tmp_file = index_file.with_suffix(".json.tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                "language": language,
+                "deck": deck_name,
+                "voice": os.getenv('TTS_VOICE', 'onyx'),
+                "generated_at": int(time.time()),
+                "entries": entries,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    os.replace(tmp_file, index_file)
+
+    print("\n" + "=" * 80)
+    print(f"FAQ index: {index_file.absolute()} ({len(entries)}/{len(jobs)} entries)")
+    print("=" * 80)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate slide audio")
-    parser.add_argument("--lang", default="ky", choices=["ky", "ru"], help="Language to generate")
-    parser.add_argument("--deck", default=None, choices=["rights", "mvd"], help="Deck for ru (optional)")
+    # Колоды берутся из хранилища (встроенные + data/decks/<lang>/<deck>.json)
+    parser.add_argument("--lang", default="ky", help="Language to generate (ky, ru, ...)")
+    parser.add_argument("--deck", default=None, help="Deck name (e.g. rights, mvd; optional)")
     parser.add_argument("--both", action="store_true", help="Generate for both ky and ru")
     parser.add_argument("--force", action="store_true", help="Overwrite existing files")
     parser.add_argument("--voice", default=None, help="OpenAI voice (e.g. alloy)")
-    parser.add_argument("--require-openai", action="store_true", help="Fail if OpenAI TTS is not available")
+    parser.add_argument("--require-openai", action="store_true", help="Fail if OpenAI TTS (and QA for --faq) is not available")
+    parser.add_argument("--pack", action="store_true", help="Build the deck audio pack after generation")
+    parser.add_argument("--normalize", action="store_true", help="Loudness-normalize already generated files in place")
+    parser.add_argument("--faq", action="store_true", help="Also generate FAQ answers, audio and index")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel FAQ requests")
     args = parser.parse_args()
 
-    if args.both:
-        asyncio.run(generate_all_slides("ky", force=args.force, voice=args.voice, require_openai=args.require_openai))
-        asyncio.run(generate_all_slides("ru", args.deck, force=args.force, voice=args.voice, require_openai=args.require_openai))
-    else:
-        asyncio.run(generate_all_slides(args.lang, args.deck, force=args.force, voice=args.voice, require_openai=args.require_openai))
+    targets = [("ky", None), ("ru", args.deck)] if args.both else [(args.lang, args.deck)]
+    for target_lang, target_deck in targets:
+        asyncio.run(generate_all_slides(target_lang, target_deck, force=args.force, voice=args.voice, require_openai=args.require_openai, pack=args.pack, normalize=args.normalize))
+        if args.faq:
+            asyncio.run(generate_faq(target_lang, target_deck, force=args.force, voice=args.voice, require_openai=args.require_openai, concurrency=args.concurrency))
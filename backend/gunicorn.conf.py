@@ -0,0 +1,40 @@
+"""Конфигурация gunicorn для многопроцессного запуска (Procfile / railway.json).
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Число воркеров = WEB_CONCURRENCY или числу ядер. Воркеры делят общий кеш
+на SQLite (services/shared_cache.py) и single-flight блокировки
+(services/singleflight.py), поэтому прогретые результаты видны всем
+процессам и провайдер не вызывается повторно. Redis не обязателен.
+
+Остальное состояние у каждого воркера своё: лимиты допуска
+(services/admission.py) делятся на число воркеров, чтобы в сумме
+соответствовать настройкам, а метрики воркеров сводит /metrics по их
+снимкам в общем каталоге (services/metrics.py).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or multiprocessing.cpu_count()
+# Воркеры узнают своё число отсюда (окружение наследуется при fork)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Синтез длинного текста может занимать десятки секунд
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Каждый воркер поднимает свой event loop и сервисы в lifespan
+preload_app = False
+
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG", "").strip().lower() in {"1", "true", "yes"} else None
+errorlog = "-"
+
+
+def on_starting(server):
+    # Снимки метрик прошлого запуска не должны попасть в сумму
+    from services.metrics import registry
+
+    registry.clear_snapshots()
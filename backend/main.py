@@ -1,9 +1,13 @@
+import asyncio
+import functools
 import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import uvicorn
 from dotenv import load_dotenv
 
@@ -14,18 +18,37 @@ load_dotenv(dotenv_path=BASE_DIR / ".env")
 
 # Импорт роутеров после загрузки .env,
 # чтобы сервисы (TTS/QA/STT) корректно увидели ключи окружения.
-from routers import slides, tts, stt, qa
+from routers import slides, tts, stt, qa, jobs, sessions, audio, profiles
+from services import container, metrics
+from services.admission import AdmissionRejected
+from services.profiling import ProfilingMiddleware, profiler
+from services.tracing import TracingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Redis и SDK проверяются в фоне: приложение принимает запросы сразу,
+    # а готовность зависимостей видна на /ready. После проверки стартуют
+    # воркеры фоновых задач.
+    probe_task = asyncio.create_task(container.start_background())
+    profiler.start()
+    # Снимки метрик для /metrics, сводящего все воркеры (services/metrics.py)
+    metrics.registry.start_snapshots()
+    yield
+    probe_task.cancel()
+    await asyncio.gather(probe_task, return_exceptions=True)
+    await container.shutdown()
+    await asyncio.to_thread(profiler.stop)
+    await asyncio.to_thread(metrics.registry.stop_snapshots)
+
 
 app = FastAPI(
     title="Кыргызская Презентация API",
     description="API для интерактивной презентации на кыргызском языке",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
-# Раздача готовых аудио-файлов слайдов
-# backend/data/audio/slide_01.wav -> GET /audio/slide_01.wav
-app.mount("/audio", StaticFiles(directory=str(BASE_DIR / "data" / "audio")), name="audio")
-
 # CORS настройки
 # В проде на Railway удобнее задавать явно:
 # - CORS_ALLOW_ORIGINS="https://<frontend-domain>" (через запятую для нескольких)
@@ -51,14 +74,107 @@ app.add_middleware(
     allow_origin_regex=cors_allow_origin_regex,
     allow_credentials=allow_credentials,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Метаданные озвучки в ответе /api/tts должны быть видны из JS
+    expose_headers=["X-Cache", "X-TTS-Fallback", "X-Audio-Duration", "X-Audio-Loudness", "X-Audio-Gain", "X-Audio-Peaks"],
 )
 
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _path_group(path: str) -> str:
+    parts = [p for p in path.split("/") if p and not p.startswith("{")]
+    return "/" + "/".join(parts[:2])
+
+
+@functools.lru_cache(maxsize=1)
+def _known_groups() -> frozenset:
+    # Роуты и mount-ы регистрируются при импорте — к первому запросу список полон
+    return frozenset(_path_group(route.path) for route in app.routes if getattr(route, "path", None))
+
+
+def _route_group(path: str) -> str:
+    """Метка маршрута для in-flight: первые два сегмента (/api/slides/3 -> /api/slides).
+
+    Только группы существующих маршрутов: иначе каждый случайный URL
+    (сканеры, 404) создавал бы новую серию метрик.
+    """
+    parts = [p for p in path.split("/") if p][:2]
+    known = _known_groups()
+    # /audio/{path:path} -> группа /audio: берётся самая длинная известная
+    for depth in range(len(parts), 0, -1):
+        group = "/" + "/".join(parts[:depth])
+        if group in known:
+            return group
+    return "/" if not parts and "/" in known else UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Латентность и in-flight по маршрутам.
+
+    Чистый ASGI (не BaseHTTPMiddleware): тело ответа проходит как есть,
+    без перекладывания в bytes — /audio отдаёт срезы mmap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = _route_group(scope["path"])
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(route=group)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(route=group)
+            # Шаблон маршрута (/api/slides/{slide_id}) известен только после роутинга
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route_path,
+                status=str(status),
+            )
+
+
+app.add_middleware(MetricsMiddleware)
+# Внутри трассировки: id профиля попадает в атрибуты корневого span-а
+app.add_middleware(ProfilingMiddleware)
+# Добавлен последним — внешний: в трассу попадает и время метрик/CORS
+app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # Перегрузка провайдера — клиенту лучше повторить позже, а не получить 500
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many requests ({exc.reason}), retry later", "retry_after": int(exc.retry_after_header)},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
 # Подключение роутеров
 app.include_router(slides.router, prefix="/api", tags=["slides"])
 app.include_router(tts.router, prefix="/api", tags=["tts"])
 app.include_router(stt.router, prefix="/api", tags=["stt"])
 app.include_router(qa.router, prefix="/api", tags=["qa"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
+app.include_router(sessions.router, prefix="/api", tags=["sessions"])
+app.include_router(profiles.router, prefix="/api", tags=["profiles"])
+# Готовая озвучка слайдов: backend/data/audio/ru/slide_01.wav -> GET /audio/ru/slide_01.wav
+app.include_router(audio.router, tags=["audio"])
 
 @app.get("/")
 async def root():
@@ -72,5 +188,21 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность: фоновые проверки зависимостей завершены"""
+    status_code = 200 if container.readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=container.readiness)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Кеш в памяти этого воркера по классам записей: объём, доля, попадания, допуск"""
+    return {"pid": os.getpid(), "classes": container.get_cache_service().memory.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # При нескольких воркерах render читает снимки с диска — не в цикле событий
+    return Response(content=await asyncio.to_thread(metrics.registry.render), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
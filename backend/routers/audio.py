@@ -0,0 +1,150 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from services import decks
+from services.audio_pack import AudioPackRegistry
+from services.container import get_audio_pack_registry
+from services.deck_store import get_deck_store
+from typing import Callable, Dict, Optional, Tuple
+import hashlib
+import mimetypes
+import mmap
+import os
+
+router = APIRouter()
+
+CHUNK_SIZE = 256 * 1024
+
+
+class MappedResponse(Response):
+    """Ответ из отображённой в память области: тело отдаётся срезами
+    memoryview без копирования в bytes"""
+
+    def __init__(
+        self,
+        view: memoryview,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: Optional[str] = None,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        self.view = view
+        self.on_close = on_close
+        headers = dict(headers or {})
+        headers["content-length"] = str(len(view))
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") != "HEAD":
+                for start in range(0, len(self.view), CHUNK_SIZE):
+                    await send({
+                        "type": "http.response.body",
+                        "body": self.view[start:start + CHUNK_SIZE],
+                        "more_body": True,
+                    })
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.view.release()
+            if self.on_close is not None:
+                self.on_close()
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Range: bytes=a-b -> (start, end включительно); None — отдать целиком.
+
+    Несколько диапазонов не поддерживаются — тогда файл отдаётся целиком.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # bytes=-N — последние N байт
+            length = int(end_text)
+            if length <= 0:
+                raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _serve(request: Request, view: memoryview, etag: str, media_type: str, on_close: Optional[Callable[[], None]] = None) -> Response:
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "public, max-age=3600",
+    }
+    if request.headers.get("if-none-match") == etag:
+        if on_close is not None:
+            on_close()
+        return Response(status_code=304, headers=headers)
+
+    size = len(view)
+    try:
+        byte_range = _parse_range(request.headers.get("range"), size)
+    except HTTPException:
+        if on_close is not None:
+            on_close()
+        raise
+    if byte_range is None:
+        return MappedResponse(view, headers=headers, media_type=media_type, on_close=on_close)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return MappedResponse(view[start:end + 1], status_code=206, headers=headers, media_type=media_type, on_close=on_close)
+
+
+def _resolve_loose_file(path: str) -> str:
+    full = os.path.realpath(os.path.join(decks.AUDIO_DIR, path))
+    root = os.path.realpath(decks.AUDIO_DIR)
+    if not full.startswith(root + os.sep) or not os.path.isfile(full):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return full
+
+
+def _serve_loose_file(request: Request, full: str, media_type: str) -> Response:
+    # Замена файла через os.replace не затрагивает уже открытое отображение
+    with open(full, "rb") as f:
+        stat = os.fstat(f.fileno())
+        etag = '"' + hashlib.md5(f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest() + '"'
+        if stat.st_size == 0:
+            return _serve(request, memoryview(b""), etag, media_type)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapping)
+
+    def close():
+        try:
+            view.release()
+            mapping.close()
+        except BufferError:
+            # Срез ещё удерживается транспортом — отображение освободит GC
+            pass
+
+    return _serve(request, view, etag, media_type, on_close=close)
+
+
+@router.api_route("/audio/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_audio_file(
+    path: str,
+    request: Request,
+    audio_packs: AudioPackRegistry = Depends(get_audio_pack_registry),
+):
+    """
+    Готовая озвучка: сначала из архива колоды (mmap), иначе — отдельный файл.
+    backend/data/audio/ru/slide_01.wav -> GET /audio/ru/slide_01.wav
+    """
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    subdir, _, filename = path.rpartition("/")
+    deck = get_deck_store().find_by_audio_subdir(subdir)
+    if deck is not None:
+        found = audio_packs.lookup(*deck, filename)
+        if found is not None:
+            view, entry = found
+            return _serve(request, view, f'"{entry["sha256"][:32]}"', media_type)
+
+    return _serve_loose_file(request, _resolve_loose_file(path), media_type)
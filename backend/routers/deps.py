@@ -0,0 +1,61 @@
+"""Общие зависимости роутеров"""
+import os
+import secrets
+from typing import NamedTuple
+
+from fastapi import Request
+
+from services.admission import PRIORITY_HIGH, PRIORITY_NORMAL
+from services.container import get_session_hub
+
+# Сколько доверенных прокси стоит перед приложением (балансировщик
+# платформы и т.п.). 0 — адрес клиента берётся из соединения, иначе —
+# из X-Forwarded-For на столько позиций справа: левые записи клиент
+# может подделать, правые дописаны нашими прокси.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+class ClientContext(NamedTuple):
+    client_id: str
+    priority: int
+
+
+def client_ip(request: Request) -> str:
+    peer = request.client.host if request.client else "unknown"
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    if len(forwarded) < TRUSTED_PROXY_HOPS:
+        return forwarded[0] if forwarded else peer
+    return forwarded[-TRUSTED_PROXY_HOPS]
+
+
+def _is_presenter(request: Request) -> bool:
+    token = request.headers.get("x-presenter-token", "")
+    if not token:
+        return False
+    # Общий токен ведущего из настроек (для показа без сессии)
+    expected = os.getenv("ADMISSION_PRESENTER_TOKEN", "")
+    if expected and secrets.compare_digest(token, expected):
+        return True
+    # presenter_token сессии синхронного показа (POST /api/sessions)
+    session_id = request.headers.get("x-session-id", "").strip()
+    return bool(session_id) and get_session_hub().is_presenter(session_id, token)
+
+
+def client_context(request: Request) -> ClientContext:
+    """Кто делает запрос: ключ для лимитов и приоритет в очереди.
+
+    Лимит считается по IP. Весь класс часто выходит в сеть через один NAT,
+    поэтому X-Client-Id (случайный id браузера) делит лимит IP между
+    клиентами: ключ — "<ip>/<id>", а общий потолок IP ограничивает
+    и клиента, меняющего id (services/admission.py).
+
+    Приоритет ведущего — только с действительным токеном: X-Presenter-Token
+    равен ADMISSION_PRESENTER_TOKEN или presenter_token сессии X-Session-Id.
+    """
+    ip = client_ip(request)
+    client_id = request.headers.get("x-client-id", "").strip()[:64].replace("/", "")
+    key = f"{ip}/{client_id}" if client_id else ip
+    priority = PRIORITY_HIGH if _is_presenter(request) else PRIORITY_NORMAL
+    return ClientContext(client_id=key, priority=priority)
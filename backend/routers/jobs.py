@@ -0,0 +1,179 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from services.admission import AdmissionService
+from services.jobs import JOB_AUDIO_DIR, SUCCEEDED, TERMINAL_STATUSES, JobConflict, JobManager
+from services.container import get_admission_service, get_job_manager
+from services.tts_text import canonicalize, split_for_tts
+from routers.deps import ClientContext, client_context
+from typing import Optional
+import asyncio
+import json
+import os
+import secrets
+import time
+
+router = APIRouter()
+
+# Поллинг SSE: задача может выполняться в другом воркере, поэтому
+# прогресс читается из общего хранилища задач
+SSE_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE_SECONDS = 15
+
+
+class TTSJobParams(BaseModel):
+    text: str = Field(min_length=1, max_length=int(os.getenv("JOB_TTS_MAX_CHARS", "20000")))
+    language: str = "ky"
+
+
+class DeckAudioJobParams(BaseModel):
+    lang: str = "ky"
+    deck: Optional[str] = None
+    force: bool = False
+
+
+class JobRequest(BaseModel):
+    kind: str
+    params: dict = {}
+
+
+_PARAMS_MODELS = {
+    "tts": TTSJobParams,
+    "deck_audio": DeckAudioJobParams,
+}
+
+
+def _check_admin(admin_token: Optional[str]):
+    # Перегенерация колоды перезаписывает файлы озвучки, список раскрывает
+    # чужие задачи — без настроенного токена эти операции недоступны
+    expected = os.getenv("JOBS_ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Job administration is disabled")
+    if not secrets.compare_digest(admin_token or "", expected):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def _get_job_or_404(job_manager: JobManager, job_id: str) -> dict:
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs")
+async def submit_job(
+    request: JobRequest,
+    idempotency_key: Optional[str] = Header(default=None),
+    x_admin_token: Optional[str] = Header(default=None),
+    job_manager: JobManager = Depends(get_job_manager),
+    admission: AdmissionService = Depends(get_admission_service),
+    client: ClientContext = Depends(client_context),
+):
+    """
+    Поставить задачу в очередь: kind = "tts" (params: text, language)
+    или "deck_audio" (params: lang, deck, force). Возвращает id сразу.
+
+    Задача "tts" списывает с лимита клиента столько запросов, сколько
+    частей синтеза в тексте (как если бы их озвучивали через /api/tts).
+    """
+    params_model = _PARAMS_MODELS.get(request.kind)
+    if params_model is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {request.kind}")
+    if request.kind == "deck_audio":
+        _check_admin(x_admin_token)
+    try:
+        params = params_model(**request.params).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+    if request.kind == "tts":
+        # Превышение лимита — AdmissionRejected, обработчик в main.py отдаёт 429
+        chunks = split_for_tts(canonicalize(params["text"], params["language"]))
+        admission.check_rate_limit("tts", client.client_id, client.priority, cost=max(1, len(chunks)))
+
+    try:
+        job, created = job_manager.submit(request.kind, params, idempotency_key)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=202 if created else 200, content=job)
+
+
+@router.get("/jobs")
+async def list_jobs(
+    limit: int = 50,
+    x_admin_token: Optional[str] = Header(default=None),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    """Последние задачи (только для админа)"""
+    _check_admin(x_admin_token)
+    return {"jobs": job_manager.store.list(limit=max(1, min(limit, 500)))}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """Статус и прогресс задачи"""
+    return _get_job_or_404(job_manager, job_id)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    x_admin_token: Optional[str] = Header(default=None),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    """
+    Отменить задачу (в очереди — сразу, выполняющуюся — на ближайшем шаге).
+    Задачу "tts" может отменить знающий её id, "deck_audio" — только админ.
+    """
+    job = _get_job_or_404(job_manager, job_id)
+    if job["kind"] == "deck_audio":
+        _check_admin(x_admin_token)
+    cancelled = job_manager.store.cancel(job_id)
+    return {"id": job_id, "cancelled": cancelled}
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, job_manager: JobManager = Depends(get_job_manager)):
+    """Прогресс задачи как Server-Sent Events (event: progress / done)"""
+    _get_job_or_404(job_manager, job_id)
+
+    async def stream():
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            if await request.is_disconnected():
+                return
+            job = job_manager.store.get(job_id)
+            if job is None:
+                return
+            state = (job["status"], job["progress"], job["total"])
+            if state != last:
+                last = state
+                last_sent = time.monotonic()
+                event = "done" if job["status"] in TERMINAL_STATUSES else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+                if event == "done":
+                    return
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    """Результат задачи: аудио для "tts", отчёт для "deck_audio" """
+    job = _get_job_or_404(job_manager, job_id)
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if job["kind"] == "tts":
+        path = JOB_AUDIO_DIR / f"{job_id}.wav"
+        if not path.exists():
+            raise HTTPException(status_code=410, detail="Job result has expired")
+        return FileResponse(str(path), media_type="audio/wav", filename="speech.wav")
+    return job["result"]
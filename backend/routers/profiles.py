@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from services.profiling import profiler, to_collapsed
+from typing import Optional
+import asyncio
+import json
+
+router = APIRouter()
+
+
+def _check_admin(admin_token: Optional[str]):
+    # Стеки раскрывают код и данные запросов — без настроенного токена выдачи нет
+    if not profiler.admin_token:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiler.is_authorized(admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/profiles")
+async def list_profiles(limit: int = 50, x_admin_token: Optional[str] = Header(default=None)):
+    """Последние профили (по запросу и фоновые) с метаданными"""
+    _check_admin(x_admin_token)
+    profiles = await asyncio.to_thread(profiler.list, max(1, min(limit, 500)))
+    return {"profiles": profiles}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "speedscope", x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Профиль: format=speedscope (JSON, открывается в speedscope.app)
+    или collapsed (свёрнутые стеки для flamegraph.pl / inferno)
+    """
+    _check_admin(x_admin_token)
+    path = profiler.path_for(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "speedscope":
+        return FileResponse(str(path), media_type="application/json", filename=f"{profile_id}.speedscope.json")
+    if format == "collapsed":
+        document = json.loads(await asyncio.to_thread(path.read_text, encoding="utf-8"))
+        return PlainTextResponse(to_collapsed(document))
+    raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
@@ -1,50 +1,281 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from services.admission import AdmissionRejected, AdmissionService
 from services.openai_qa import OpenAIQA
-from services.huggingface_tts import HuggingFaceTTS
-from fastapi.responses import JSONResponse
+from services.cache import CacheService
+from services.cache_policy import ANSWER
+from services.speech import SpeechService
+from services.singleflight import SingleFlight
+from services.decks import resolve_deck
+from services.faq import FAQService, group_similar_questions
+from services.metrics import FAQ_LOOKUPS
+from services import tracing
+from services.container import (
+    get_admission_service,
+    get_cache_service,
+    get_faq_service,
+    get_qa_service,
+    get_single_flight,
+    get_speech_service,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from routers.deps import ClientContext, client_context
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import base64
+import json
+import os
 
 router = APIRouter()
-qa_service = OpenAIQA()
-tts_service = HuggingFaceTTS()
+
+# Пакетный режим (/qa/batch)
+QA_BATCH_MAX = int(os.getenv("QA_BATCH_MAX", "50"))
+# Сколько вопросов задаётся LLM одним вызовом (1 — каждый отдельно)
+QA_BATCH_GROUP = max(1, int(os.getenv("QA_BATCH_GROUP", "5")))
+# Одновременных вызовов LLM/TTS от одного пакета (поверх очереди допуска)
+QA_BATCH_CONCURRENCY = max(1, int(os.getenv("QA_BATCH_CONCURRENCY", "8")))
+QA_BATCH_DEDUP_THRESHOLD = float(os.getenv("QA_BATCH_DEDUP_THRESHOLD", "0.9"))
 
 class QARequest(BaseModel):
     question: str
     slide_context: str = ""
     slide_id: int = 0
     language: str = "ru"
+    deck: Optional[str] = None
+
+
+class QABatchRequest(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=QA_BATCH_MAX)
+    slide_context: str = ""
+    slide_id: int = 0
+    language: str = "ru"
+    deck: Optional[str] = None
+
+
+def _faq_lookup(faq_service: FAQService, question: str, language: str, deck: str, slide_id: int) -> Optional[Tuple[dict, bytes]]:
+    """Заранее подготовленный ответ FAQ и его озвучка (без LLM и TTS)"""
+    with tracing.span("qa.faq_lookup") as span:
+        faq_entry = faq_service.match(question, language, deck, slide_id)
+        faq_audio = faq_service.load_audio(faq_entry) if faq_entry else None
+        span.set_attribute("hit", bool(faq_audio))
+    FAQ_LOOKUPS.inc(result="hit" if faq_audio else "miss")
+    return (faq_entry, faq_audio) if faq_entry and faq_audio else None
+
+
+def _encode_audio(audio_data: bytes) -> str:
+    # Конвертация аудио в base64 для передачи в JSON
+    with tracing.span("qa.encode_base64", bytes=len(audio_data)):
+        return base64.b64encode(audio_data).decode('utf-8')
+
 
 @router.post("/qa")
-async def question_answer(request: QARequest):
+async def question_answer(
+    request: QARequest,
+    qa_service: OpenAIQA = Depends(get_qa_service),
+    speech: SpeechService = Depends(get_speech_service),
+    faq_service: FAQService = Depends(get_faq_service),
+    cache_service: CacheService = Depends(get_cache_service),
+    single_flight: SingleFlight = Depends(get_single_flight),
+    admission: AdmissionService = Depends(get_admission_service),
+    client: ClientContext = Depends(client_context),
+):
     """
     Обработать вопрос пользователя и вернуть ответ с озвучкой
     """
     try:
-        # Получение ответа от GPT-4
-        answer_text = await qa_service.get_answer(
-            question=request.question,
-            context=request.slide_context,
-            slide_id=request.slide_id,
-            language=request.language,
-        )
-        
-        # Озвучка ответа
-        audio_data = await tts_service.synthesize(answer_text, request.language)
-        
-        # Конвертация аудио в base64 для передачи в JSON
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        # Сначала — заранее подготовленные ответы FAQ (без LLM и TTS)
+        language, deck_name = resolve_deck(request.language, request.deck)
+        faq = _faq_lookup(faq_service, request.question, language, deck_name, request.slide_id)
+        if faq:
+            faq_entry, faq_audio = faq
+            return {
+                "question": request.question,
+                "answer": faq_entry["answer"],
+                "audio": _encode_audio(faq_audio),
+                "audio_format": "wav",
+                "source": "faq",
+            }
+
+        # Получение ответа от GPT-4 (общий кеш ответов, один вызов LLM на вопрос)
+        async def ask_llm() -> dict:
+            with tracing.span("qa.answer", language=request.language, slide_id=request.slide_id):
+                answer, cacheable = await qa_service.answer(
+                    question=request.question,
+                    context=request.slide_context,
+                    slide_id=request.slide_id,
+                    language=request.language,
+                )
+            if cacheable:
+                await asyncio.to_thread(cache_service.set_qa_cache, request.question, request.slide_id,
+                                        {"answer": answer}, request.language,
+                                        deck=deck_name, context=request.slide_context)
+            return {"answer": answer}
+
+        # Ответ и его озвучка из кеша отдаются без очереди допуска
+        # (кеш — SQLite и распаковка, поэтому не в цикле событий, как и у TTS)
+        cached_answer = await asyncio.to_thread(cache_service.get_qa_cache, request.question, request.slide_id,
+                                                request.language, deck=deck_name, context=request.slide_context)
+        audio_data = await speech.get_cached(cached_answer["answer"], request.language, ANSWER) if cached_answer else None
+        if audio_data is None:
+            async with admission.admit("qa", client.client_id, client.priority):
+                if cached_answer is None:
+                    cached_answer = await single_flight.do(
+                        cache_service.qa_key(request.question, request.slide_id, request.language, deck_name, request.slide_context),
+                        ask_llm,
+                        recheck=lambda: cache_service.get_qa_cache(request.question, request.slide_id, request.language,
+                                                                deck=deck_name, context=request.slide_context),
+                    )
+                # Озвучка ответа
+                audio_data, _ = await speech.get_audio(cached_answer["answer"], request.language, ANSWER)
+        answer_text = cached_answer["answer"]
         
         return {
             "question": request.question,
             "answer": answer_text,
-            "audio": audio_base64,
-            "audio_format": "wav"
+            "audio": _encode_audio(audio_data),
+            "audio_format": "wav",
+            "source": "llm",
         }
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"QA error: {str(e)}")
 
+@router.post("/qa/batch")
+async def question_answer_batch(
+    request: QABatchRequest,
+    qa_service: OpenAIQA = Depends(get_qa_service),
+    speech: SpeechService = Depends(get_speech_service),
+    faq_service: FAQService = Depends(get_faq_service),
+    cache_service: CacheService = Depends(get_cache_service),
+    admission: AdmissionService = Depends(get_admission_service),
+    client: ClientContext = Depends(client_context),
+):
+    """
+    Ответить на список вопросов к слайду (например, собранных за лекцию).
+
+    Почти одинаковые вопросы объединяются, вопросы без готового ответа
+    задаются LLM пачками по QA_BATCH_GROUP, озвучка идёт параллельно.
+    Ответ — поток NDJSON: строка на каждый уникальный вопрос по мере
+    готовности {"indices": [...], "question", "answer", "audio",
+    "audio_format", "source"} (или "error"), последняя строка —
+    {"done": true, "questions": N, "unique": M}.
+    """
+    # Лимит списывается по токену на каждую уникальную группу вопросов,
+    # которой нужен провайдер (ответы из FAQ бесплатны). Первый — до начала
+    # потока, пока ещё можно ответить 429; группы сверх лимита получают
+    # строку с ошибкой и retry_after
+    admission.check_rate_limit("qa", client.client_id, client.priority)
+    prepaid = 1
+    language, deck_name = resolve_deck(request.language, request.deck)
+    questions = [q.strip() for q in request.questions]
+    groups = group_similar_questions(questions, QA_BATCH_DEDUP_THRESHOLD)
+
+    results: "asyncio.Queue[Dict]" = asyncio.Queue()
+    tasks = set()
+    semaphore = asyncio.Semaphore(QA_BATCH_CONCURRENCY)
+
+    def emit(group: List[int], **fields):
+        results.put_nowait({"indices": group, "question": questions[group[0]], **fields})
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def emit_error(group: List[int], e: Exception, **fields):
+        if isinstance(e, AdmissionRejected):
+            emit(group, error=f"Too many requests ({e.reason}), retry later",
+                 retry_after=int(e.retry_after_header), **fields)
+        else:
+            emit(group, error=f"QA error: {str(e)}", **fields)
+
+    async def voice(group: List[int], answer: str):
+        try:
+            async with semaphore:
+                audio_data = await speech.get_cached(answer, request.language, ANSWER)
+                if audio_data is None:
+                    async with admission.admit("qa", client.client_id, client.priority, rate_limit=False):
+                        audio_data, _ = await speech.get_audio(answer, request.language, ANSWER)
+            emit(group, answer=answer, audio=_encode_audio(audio_data), audio_format="wav", source="llm")
+        except Exception as e:
+            # Текст ответа уже есть — отдаётся и без озвучки
+            emit_error(group, e, answer=answer)
+
+    async def ask(chunk: List[List[int]]):
+        chunk_questions = [questions[group[0]] for group in chunk]
+        try:
+            async with semaphore:
+                async with admission.admit("qa", client.client_id, client.priority, rate_limit=False):
+                    with tracing.span("qa.answer_many", language=request.language, questions=len(chunk)):
+                        answers = await qa_service.answer_many(
+                            chunk_questions,
+                            context=request.slide_context,
+                            slide_id=request.slide_id,
+                            language=request.language,
+                        )
+        except Exception as e:
+            for group in chunk:
+                emit_error(group, e)
+            return
+        for group, question, (answer, cacheable) in zip(chunk, chunk_questions, answers):
+            if cacheable:
+                await asyncio.to_thread(cache_service.set_qa_cache, question, request.slide_id, {"answer": answer},
+                                        request.language, deck=deck_name, context=request.slide_context)
+            spawn(voice(group, answer))
+
+    def charge(group: List[int]) -> bool:
+        nonlocal prepaid
+        if prepaid:
+            prepaid -= 1
+            return True
+        try:
+            admission.check_rate_limit("qa", client.client_id, client.priority)
+        except AdmissionRejected as e:
+            emit_error(group, e)
+            return False
+        return True
+
+    async def plan():
+        uncached = []
+        for group in groups:
+            question = questions[group[0]]
+            try:
+                faq = _faq_lookup(faq_service, question, language, deck_name, request.slide_id)
+                if faq:
+                    faq_entry, faq_audio = faq
+                    emit(group, answer=faq_entry["answer"], audio=_encode_audio(faq_audio),
+                         audio_format="wav", source="faq")
+                    continue
+                cached_answer = await asyncio.to_thread(cache_service.get_qa_cache, question, request.slide_id,
+                                                        request.language, deck=deck_name,
+                                                        context=request.slide_context)
+            except Exception as e:
+                emit_error(group, e)
+                continue
+            if not charge(group):
+                continue
+            if cached_answer:
+                spawn(voice(group, cached_answer["answer"]))
+            else:
+                uncached.append(group)
+        for start in range(0, len(uncached), QA_BATCH_GROUP):
+            spawn(ask(uncached[start:start + QA_BATCH_GROUP]))
+
+    async def stream():
+        try:
+            await plan()
+            for _ in range(len(groups)):
+                yield json.dumps(await results.get(), ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "questions": len(questions), "unique": len(groups)}) + "\n"
+        finally:
+            # Клиент ушёл — незавершённые вызовы не нужны
+            for task in list(tasks):
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
 @router.get("/qa/test")
 async def test_qa():
     """Тестовый эндпоинт для проверки QA сервиса"""
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+from services.sessions import SessionForbidden, SessionHub, SessionNotFound
+from services.container import get_session_hub
+from typing import Optional
+import asyncio
+import json
+
+router = APIRouter()
+
+
+class SessionCreateRequest(BaseModel):
+    lang: str = "ru"
+    deck: Optional[str] = None
+
+
+class SlideChangeRequest(BaseModel):
+    index: int
+
+
+@router.post("/sessions")
+async def create_session(request: SessionCreateRequest, hub: SessionHub = Depends(get_session_hub)):
+    """
+    Создать сессию синхронного показа. presenter_token нужен ведущему
+    для переключения слайдов; зрителям достаточно session_id.
+    """
+    return hub.create(request.lang, request.deck)
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, hub: SessionHub = Depends(get_session_hub)):
+    """Текущий слайд сессии и подсказки предзагрузки"""
+    try:
+        return hub.get_state(session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@router.post("/sessions/{session_id}/slide")
+async def change_slide(
+    session_id: str,
+    request: SlideChangeRequest,
+    x_presenter_token: Optional[str] = Header(default=None),
+    hub: SessionHub = Depends(get_session_hub),
+):
+    """Переключить слайд (для ведущего без WebSocket)"""
+    try:
+        return await hub.goto(session_id, x_presenter_token or "", request.index)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except SessionForbidden:
+        raise HTTPException(status_code=403, detail="Presenter token required")
+
+
+@router.websocket("/sessions/{session_id}/ws")
+async def session_socket(websocket: WebSocket, session_id: str, token: str = "", hub: SessionHub = Depends(get_session_hub)):
+    """
+    Канал сессии. Все подключения получают {"type": "slide", ...} при
+    каждом переходе. Ведущий (?token=<presenter_token>) отправляет
+    {"type": "goto", "index": N}.
+    """
+    await websocket.accept()
+    try:
+        state = hub.get_state(session_id)
+    except SessionNotFound:
+        await websocket.close(code=4404, reason="Session not found")
+        return
+
+    presenter = hub.is_presenter(session_id, token)
+    subscriber = hub.subscribe(session_id)
+
+    async def forward():
+        while True:
+            await websocket.send_text(await subscriber.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        await websocket.send_text(json.dumps(dict(state, role="presenter" if presenter else "viewer"), ensure_ascii=False))
+        while True:
+            # Некорректное сообщение — кадр с ошибкой, а не обрыв канала
+            try:
+                message = json.loads(await websocket.receive_text())
+            except (ValueError, KeyError):
+                # KeyError — бинарный кадр вместо текстового
+                await websocket.send_json({"type": "error", "detail": "Message must be JSON text"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif kind == "goto":
+                if not presenter:
+                    await websocket.send_json({"type": "error", "detail": "Only the presenter can change slides"})
+                    continue
+                index = message.get("index")
+                if not isinstance(index, int) or isinstance(index, bool):
+                    await websocket.send_json({"type": "error", "detail": "goto requires an integer index"})
+                    continue
+                await hub.goto(session_id, token, index)
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown message type: {kind!r}"})
+    except WebSocketDisconnect:
+        pass
+    except SessionNotFound:
+        # Сессия истекла и удалена, пока канал был открыт
+        await websocket.close(code=4404, reason="Session not found")
+    finally:
+        sender.cancel()
+        hub.unsubscribe(session_id, subscriber)
@@ -1,71 +1,112 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Dict, Optional, Tuple
+import asyncio
 import json
-import os
-from pathlib import Path
 
-router = APIRouter()
-
-DATA_DIR = Path(__file__).parent.parent / "data"
+from services.decks import audio_filename, resolve_deck
+from services.deck_store import get_deck_store
+from services.audio_pack import AudioPackRegistry
+from services.sessions import audio_url
+from services.warmup import WarmupScheduler
+from services.container import get_audio_pack_registry, get_warmup_scheduler
+from services.metrics import SLIDES_LOAD_SECONDS
 
-# Путь к файлам со слайдами (lang + deck)
-SLIDES_FILES: Dict[str, Dict[str, Path]] = {
-    "ky": {
-        "default": DATA_DIR / "slides.json",
-    },
-    "ru": {
-        "rights": DATA_DIR / "slides_ru.json",
-        "mvd": DATA_DIR / "slides_ru_mvd.json",
-        "default": DATA_DIR / "slides_ru.json",
-    },
-}
+router = APIRouter()
 
 
-def _normalize_lang(lang: Optional[str]) -> str:
-    normalized = (lang or "ky").strip().lower()
-    return normalized if normalized in SLIDES_FILES else "ky"
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """fields=id,title -> ["id", "title"]; пусто — все поля"""
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()] or None
 
 
-def _normalize_deck(language: str, deck: Optional[str]) -> str:
-    normalized = (deck or "default").strip().lower()
-    if normalized in SLIDES_FILES[language]:
-        return normalized
+def attach_audio(
+    slides: List[Dict],
+    language: str,
+    deck_name: str,
+    first_position: int,
+    audio_packs: AudioPackRegistry,
+    fields: Optional[List[str]] = None,
+) -> List[Dict]:
+    """Добавить к слайдам "audio": URL готовой озвучки и её метаданные
+    (длительность, громкость, пики) — без скачивания самого WAV"""
+    if fields is not None and "audio" not in fields:
+        return slides
+    for position, slide in enumerate(slides, first_position):
+        slide_id = int(slide.get("id", position))
+        url = audio_url(audio_packs, language, deck_name, slide_id)
+        meta = audio_packs.asset_meta(language, deck_name, audio_filename(slide_id)) if url else None
+        slide["audio"] = dict(meta or {}, url=url) if url else None
+    return slides
 
-    # Backward compatible default behavior
-    if language == "ru":
-        return "rights"
-    return "default"
 
-def load_slides(lang: Optional[str] = None, deck: Optional[str] = None) -> List[Dict]:
-    """Загрузить слайды из JSON файла"""
+def load_slides(
+    lang: Optional[str] = None,
+    deck: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[int, List[Dict]]:
+    """Загрузить страницу слайдов из хранилища колод: (всего, слайды)"""
     try:
-        language = _normalize_lang(lang)
-        deck_name = _normalize_deck(language, deck)
-        slides_file = SLIDES_FILES[language][deck_name]
-
-        with open(slides_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("slides", [])
+        language, deck_name = resolve_deck(lang, deck)
+        with SLIDES_LOAD_SECONDS.time():
+            return get_deck_store().get_slides(language, deck_name, offset=offset, limit=limit, fields=fields)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Slides file not found")
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Error parsing slides file")
 
+@router.get("/decks")
+async def list_decks(lang: Optional[str] = None):
+    """Список колод (без слайдов): язык, имя, заголовок, число слайдов"""
+    decks = get_deck_store().list_decks((lang or "").strip().lower() or None)
+    return {"total": len(decks), "decks": decks}
+
 @router.get("/slides")
-async def get_all_slides(lang: Optional[str] = None, deck: Optional[str] = None):
-    """Получить все слайды"""
-    slides = load_slides(lang, deck)
+async def get_all_slides(
+    lang: Optional[str] = None,
+    deck: Optional[str] = None,
+    offset: int = Query(default=0, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1, le=500),
+    fields: Optional[str] = None,
+    warmup_scheduler: WarmupScheduler = Depends(get_warmup_scheduler),
+    audio_packs: AudioPackRegistry = Depends(get_audio_pack_registry),
+):
+    """Получить слайды колоды (по умолчанию все; offset/limit — страница,
+    fields=id,title — только перечисленные поля)"""
+    field_list = _parse_fields(fields)
+    total, slides = load_slides(lang, deck, offset=offset, limit=limit, fields=field_list)
+    # В потоке: метаданные без спутника считаются по самому WAV
+    await asyncio.to_thread(attach_audio, slides, *resolve_deck(lang, deck), offset + 1, audio_packs, field_list)
+    # Прогрев озвучки первых слайдов, пока клиент рисует стартовый экран
+    if offset == 0:
+        full_deck = slides if field_list is None and limit is None else None
+        warmup_scheduler.schedule_after(*resolve_deck(lang, deck), position=-1, slides=full_deck)
     return {
-        "total": len(slides),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
         "slides": slides
     }
 
 @router.get("/slides/{slide_id}")
-async def get_slide(slide_id: int, lang: Optional[str] = None, deck: Optional[str] = None):
-    """Получить конкретный слайд по ID"""
-    slides = load_slides(lang, deck)
-    
-    if slide_id < 1 or slide_id > len(slides):
+async def get_slide(
+    slide_id: int,
+    lang: Optional[str] = None,
+    deck: Optional[str] = None,
+    fields: Optional[str] = None,
+    warmup_scheduler: WarmupScheduler = Depends(get_warmup_scheduler),
+    audio_packs: AudioPackRegistry = Depends(get_audio_pack_registry),
+):
+    """Получить конкретный слайд по ID (порядковому номеру в колоде)"""
+    language, deck_name = resolve_deck(lang, deck)
+    field_list = _parse_fields(fields)
+    slide = get_deck_store().get_slide_at(language, deck_name, slide_id - 1, fields=field_list) if slide_id >= 1 else None
+    if slide is None:
         raise HTTPException(status_code=404, detail=f"Slide {slide_id} not found")
-    
-    return slides[slide_id - 1]
+    await asyncio.to_thread(attach_audio, [slide], language, deck_name, slide_id, audio_packs, field_list)
+
+    warmup_scheduler.schedule_after(language, deck_name, position=slide_id - 1)
+    return slide
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from services.admission import AdmissionRejected, AdmissionService
 from services.whisper_stt import WhisperSTT
+from services.container import get_admission_service, get_stt_service
+from routers.deps import ClientContext, client_context
 
 router = APIRouter()
-stt_service = WhisperSTT()
 
 @router.post("/stt")
 async def speech_to_text(
     audio: UploadFile = File(...),
     language: str = Form(default=""),
+    stt_service: WhisperSTT = Depends(get_stt_service),
+    admission: AdmissionService = Depends(get_admission_service),
+    client: ClientContext = Depends(client_context),
 ):
     """
     Распознать речь из аудио файла
@@ -42,7 +47,8 @@ async def speech_to_text(
 
         # Распознавание речи
         language_hint = (language or "").strip().lower()
-        transcription = await stt_service.transcribe(audio_data, audio.filename, language_hint=language_hint)
+        async with admission.admit("stt", client.client_id, client.priority):
+            transcription = await stt_service.transcribe(audio_data, audio.filename, language_hint=language_hint)
 
         return {
             "text": transcription,
@@ -50,7 +56,7 @@ async def speech_to_text(
             "filename": audio.filename,
         }
 
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"STT error: {str(e)}")
@@ -1,50 +1,72 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services.huggingface_tts import HuggingFaceTTS
-from services.cache import cache_service
+from services import audio_meta
+from services.admission import AdmissionRejected, AdmissionService
+from services.speech import SpeechService, SpeechUnavailable
+from services.warmup import WarmupScheduler
+from services.container import get_admission_service, get_speech_service, get_warmup_scheduler
+from routers.deps import ClientContext, client_context
 import io
 
 router = APIRouter()
-tts_service = HuggingFaceTTS()
 
 class TTSRequest(BaseModel):
     text: str
     language: str = "ky"  # Кыргызский язык
 
 @router.post("/tts")
-async def text_to_speech(request: TTSRequest):
+async def text_to_speech(
+    request: TTSRequest,
+    speech: SpeechService = Depends(get_speech_service),
+    warmup_scheduler: WarmupScheduler = Depends(get_warmup_scheduler),
+    admission: AdmissionService = Depends(get_admission_service),
+    client: ClientContext = Depends(client_context),
+):
     """
     Преобразовать текст в речь (кыргызский язык)
     """
     try:
-        # Проверить кеш
-        cached_audio = cache_service.get_tts_cache(request.text, request.language)
-        if cached_audio:
-            return StreamingResponse(
-                io.BytesIO(cached_audio),
-                media_type="audio/wav",
-                headers={
-                    "Content-Disposition": "inline; filename=speech.wav",
-                    "X-Cache": "HIT"
-                }
-            )
-        
-        # Генерация аудио
-        audio_data = await tts_service.synthesize(request.text, request.language)
-        
-        # Сохранить в кеш
-        cache_service.set_tts_cache(request.text, audio_data, request.language)
+        # Следующие слайды начинаем готовить, пока отдаём текущий
+        warmup_scheduler.schedule_for_text(request.text, request.language)
+
+        # Кеш, а при промахе — один синтез на ключ, даже если тот же текст
+        # сейчас прогревается или запрошен другим клиентом/воркером.
+        # Попадания в кеш обслуживаются сразу, без очереди допуска.
+        entry_class = warmup_scheduler.entry_class(request.text, request.language)
+        audio_data = await speech.get_cached(request.text, request.language, entry_class)
+        cached = audio_data is not None
+        fallback = False
+        if audio_data is None:
+            async with admission.admit("tts", client.client_id, client.priority):
+                try:
+                    audio_data, cached = await speech.get_audio(
+                        request.text, request.language, entry_class, allow_fallback=False
+                    )
+                except SpeechUnavailable as e:
+                    # Провайдеры недоступны: отдаём заглушку, но помечаем её
+                    audio_data, fallback = e.audio_data, True
         
+        headers = {
+            "Content-Disposition": "inline; filename=speech.wav",
+            "X-Cache": "HIT" if cached else "MISS"
+        }
+        if fallback:
+            headers["X-TTS-Fallback"] = "1"
+        else:
+            # Длительность, громкость и пики — клиенту не нужно декодировать WAV
+            meta = await speech.get_meta(request.text, request.language, audio_data)
+            if meta:
+                headers.update(audio_meta.to_headers(meta))
+
         # Возврат аудио как streaming response
         return StreamingResponse(
             io.BytesIO(audio_data),
             media_type="audio/wav",
-            headers={
-                "Content-Disposition": "inline; filename=speech.wav",
-                "X-Cache": "MISS"
-            }
+            headers=headers
         )
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TTS error: {str(e)}")
 
@@ -0,0 +1,309 @@
+"""Контроль допуска к провайдерам (OpenAI) для /api/qa, /api/tts, /api/stt.
+
+Без ограничений всплеск запросов из класса сразу уходит в OpenAI,
+упирается в rate limit, и ошибки получают все. Здесь:
+    * на каждый эндпоинт — ограничение одновременных вызовов провайдера
+      и очередь ожидания с приоритетами (ведущий/учитель раньше учеников);
+    * ожидание в очереди ограничено по времени;
+    * для каждого клиента — token bucket;
+    * при переполнении — AdmissionRejected с рекомендуемым Retry-After
+      (роутеры отдают его как 429).
+
+Ответы из кеша сюда не попадают: роутеры запрашивают допуск только
+тогда, когда действительно нужен вызов провайдера.
+
+Настройки (переменные окружения):
+    ADMISSION_ENABLED=true
+    ADMISSION_QA_CONCURRENCY=8       одновременных вызовов на эндпоинт
+    ADMISSION_TTS_CONCURRENCY=4
+    ADMISSION_STT_CONCURRENCY=4
+    ADMISSION_QUEUE_MAX=64           длина очереди ожидания на эндпоинт
+    ADMISSION_MAX_WAIT=10            сколько ждать в очереди, сек
+    RATE_LIMIT_PER_MINUTE=30         запросов к провайдеру на клиента в минуту
+    RATE_LIMIT_BURST=10              размер «пачки» сверх средней скорости
+    RATE_LIMIT_IP_PER_MINUTE=300     общий потолок на IP (весь класс за NAT)
+    RATE_LIMIT_IP_BURST=60
+
+Состояние (очереди, «вёдра» лимитов) у каждого процесса своё, поэтому
+настройки задаются на весь узел и делятся на число воркеров
+WEB_CONCURRENCY (gunicorn.conf.py): балансировщик распределяет запросы
+клиента по воркерам, и в сумме лимиты близки к заданным.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from services import tracing
+from services.metrics import registry
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+_PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal"}
+
+_DEFAULT_CONCURRENCY = {"qa": 8, "tts": 4, "stt": 4}
+
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "admission_queue_depth", "Requests waiting for a provider slot", ("endpoint",)
+)
+ADMISSION_ACTIVE = registry.gauge(
+    "admission_active", "Provider-bound requests currently admitted", ("endpoint",)
+)
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "admission_wait_seconds", "Time spent waiting for a provider slot", ("endpoint", "priority")
+)
+ADMISSION_REJECTIONS = registry.counter(
+    "admission_rejections_total", "Requests rejected with 429", ("endpoint", "reason")
+)
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен; клиенту стоит повторить через retry_after секунд"""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: float):
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{endpoint}: {reason}")
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait(self, amount: float = 1.0) -> float:
+        """Пополнить; 0 — amount токенов есть, иначе через сколько секунд появятся"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """Взять токен; 0 — успешно, иначе через сколько секунд появится токен"""
+        retry_after = self.wait()
+        if retry_after == 0:
+            self.tokens -= 1
+        return retry_after
+
+
+class RateLimiter:
+    """Token bucket на ключ (общий для всех эндпоинтов провайдеров)"""
+
+    def __init__(self, per_minute: float, burst: float, max_clients: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._evict_idle()
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[key] = bucket
+        return bucket
+
+    def check(self, key: str) -> float:
+        return self.bucket(key).take()
+
+    def _evict_idle(self):
+        # Полные «вёдра» ничем не отличаются от новых — их можно забыть
+        horizon = self.burst / self.rate
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if now - b.updated >= horizon]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_clients:
+            self._buckets.clear()
+
+
+class AdmissionController:
+    """Ограничение параллелизма с приоритетной очередью ожидания"""
+
+    def __init__(self, endpoint: str, concurrency: int, queue_max: int, max_wait: float):
+        self.endpoint = endpoint
+        self.concurrency = max(1, concurrency)
+        self.queue_max = queue_max
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # Скользящая оценка времени обслуживания — для Retry-After
+        self._service_time = 1.0
+
+    def _update_gauges(self):
+        ADMISSION_QUEUE_DEPTH.set(self.queued, endpoint=self.endpoint)
+        ADMISSION_ACTIVE.set(self.active, endpoint=self.endpoint)
+
+    def estimated_wait(self) -> float:
+        return self._service_time * (self.queued + 1) / self.concurrency
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTIONS.inc(endpoint=self.endpoint, reason=reason)
+        return AdmissionRejected(self.endpoint, reason, self.estimated_wait())
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        start = time.monotonic()
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.observe(0.0, endpoint=self.endpoint, priority=_PRIORITY_NAMES[priority])
+            return
+        if self.queued >= self.queue_max and not self._displace(priority):
+            raise self._reject("queue_full")
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.queued += 1
+        self._update_gauges()
+        try:
+            done, _ = await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                if future.exception() is None:
+                    # Слот уже был передан — возвращаем его следующему
+                    self.release()
+            else:
+                future.cancel()
+                self.queued -= 1
+                self._update_gauges()
+            raise
+        if not done:
+            future.cancel()
+            self.queued -= 1
+            self._update_gauges()
+            raise self._reject("timeout")
+        # Исключение, если место в очереди отдали запросу с более высоким приоритетом
+        future.result()
+        ADMISSION_WAIT_SECONDS.observe(
+            time.monotonic() - start, endpoint=self.endpoint, priority=_PRIORITY_NAMES[priority]
+        )
+
+    def _displace(self, priority: int) -> bool:
+        """Освободить место в полной очереди: вытеснить самый поздний запрос
+        с более низким приоритетом (ученика — ради ведущего)"""
+        candidates = [w for w in self._waiters if not w[2].done() and w[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda w: (w[0], w[1]))
+        victim[2].set_exception(self._reject("displaced"))
+        self.queued -= 1
+        return True
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            # Слот переходит ожидающему без уменьшения active
+            self.queued -= 1
+            future.set_result(None)
+            self._update_gauges()
+            return
+        self.active -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL) -> AsyncIterator[None]:
+        with tracing.span("admission.wait", endpoint=self.endpoint, priority=priority):
+            await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+class AdmissionService:
+    """Допуск запросов к провайдерам: лимит клиента + очередь эндпоинта"""
+
+    def __init__(self):
+        self.enabled = _env_bool("ADMISSION_ENABLED", "true")
+        self.workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1") or "1"))
+        queue_max = math.ceil(int(os.getenv("ADMISSION_QUEUE_MAX", "64")) / self.workers)
+        max_wait = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+        self.controllers: Dict[str, AdmissionController] = {
+            endpoint: AdmissionController(
+                endpoint,
+                concurrency=self._per_worker(os.getenv(f"ADMISSION_{endpoint.upper()}_CONCURRENCY", str(default))),
+                queue_max=queue_max,
+                max_wait=max_wait,
+            )
+            for endpoint, default in _DEFAULT_CONCURRENCY.items()
+        }
+        self.rate_limiter = RateLimiter(
+            per_minute=float(os.getenv("RATE_LIMIT_PER_MINUTE", "30")) / self.workers,
+            burst=float(os.getenv("RATE_LIMIT_BURST", "10")) / self.workers,
+        )
+        # Id клиента присылает сам клиент и может его менять — поэтому
+        # поверх лимита клиента действует общий потолок на IP
+        self.ip_limiter = RateLimiter(
+            per_minute=float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "300")) / self.workers,
+            burst=float(os.getenv("RATE_LIMIT_IP_BURST", "60")) / self.workers,
+        )
+
+    def _per_worker(self, total: str) -> int:
+        # Не меньше одного вызова на воркер, даже если воркеров больше лимита
+        return max(1, math.ceil(int(total) / self.workers))
+
+    def check_rate_limit(self, endpoint: str, client_id: str, priority: int = PRIORITY_NORMAL, cost: int = 1):
+        """Списать запрос с лимита клиента или получить AdmissionRejected.
+
+        client_id — "<ip>" или "<ip>/<id браузера>" (routers/deps.py):
+        токены списываются и с клиента, и с его IP, только если есть в обоих.
+        cost — число вызовов провайдера (задача озвучки длинного текста);
+        больше размера «пачки» не списывается, иначе такой запрос не прошёл
+        бы никогда — он забирает всю пачку.
+        """
+        # Ведущий не ограничивается лимитом клиента: он один и управляет показом
+        if not self.enabled or priority == PRIORITY_HIGH:
+            return
+        ip = client_id.split("/", 1)[0]
+        buckets = [self.rate_limiter.bucket(client_id), self.ip_limiter.bucket(ip)]
+        amounts = [min(float(cost), bucket.burst) for bucket in buckets]
+        retry_after = max(bucket.wait(amount) for bucket, amount in zip(buckets, amounts))
+        if retry_after == 0:
+            for bucket, amount in zip(buckets, amounts):
+                bucket.tokens -= amount
+        if retry_after > 0:
+            ADMISSION_REJECTIONS.inc(endpoint=endpoint, reason="rate_limit")
+            tracing.current_span().add_event("rate_limited", endpoint=endpoint)
+            raise AdmissionRejected(endpoint, "rate_limit", retry_after)
+
+    @asynccontextmanager
+    async def admit(
+        self, endpoint: str, client_id: str, priority: int = PRIORITY_NORMAL, rate_limit: bool = True
+    ) -> AsyncIterator[None]:
+        """Дождаться слота провайдера или получить AdmissionRejected.
+
+        rate_limit=False — лимит клиента уже списан (пакетный запрос
+        списывает его один раз за весь пакет).
+        """
+        if not self.enabled:
+            yield
+            return
+        if rate_limit:
+            self.check_rate_limit(endpoint, client_id, priority)
+        async with self.controllers[endpoint].slot(priority):
+            yield
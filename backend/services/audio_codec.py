@@ -0,0 +1,214 @@
+"""Сжатие аудио для уровней кеша (SQLite узла и Redis) без потерь.
+
+TTS-кеш хранит WAV (16-бит PCM, ~1–2 МБ на запись), и на общих
+уровнях объём записей ограничивает, сколько фраз в кеш помещается.
+Перед записью WAV кодируется примерно так же, как это делает FLAC:
+
+    * отсчёты предсказываются по двум предыдущим (x[i-1]*2 - x[i-2]),
+      хранится остаток — для речи он мал;
+    * остаток переводится в беззнаковый вид (zigzag) и раскладывается
+      на плоскости младших и старших байт — старшие почти нулевые;
+    * результат сжимается zstd (если установлен пакет zstandard)
+      или zlib из стандартной библиотеки.
+
+Преобразование отсчётов векторизовано на numpy (десятки миллисекунд
+на мегабайты PCM); без numpy работает та же арифметика на чистом Python,
+в несколько раз медленнее. Формат записи от этого не зависит.
+
+Обычно запись занимает ~50% исходного WAV, т.е. в тот же объём
+помещается примерно вдвое больше фраз. Память процесса (первый
+уровень) хранит уже раскодированный WAV, поэтому горячие фразы
+декодирования не требуют.
+
+Формат записи:
+
+    "\\x00ACD" | версия (u8) | кодек (u8) | преобразование (u8) |
+    длина заголовка WAV (u32) | заголовок WAV | сжатые данные
+
+Записи без этого префикса (сделанные до сжатия) читаются как есть —
+WAV всегда начинается с "RIFF".
+
+Настройки:
+    CACHE_AUDIO_CODEC=auto      auto (zstd, иначе zlib) | zstd | zlib | none
+    CACHE_AUDIO_LEVEL=          уровень сжатия (по умолчанию 3 для zstd, 6 для zlib)
+"""
+import os
+import struct
+import zlib
+from array import array
+from itertools import accumulate, chain, repeat
+from operator import and_, sub
+from typing import Optional, Tuple
+
+from services.audio_meta import parse_wav
+
+MAGIC = b"\x00ACD"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBBI")
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+_CODEC_NAMES = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+TRANSFORM_NONE = 0
+TRANSFORM_PCM16 = 1
+
+# Сжатие, которое экономит меньше, не стоит декодирования на чтении
+MIN_SAVING = 0.9
+
+
+class AudioCodecError(ValueError):
+    pass
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _compress(codec: int, data: bytes, level: Optional[int]) -> bytes:
+    if codec == CODEC_ZSTD:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise AudioCodecError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    return zlib.compress(data, 6 if level is None else level)
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise AudioCodecError("zstd entry, but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise AudioCodecError(f"unknown codec {codec}")
+
+
+def _split_wav(data: bytes) -> Optional[Tuple[int, int]]:
+    """(начало, конец) 16-битных PCM-отсчётов в WAV; None — не такой WAV"""
+    info = parse_wav(data)
+    if info is None or info.audio_format != 1 or info.bits != 16:
+        return None
+    return info.start, info.end
+
+
+def _encode_pcm16(pcm: bytes) -> bytes:
+    np = _numpy()
+    if np is None:
+        return _encode_pcm16_py(pcm)
+    samples = np.frombuffer(pcm, dtype="<i2")
+    # Остаток предсказателя второго порядка; арифметика int16 — по модулю 2**16
+    residual = np.diff(np.diff(samples, prepend=samples.dtype.type(0)), prepend=samples.dtype.type(0))
+    # zigzag: малые по модулю -> малые беззнаковые
+    zigzag = ((residual << 1) ^ (residual >> 15)).view("<u2")
+    # Плоскости байт: младшие, затем старшие
+    return zigzag.view(np.uint8).reshape(-1, 2).T.tobytes()
+
+
+def _decode_pcm16(planes: bytes) -> bytes:
+    np = _numpy()
+    if np is None:
+        return _decode_pcm16_py(planes)
+    zigzag = np.frombuffer(planes, dtype=np.uint8).reshape(2, -1).T.copy().view("<u2").ravel()
+    residual = (zigzag >> 1) ^ (-(zigzag & 1)).astype("<u2")
+    # Две накопленные суммы в uint16 — обратное к остатку по модулю 2**16
+    samples = np.cumsum(np.cumsum(residual, dtype="<u2"), dtype="<u2")
+    return samples.tobytes()
+
+
+def _encode_pcm16_py(pcm: bytes) -> bytes:
+    samples = array("h")
+    samples.frombytes(pcm)
+    # Остаток предсказателя второго порядка по модулю 2**16: x[i] - 2*x[i-1] + x[i-2]
+    d1 = list(map(sub, samples, chain((0,), samples)))
+    d2 = map(sub, d1, chain((0,), d1))
+    # zigzag остатка, приведённого к int16: малые по модулю -> малые беззнаковые
+    zigzag = array("H", [((r << 1) ^ -((r >> 15) & 1)) & 0xFFFF for r in d2])
+    raw = zigzag.tobytes()
+    # Плоскости байт: младшие, затем старшие
+    return raw[0::2] + raw[1::2]
+
+
+def _decode_pcm16_py(planes: bytes) -> bytes:
+    half = len(planes) // 2
+    raw = bytearray(len(planes))
+    raw[0::2] = planes[:half]
+    raw[1::2] = planes[half:]
+    zigzag = array("H")
+    zigzag.frombytes(raw)
+    residual = [(z >> 1) ^ -(z & 1) for z in zigzag]
+    samples = array("H", map(and_, accumulate(accumulate(residual)), repeat(0xFFFF)))
+    return samples.tobytes()
+
+
+class AudioCodec:
+    def __init__(self, codec: Optional[str] = None, level: Optional[int] = None):
+        name = (codec or os.getenv("CACHE_AUDIO_CODEC", "auto")).strip().lower()
+        if name == "auto":
+            name = "zstd" if _zstd() is not None else "zlib"
+        if name == "zstd" and _zstd() is None:
+            print("⚠️ CACHE_AUDIO_CODEC=zstd, но пакет zstandard не установлен — используется zlib")
+            name = "zlib"
+        self.codec: Optional[int] = _CODEC_NAMES.get(name)
+        level_env = os.getenv("CACHE_AUDIO_LEVEL", "").strip()
+        self.level = level if level is not None else (int(level_env) if level_env else None)
+
+    @property
+    def name(self) -> str:
+        return next((k for k, v in _CODEC_NAMES.items() if v == self.codec), "none")
+
+    def encode(self, data: bytes) -> bytes:
+        """Сжать аудио для кеша; если выигрыша нет — вернуть как есть"""
+        if self.codec is None or not data:
+            return data
+        bounds = _split_wav(data)
+        if bounds is not None:
+            start, end = bounds
+            head, transform = data[:start], TRANSFORM_PCM16
+            payload = _encode_pcm16(data[start:end]) + data[end:]
+            tail_len = len(data) - end
+        else:
+            head, transform, payload, tail_len = b"", TRANSFORM_NONE, data, 0
+        compressed = _compress(self.codec, payload, self.level)
+        blob = b"".join((
+            _HEADER.pack(MAGIC, VERSION, self.codec, transform, len(head)),
+            head,
+            tail_len.to_bytes(4, "little"),
+            compressed,
+        ))
+        return blob if len(blob) < len(data) * MIN_SAVING else data
+
+    @staticmethod
+    def decode(blob: bytes) -> bytes:
+        """Исходные байты записи (старые несжатые записи — как есть)"""
+        if not blob.startswith(MAGIC):
+            return blob
+        if len(blob) < _HEADER.size + 4:
+            raise AudioCodecError("truncated entry")
+        _, version, codec, transform, head_len = _HEADER.unpack_from(blob, 0)
+        if version != VERSION:
+            raise AudioCodecError(f"unsupported version {version}")
+        pos = _HEADER.size
+        head = blob[pos:pos + head_len]
+        pos += head_len
+        tail_len = int.from_bytes(blob[pos:pos + 4], "little")
+        payload = _decompress(codec, blob[pos + 4:])
+        if transform == TRANSFORM_NONE:
+            return payload
+        if transform != TRANSFORM_PCM16:
+            raise AudioCodecError(f"unknown transform {transform}")
+        split = len(payload) - tail_len
+        return head + _decode_pcm16(payload[:split]) + payload[split:]
@@ -0,0 +1,303 @@
+"""Метаданные озвучки: длительность, громкость, выравнивающее усиление, пики.
+
+Фронтенду не нужно скачивать и декодировать WAV, чтобы узнать
+длительность или нарисовать прогресс, — всё это считается один раз:
+
+    * при генерации озвучки слайдов и FAQ (generate_all_audio.py, задача
+      deck_audio) — в файл-спутник рядом с аудио: slide_01.wav.json;
+    * при синтезе на лету — вместе с TTS-кешем; /api/tts отдаёт
+      метаданные в заголовках X-Audio-*.
+
+Громкость — интегральная по ITU-R BS.1770 (K-взвешивание, блоки 400 мс
+с шагом 100 мс, абсолютный гейт -70 LUFS и относительный -10 LU).
+K-фильтр применяется в частотной области (rfft блока, умноженный на
+|H|² фильтра): вся обработка векторная, без цикла по отсчётам.
+
+Голоса OpenAI TTS и запасного pyttsx3 звучат с очень разной громкостью,
+поэтому синтезированное аудио сразу приводится к AUDIO_TARGET_LUFS
+(normalize): выравнивание происходит один раз на сервере, а не на
+каждом устройстве. gain_db в метаданных — сколько ещё добавить при
+воспроизведении (для нормализованного аудио ~0).
+
+Расчёт требует numpy; без него в метаданных только длительность и
+формат, а нормализация не выполняется.
+
+Настройки:
+    AUDIO_NORMALIZE=true         нормализовать синтезированное аудио
+    AUDIO_TARGET_LUFS=-16
+    AUDIO_PEAK_CEILING_DB=-1     усиление не поднимает пик выше этого уровня
+    AUDIO_MAX_GAIN_DB=20
+    AUDIO_PEAKS=100              точек в массиве пиков (для waveform)
+"""
+import json
+import math
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+META_VERSION = 1
+SIDECAR_SUFFIX = ".json"
+
+TARGET_LUFS = float(os.getenv("AUDIO_TARGET_LUFS", "-16"))
+PEAK_CEILING_DB = float(os.getenv("AUDIO_PEAK_CEILING_DB", "-1"))
+MAX_GAIN_DB = float(os.getenv("AUDIO_MAX_GAIN_DB", "20"))
+PEAKS_COUNT = int(os.getenv("AUDIO_PEAKS", "100"))
+NORMALIZE = os.getenv("AUDIO_NORMALIZE", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+
+# Гейты BS.1770
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+# Блоков 400 мс, обрабатываемых за раз (ограничивает память на длинных файлах)
+_BLOCKS_PER_CHUNK = 128
+
+
+class WavInfo(NamedTuple):
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits: int
+    start: int  # смещение PCM-данных
+    end: int
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def parse_wav(data: bytes) -> Optional[WavInfo]:
+    """Формат и границы PCM-данных WAV; None — не WAV"""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    pos = 12
+    fmt: Optional[Tuple[int, int, int, int]] = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        chunk_size = int.from_bytes(data[pos + 4:pos + 8], "little")
+        body = pos + 8
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            fmt = (audio_format, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            # Потоковые генераторы пишут размер 0/0xFFFFFFFF — берём до конца файла
+            end = len(data) if chunk_size in (0, 0xFFFFFFFF) else min(len(data), body + chunk_size)
+            frame = max(1, fmt[1] * fmt[3] // 8)
+            return WavInfo(*fmt, start=body, end=body + (end - body) // frame * frame)
+        pos = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _biquad_power(np, b, a, freqs, sample_rate):
+    """|H(e^jw)|² биквадратного фильтра на частотах freqs"""
+    z = np.exp(-2j * np.pi * freqs / sample_rate)
+    num = b[0] + b[1] * z + b[2] * z * z
+    den = 1.0 + a[0] * z + a[1] * z * z
+    return np.abs(num / den) ** 2
+
+
+def _k_weighting(np, freqs, sample_rate):
+    """Квадрат АЧХ K-фильтра BS.1770 (полка + ФВЧ) для любой частоты дискретизации"""
+    # Полка +4 дБ выше ~1.7 кГц
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = _biquad_power(
+        np,
+        ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0),
+        (2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0),
+        freqs, sample_rate,
+    )
+    # ФВЧ ~38 Гц
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = _biquad_power(np, (1.0, -2.0, 1.0), (2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0), freqs, sample_rate)
+    return shelf * highpass
+
+
+def _block_energies(np, samples, sample_rate):
+    """Средний квадрат K-взвешенного сигнала в блоках 400 мс (шаг 100 мс), сумма по каналам"""
+    block = max(1, int(round(0.4 * sample_rate)))
+    hop = max(1, int(round(0.1 * sample_rate)))
+    frames, channels = samples.shape
+    if frames < block:
+        block = frames
+    count = 1 + (frames - block) // hop
+    weights = _k_weighting(np, np.fft.rfftfreq(block, 1.0 / sample_rate), sample_rate)
+    # Парсеваль для rfft: все бины, кроме DC и Найквиста, входят дважды
+    weights[1:] *= 2
+    if block % 2 == 0:
+        weights[-1] /= 2
+    energies = np.zeros(count)
+    for channel in range(channels):
+        windows = np.lib.stride_tricks.sliding_window_view(samples[:, channel], block)[::hop]
+        for start in range(0, count, _BLOCKS_PER_CHUNK):
+            spectrum = np.fft.rfft(windows[start:start + _BLOCKS_PER_CHUNK], axis=1)
+            power = (spectrum.real ** 2 + spectrum.imag ** 2) @ weights
+            energies[start:start + _BLOCKS_PER_CHUNK] += power / (block * block)
+    return energies
+
+
+def _integrated_loudness(np, energies) -> Optional[float]:
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(energies)
+    gated = energies[loudness > _ABSOLUTE_GATE]
+    if gated.size == 0:
+        return None
+    relative = -0.691 + 10 * math.log10(gated.mean()) + _RELATIVE_GATE
+    gated = energies[(loudness > _ABSOLUTE_GATE) & (loudness > relative)]
+    if gated.size == 0:
+        return None
+    return -0.691 + 10 * math.log10(gated.mean())
+
+
+def _samples(np, data: bytes, info: WavInfo):
+    """PCM -> float64 [кадры, каналы] в диапазоне -1..1"""
+    if info.audio_format != 1 or info.bits not in (16, 32):
+        return None
+    dtype = "<i2" if info.bits == 16 else "<i4"
+    raw = np.frombuffer(data, dtype=dtype, count=(info.end - info.start) // (info.bits // 8), offset=info.start)
+    return raw.reshape(-1, info.channels) / float(2 ** (info.bits - 1))
+
+
+def _gain_for(loudness: Optional[float], peak_db: Optional[float]) -> float:
+    if loudness is None:
+        return 0.0
+    gain = TARGET_LUFS - loudness
+    if peak_db is not None:
+        gain = min(gain, PEAK_CEILING_DB - peak_db)
+    return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain))
+
+
+def _measure(np, samples, sample_rate: int) -> Dict[str, Any]:
+    frames = samples.shape[0]
+    if frames == 0:
+        return {"loudness_lufs": None, "peak_db": None, "gain_db": 0.0, "peaks": []}
+    magnitude = np.abs(samples).max(axis=1)
+    peak = float(magnitude.max())
+    peak_db = 20 * math.log10(peak) if peak > 0 else None
+    loudness = _integrated_loudness(np, _block_energies(np, samples, sample_rate))
+    # Пики для waveform: максимум модуля в равных отрезках
+    buckets = min(PEAKS_COUNT, frames)
+    edges = np.linspace(0, frames, buckets, endpoint=False).astype(np.int64)
+    peaks = np.maximum.reduceat(magnitude, edges)
+    return {
+        "loudness_lufs": round(loudness, 2) if loudness is not None else None,
+        "peak_db": round(peak_db, 2) if peak_db is not None else None,
+        "gain_db": round(_gain_for(loudness, peak_db), 2),
+        "peaks": [round(float(p), 3) for p in np.minimum(peaks, 1.0)],
+    }
+
+
+def analyze(data: bytes) -> Optional[Dict[str, Any]]:
+    """Метаданные WAV; None — не WAV"""
+    info = parse_wav(data)
+    if info is None:
+        return None
+    frame_bytes = max(1, info.channels * info.bits // 8)
+    frames = (info.end - info.start) // frame_bytes
+    meta: Dict[str, Any] = {
+        "version": META_VERSION,
+        "duration": round(frames / info.sample_rate, 3) if info.sample_rate else 0.0,
+        "sample_rate": info.sample_rate,
+        "channels": info.channels,
+        "bytes": len(data),
+    }
+    np = _numpy()
+    samples = _samples(np, data, info) if np is not None else None
+    if samples is not None:
+        meta.update(_measure(np, samples, info.sample_rate))
+    return meta
+
+
+def normalize(data: bytes) -> bytes:
+    """Привести WAV к целевой громкости (16-бит PCM); остальное — как есть"""
+    np = _numpy()
+    info = parse_wav(data)
+    if not NORMALIZE or np is None or info is None or info.audio_format != 1 or info.bits != 16:
+        return data
+    samples = _samples(np, data, info)
+    if samples is None or samples.size == 0:
+        return data
+    peak = float(np.abs(samples).max())
+    peak_db = 20 * math.log10(peak) if peak > 0 else None
+    loudness = _integrated_loudness(np, _block_energies(np, samples, info.sample_rate))
+    gain_db = _gain_for(loudness, peak_db)
+    if abs(gain_db) < 0.1:
+        return data
+    scaled = np.clip(np.rint(samples * (32768.0 * 10 ** (gain_db / 20))), -32768, 32767).astype("<i2")
+    pcm = scaled.tobytes()
+    # Заголовок пишется заново: у потоковых WAV размеры в нём не заполнены
+    return _wav_header(1, info.channels, info.sample_rate, 16, len(pcm)) + pcm
+
+
+def _wav_header(audio_format: int, channels: int, sample_rate: int, bits: int, data_size: int) -> bytes:
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, audio_format, channels, sample_rate,
+        sample_rate * block_align, block_align, bits,
+        b"data", data_size,
+    )
+
+
+def join_wav(parts: List[bytes]) -> bytes:
+    """Склеить WAV одного формата в один (PCM подряд, заголовок заново)"""
+    infos = [parse_wav(part) for part in parts]
+    if not infos or any(info is None for info in infos):
+        raise ValueError("Not a WAV file")
+    first = infos[0]
+    layout = (first.audio_format, first.channels, first.sample_rate, first.bits)
+    if any((info.audio_format, info.channels, info.sample_rate, info.bits) != layout for info in infos):
+        raise ValueError("WAV parts have different formats")
+    pcm = b"".join(part[info.start:info.end] for part, info in zip(parts, infos))
+    return _wav_header(*layout, len(pcm)) + pcm
+
+
+def sidecar_path(audio_path: Path) -> Path:
+    return audio_path.with_name(audio_path.name + SIDECAR_SUFFIX)
+
+
+def write_sidecar(audio_path: Path, data: Optional[bytes] = None) -> Optional[Dict[str, Any]]:
+    """Посчитать метаданные файла озвучки и записать их рядом с ним"""
+    meta = analyze(data if data is not None else audio_path.read_bytes())
+    if meta is None:
+        return None
+    target = sidecar_path(audio_path)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, target)
+    return meta
+
+
+def read_sidecar(audio_path: Path) -> Optional[Dict[str, Any]]:
+    """Метаданные из спутника, если он не старше самого аудио"""
+    target = sidecar_path(audio_path)
+    try:
+        if target.stat().st_mtime_ns < audio_path.stat().st_mtime_ns:
+            return None
+        return json.loads(target.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def to_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+    """Метаданные для заголовков ответа с аудио (пики — через запятую)"""
+    headers = {"X-Audio-Duration": str(meta.get("duration", 0))}
+    if meta.get("loudness_lufs") is not None:
+        headers["X-Audio-Loudness"] = str(meta["loudness_lufs"])
+    if "gain_db" in meta:
+        headers["X-Audio-Gain"] = str(meta["gain_db"])
+    if meta.get("peaks"):
+        headers["X-Audio-Peaks"] = ",".join(f"{p:g}" for p in meta["peaks"])
+    return headers
@@ -0,0 +1,222 @@
+"""Архивы озвучки колод (audio packs), отдаваемые через mmap.
+
+Вместо сотен отдельных WAV на колоду собирается один файл:
+
+    data/audio/packs/<язык>_<колода>_<голос>_<формат>.pack
+
+    заголовок  "APACK001" | смещение индекса (u64) | длина индекса (u64)
+    данные     файлы подряд
+    индекс     JSON: {"entries": {"slide_01.wav": {"offset", "length", "sha256", "meta"?}}, ...}
+
+"meta" — метаданные озвучки из файла-спутника (services/audio_meta),
+чтобы их можно было отдать со слайдами без чтения файлов.
+
+Сервер отображает архив в память (mmap) и отдаёт файлы срезами
+отображения, в том числе по Range, без чтения с диска на каждый запрос.
+Новый архив пишется во временный файл и подменяется через os.replace:
+запросы, уже получившие старое отображение, дочитывают старую версию,
+новые — видят новую целиком. Половинчатых файлов клиенты не получают.
+
+Если архива для колоды нет, /audio отдаёт отдельные файлы как раньше.
+
+Настройки:
+    AUDIO_PACKS_ENABLED=true
+    AUDIO_PACK_CHECK_SECONDS=1     как часто проверять, не подменён ли архив
+    TTS_VOICE=onyx                 голос, архив которого отдаётся
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from services import audio_meta, decks
+
+logger = logging.getLogger(__name__)
+
+PACKS_DIR = decks.AUDIO_DIR / "packs"
+MAGIC = b"APACK001"
+_HEADER = struct.Struct("<8sQQ")
+
+
+class AudioPackError(ValueError):
+    pass
+
+
+def pack_path(language: str, deck_name: str, voice: str, fmt: str = "wav", packs_dir: Optional[Path] = None) -> Path:
+    return Path(packs_dir or PACKS_DIR) / f"{language}_{deck_name}_{voice}_{fmt}.pack"
+
+
+def write_pack(
+    path: Path,
+    files: Iterable[Tuple[str, bytes]],
+    meta: Optional[Dict] = None,
+    assets_meta: Optional[Dict[str, Dict]] = None,
+) -> Dict:
+    """Собрать архив из (имя, данные) и атомарно заменить им `path`;
+    assets_meta — метаданные файлов по имени"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    entries: Dict[str, Dict] = {}
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, 0, 0))
+            for name, data in files:
+                entries[name] = {
+                    "offset": f.tell(),
+                    "length": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+                if assets_meta and name in assets_meta:
+                    entries[name]["meta"] = assets_meta[name]
+                f.write(data)
+            index = json.dumps(
+                dict(meta or {}, format=1, created_at=time.time(), entries=entries), ensure_ascii=False
+            ).encode("utf-8")
+            index_offset = f.tell()
+            f.write(index)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, index_offset, len(index)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return entries
+
+
+class AudioPack:
+    """Открытый (отображённый в память) архив"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat.st_size < _HEADER.size:
+                raise AudioPackError(f"{path}: file too small")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, index_offset, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or index_offset + index_length > len(self._mmap):
+            raise AudioPackError(f"{path}: bad header")
+        index = json.loads(bytes(self._view[index_offset:index_offset + index_length]))
+        self.meta = {k: v for k, v in index.items() if k != "entries"}
+        self.entries: Dict[str, Dict] = index["entries"]
+
+    def get(self, name: str) -> Optional[Tuple[memoryview, Dict]]:
+        """Срез отображения с файлом и его запись в индексе"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return self._view[entry["offset"]:entry["offset"] + entry["length"]], entry
+
+
+class AudioPackRegistry:
+    """Архивы колод процесса; подмена файла замечается по inode/mtime"""
+
+    def __init__(self, packs_dir: Optional[Path] = None, voice: Optional[str] = None, fmt: str = "wav"):
+        self.packs_dir = Path(packs_dir or PACKS_DIR)
+        self.voice = voice or os.getenv("TTS_VOICE", "onyx")
+        self.fmt = fmt
+        self.enabled = os.getenv("AUDIO_PACKS_ENABLED", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+        self.check_interval = float(os.getenv("AUDIO_PACK_CHECK_SECONDS", "1"))
+        self._lock = threading.Lock()
+        # (язык, колода) -> (архив или None, когда проверяли)
+        self._packs: Dict[Tuple[str, str], Tuple[Optional[AudioPack], float]] = {}
+
+    def get(self, language: str, deck_name: str) -> Optional[AudioPack]:
+        if not self.enabled:
+            return None
+        key = (language, deck_name)
+        now = time.monotonic()
+        current, checked_at = self._packs.get(key, (None, -1.0))
+        if checked_at >= 0 and now - checked_at < self.check_interval:
+            return current
+
+        path = pack_path(language, deck_name, self.voice, self.fmt, self.packs_dir)
+        with self._lock:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                self._packs[key] = (None, now)
+                return None
+            if current is not None and current.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                self._packs[key] = (current, now)
+                return current
+            try:
+                pack = AudioPack(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Audio pack {path} is unusable: {e}")
+                pack = None
+            else:
+                logger.info(f"Audio pack {path.name} mapped ({len(pack.entries)} files)")
+            # Старое отображение освобождается, когда его отпустят текущие ответы
+            self._packs[key] = (pack, now)
+            return pack
+
+    def lookup(self, language: str, deck_name: str, filename: str) -> Optional[Tuple[memoryview, Dict]]:
+        pack = self.get(language, deck_name)
+        return pack.get(filename) if pack is not None else None
+
+    def asset_meta(self, language: str, deck_name: str, filename: str) -> Optional[Dict]:
+        """Метаданные файла озвучки: из индекса архива или файла-спутника.
+
+        Файл без спутника (положен вручную или до появления метаданных)
+        анализируется один раз — вызывать не из event loop.
+        """
+        found = self.lookup(language, deck_name, filename)
+        if found is not None and "meta" in found[1]:
+            return found[1]["meta"]
+        try:
+            path = decks.audio_dir(language, deck_name) / filename
+        except KeyError:
+            return None
+        meta = audio_meta.read_sidecar(path)
+        if meta is None and path.is_file():
+            try:
+                meta = audio_meta.write_sidecar(path)
+            except OSError as e:
+                logger.warning(f"Audio metadata for {path} failed: {e}")
+        return meta
+
+    def asset_size(self, language: str, deck_name: str, filename: str) -> int:
+        """Размер готового файла озвучки (в архиве или отдельным файлом); 0 — нет"""
+        found = self.lookup(language, deck_name, filename)
+        if found is not None:
+            return found[1]["length"]
+        try:
+            return (decks.audio_dir(language, deck_name) / filename).stat().st_size
+        except (OSError, KeyError):
+            return 0
+
+
+def build_deck_pack(language: str, deck_name: str, voice: Optional[str] = None, fmt: str = "wav") -> Tuple[Path, Dict]:
+    """Собрать архив колоды из отдельных файлов озвучки её слайдов"""
+    voice = voice or os.getenv("TTS_VOICE", "onyx")
+    source_dir = decks.audio_dir(language, deck_name)
+    files = []
+    assets_meta = {}
+    for position, slide in enumerate(decks.load_slides(language, deck_name)):
+        filename = decks.audio_filename(int(slide.get("id", position + 1)))
+        path = source_dir / filename
+        if path.exists():
+            data = path.read_bytes()
+            files.append((filename, data))
+            asset_meta = audio_meta.read_sidecar(path) or audio_meta.write_sidecar(path, data)
+            if asset_meta is not None:
+                assets_meta[filename] = asset_meta
+    target = pack_path(language, deck_name, voice, fmt)
+    entries = write_pack(
+        target, files,
+        meta={"language": language, "deck": deck_name, "voice": voice, "audio_format": fmt},
+        assets_meta=assets_meta,
+    )
+    return target, entries
@@ -1,17 +1,56 @@
-import redis
 import os
 import hashlib
 import json
-from typing import Optional, Union, cast
+from typing import TYPE_CHECKING, Optional, Union, cast
+
+if TYPE_CHECKING:
+    import redis
+
+from services import tracing
+from services.audio_codec import AudioCodec
+from services.cache_policy import ADHOC, META, QA, PolicyCache
+from services.metrics import CACHE_CODEC_BYTES, CACHE_CODEC_SECONDS, CACHE_REQUESTS, CACHE_SECONDS
+from services.shared_cache import SharedCache
+
 
 class CacheService:
+    """Многоуровневый кеш: память процесса -> общий SQLite узла -> Redis.
+
+    Аудио в SQLite и Redis хранится сжатым (services/audio_codec),
+    в памяти процесса — готовым WAV.
+
+    Каждая запись относится к классу (services/cache_policy): от него
+    зависят время жизни на всех уровнях, его продление при попадании
+    и доля памяти процесса.
+    """
+
     def __init__(self):
-        # Попытка подключения к Redis, но не критично если не установлен
-        self.redis_client: Optional[redis.Redis] = None
+        # Первый уровень — память процесса (работает и без Redis)
+        memory_mb = float(os.getenv('CACHE_MEMORY_MB', '64'))
+        self.memory = PolicyCache(int(memory_mb * 1024 * 1024))
+        self.classes = self.memory.classes
+
+        # Второй уровень — общий для всех воркеров файл SQLite
+        self.shared: Optional[SharedCache] = None
+        if os.getenv('SHARED_CACHE_ENABLED', 'true').strip().lower() in {'1', 'true', 'yes', 'y', 'on'}:
+            try:
+                self.shared = SharedCache()
+            except Exception as e:
+                print(f"⚠️ Общий кеш недоступен: {e}")
+
+        # Redis подключается отдельно (connect), чтобы конструктор не блокировал
+        # импорт и старт приложения; до подключения работают память и SQLite.
+        self.redis_client: Optional["redis.Redis"] = None
         self.enabled = False
-        
+
+        self.audio_codec = AudioCodec()
+
+    def connect(self) -> bool:
+        """Подключиться к Redis (блокирующий вызов; при старте выполняется в фоне)"""
         try:
-            self.redis_client = redis.Redis(
+            import redis
+
+            client = redis.Redis(
                 host=os.getenv('REDIS_HOST', 'localhost'),
                 port=int(os.getenv('REDIS_PORT', 6379)),
                 db=0,
@@ -19,78 +58,224 @@ class CacheService:
                 socket_connect_timeout=2
             )
             # Проверка подключения
-            self.redis_client.ping()
+            client.ping()
+            self.redis_client = client
             self.enabled = True
             print("✅ Redis кеш активирован")
         except Exception as e:
             self.redis_client = None
             self.enabled = False
             print(f"⚠️ Redis не доступен, кеширование отключено: {e}")
+        return self.enabled
 
     def _get_key(self, prefix: str, data: str) -> str:
         """Создать ключ для кеша"""
         hash_obj = hashlib.md5(data.encode())
         return f"{prefix}:{hash_obj.hexdigest()}"
 
-    def get_tts_cache(self, text: str, language: str = 'ky') -> Optional[bytes]:
-        """Получить кешированный TTS аудио"""
+    def _decode(self, key: str, value: bytes, codec: Optional[AudioCodec]) -> Optional[bytes]:
+        """Раскодировать значение общего уровня; битая запись — промах"""
+        if codec is None:
+            return value
+        try:
+            with tracing.span("cache.decode", bytes=len(value)), CACHE_CODEC_SECONDS.time(op="decode"):
+                return codec.decode(value)
+        except Exception as e:
+            print(f"Ошибка декодирования записи кеша {key}: {e}")
+            return None
+
+    def _encode(self, value: bytes, codec: Optional[AudioCodec]) -> bytes:
+        if codec is None:
+            return value
+        with tracing.span("cache.encode", bytes=len(value)), CACHE_CODEC_SECONDS.time(op="encode"):
+            encoded = codec.encode(value)
+        codec_name = codec.name if encoded is not value else "none"
+        CACHE_CODEC_BYTES.inc(len(value), codec=codec_name, stage="raw")
+        CACHE_CODEC_BYTES.inc(len(encoded), codec=codec_name, stage="stored")
+        return encoded
+
+    def _get_bytes(
+        self, key: str, kind: str, entry_class: str, memory: bool = True, codec: Optional[AudioCodec] = None
+    ) -> Optional[bytes]:
+        """Найти значение по уровням, подтягивая найденное в более быстрые"""
+        with tracing.span("cache.get", cache_kind=kind, entry_class=entry_class) as span:
+            value = self._lookup(key, kind, entry_class, memory, codec)
+            span.set_attribute("hit", value is not None)
+            return value
+
+    def _lookup(self, key: str, kind: str, entry_class: str, memory: bool, codec: Optional[AudioCodec]) -> Optional[bytes]:
+        # Скользящий срок: попадание на общем уровне продлевает запись и там
+        cls = self.classes[entry_class]
+        refresh_ttl = cls.ttl if cls.sliding else None
+        if memory:
+            with CACHE_SECONDS.time(tier="memory", op="get"):
+                value = self.memory.get(key)
+            CACHE_REQUESTS.inc(tier="memory", kind=kind, entry_class=entry_class, result="hit" if value is not None else "miss")
+            if value is not None:
+                tracing.current_span().set_attribute("tier", "memory")
+                return value
+
+        if self.shared is not None:
+            try:
+                with tracing.span("cache.shared.get") as span, CACHE_SECONDS.time(tier="shared", op="get"):
+                    value = self.shared.get(key, refresh_ttl=refresh_ttl)
+                    span.set_attribute("hit", value is not None)
+                CACHE_REQUESTS.inc(tier="shared", kind=kind, entry_class=entry_class, result="hit" if value is not None else "miss")
+                if value is not None:
+                    value = self._decode(key, value, codec)
+                if value is not None:
+                    if memory:
+                        self.memory.set(key, value, entry_class)
+                    tracing.current_span().set_attribute("tier", "shared")
+                    return value
+            except Exception as e:
+                print(f"Ошибка чтения общего кеша: {e}")
+
         if not self.enabled or not self.redis_client:
             return None
-        
+
         try:
-            key = self._get_key('tts', f"{language}:{text}")
-            cached = self.redis_client.get(key)
-            if cached:
-                print(f"✅ TTS кеш найден для: {text[:50]}...")
-                return cast(bytes, cached)
-            return None
+            with tracing.span("cache.redis.get", kind=tracing.KIND_CLIENT) as span, CACHE_SECONDS.time(tier="redis", op="get"):
+                if refresh_ttl:
+                    # Чтение и продление одним обращением; EXPIRE на отсутствующий ключ безвреден
+                    pipeline = self.redis_client.pipeline(transaction=False)
+                    pipeline.get(key)
+                    pipeline.expire(key, refresh_ttl)
+                    cached = pipeline.execute()[0]
+                else:
+                    cached = self.redis_client.get(key)
+                span.set_attribute("hit", bool(cached))
+            CACHE_REQUESTS.inc(tier="redis", kind=kind, entry_class=entry_class, result="hit" if cached else "miss")
+            if not cached:
+                return None
+            value = self._decode(key, cast(bytes, cached), codec)
+            if value is not None and memory:
+                self.memory.set(key, value, entry_class)
+            if value is not None:
+                tracing.current_span().set_attribute("tier", "redis")
+            return value
         except Exception as e:
-            print(f"Ошибка чтения TTS кеша: {e}")
+            print(f"Ошибка чтения кеша Redis: {e}")
             return None
 
-    def set_tts_cache(self, text: str, audio_data: bytes, language: str = 'ky', ttl: int = 86400):
-        """Сохранить TTS аудио в кеш"""
+    def _set_bytes(
+        self,
+        key: str,
+        value: bytes,
+        entry_class: str,
+        ttl: Optional[int] = None,
+        memory: bool = True,
+        codec: Optional[AudioCodec] = None,
+    ):
+        """Записать во все уровни; ttl по умолчанию — время жизни класса"""
+        with tracing.span("cache.set", bytes=len(value), entry_class=entry_class):
+            self._store(key, value, entry_class, ttl or self.classes[entry_class].ttl, memory, codec)
+
+    def _store(self, key: str, value: bytes, entry_class: str, ttl: int, memory: bool, codec: Optional[AudioCodec]):
+        if memory:
+            with CACHE_SECONDS.time(tier="memory", op="set"):
+                self.memory.set(key, value, entry_class)
+
+        # Память процесса хранит исходные байты, общие уровни — сжатые
+        if self.shared is not None or (self.enabled and self.redis_client):
+            value = self._encode(value, codec)
+
+        if self.shared is not None:
+            try:
+                with tracing.span("cache.shared.set"), CACHE_SECONDS.time(tier="shared", op="set"):
+                    self.shared.set(key, value, ttl)
+            except Exception as e:
+                print(f"Ошибка записи общего кеша: {e}")
+
         if not self.enabled or not self.redis_client:
             return
-        
+
         try:
-            key = self._get_key('tts', f"{language}:{text}")
-            self.redis_client.setex(key, ttl, audio_data)
-            print(f"✅ TTS сохранен в кеш: {text[:50]}...")
+            with tracing.span("cache.redis.set", kind=tracing.KIND_CLIENT), CACHE_SECONDS.time(tier="redis", op="set"):
+                self.redis_client.setex(key, ttl, value)
         except Exception as e:
-            print(f"Ошибка записи TTS кеша: {e}")
+            print(f"Ошибка записи кеша Redis: {e}")
 
-    def get_qa_cache(self, question: str, slide_id: int) -> Optional[dict]:
-        """Получить кешированный ответ на вопрос"""
-        if not self.enabled or not self.redis_client:
+    def tts_key(self, text: str, language: str = 'ky') -> str:
+        """Ключ TTS-кеша (он же ключ дедупликации синтеза)"""
+        return self._get_key('tts', f"{language}:{text}")
+
+    def has_tts_cache(self, text: str, language: str = 'ky') -> bool:
+        """Есть ли аудио в быстром уровне кеша (без обращения к Redis)"""
+        return self.tts_key(text, language) in self.memory
+
+    def get_tts_cache(self, text: str, language: str = 'ky', entry_class: str = ADHOC) -> Optional[bytes]:
+        """Получить кешированный TTS аудио"""
+        return self._get_bytes(self.tts_key(text, language), "tts", entry_class, codec=self.audio_codec)
+
+    def get_tts_cache_shared(self, text: str, language: str = 'ky', entry_class: str = ADHOC) -> Optional[bytes]:
+        """Проверить только общие уровни (после ожидания другого воркера)"""
+        key = self.tts_key(text, language)
+        value = self._get_bytes(key, "tts", entry_class, memory=False, codec=self.audio_codec)
+        if value is not None:
+            self.memory.set(key, value, entry_class)
+        return value
+
+    def set_tts_cache(
+        self, text: str, audio_data: bytes, language: str = 'ky', entry_class: str = ADHOC, ttl: Optional[int] = None
+    ):
+        """Сохранить TTS аудио в кеш"""
+        self._set_bytes(self.tts_key(text, language), audio_data, entry_class, ttl, codec=self.audio_codec)
+
+    def get_tts_meta(self, text: str, language: str = 'ky') -> Optional[dict]:
+        """Метаданные кешированного TTS аудио (services/audio_meta)"""
+        cached = self._get_bytes(self._get_key('ttsmeta', f"{language}:{text}"), "tts_meta", META)
+        if cached is None:
             return None
-        
         try:
-            key = self._get_key('qa', f"{slide_id}:{question}")
-            cached = self.redis_client.get(key)
-            if cached:
-                print(f"✅ QA кеш найден для вопроса: {question[:50]}...")
-                cached_bytes = cast(bytes, cached)
-                return json.loads(cached_bytes.decode('utf-8'))
+            return json.loads(cached.decode('utf-8'))
+        except Exception as e:
+            print(f"Ошибка чтения метаданных TTS: {e}")
             return None
+
+    def set_tts_meta(self, text: str, meta: dict, language: str = 'ky', ttl: Optional[int] = None):
+        data = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        self._set_bytes(self._get_key('ttsmeta', f"{language}:{text}"), data, META, ttl)
+
+    def qa_key(self, question: str, slide_id: int, language: str = 'ky', deck: str = '', context: str = '') -> str:
+        """Ключ ответа: id слайдов в разных колодах совпадают, а ответ
+        зависит от контекста слайда — они входят в ключ (под хешем)"""
+        context_hash = hashlib.md5(" ".join(context.split()).encode()).hexdigest()
+        return self._get_key('qa', f"{language}:{deck}:{slide_id}:{context_hash}:{question.strip().lower()}")
+
+    def get_qa_cache(self, question: str, slide_id: int, language: str = 'ky', deck: str = '', context: str = '') -> Optional[dict]:
+        """Получить кешированный ответ на вопрос"""
+        cached = self._get_bytes(self.qa_key(question, slide_id, language, deck, context), "qa", QA)
+        if cached is None:
+            return None
+        try:
+            return json.loads(cached.decode('utf-8'))
         except Exception as e:
             print(f"Ошибка чтения QA кеша: {e}")
             return None
 
-    def set_qa_cache(self, question: str, slide_id: int, answer: dict, ttl: int = 3600):
+    def set_qa_cache(
+        self,
+        question: str,
+        slide_id: int,
+        answer: dict,
+        language: str = 'ky',
+        ttl: Optional[int] = None,
+        deck: str = '',
+        context: str = '',
+    ):
         """Сохранить ответ на вопрос в кеш"""
-        if not self.enabled or not self.redis_client:
-            return
-        
-        try:
-            key = self._get_key('qa', f"{slide_id}:{question}")
-            self.redis_client.setex(key, ttl, json.dumps(answer))
-            print(f"✅ QA ответ сохранен в кеш")
-        except Exception as e:
-            print(f"Ошибка записи QA кеша: {e}")
+        data = json.dumps(answer, ensure_ascii=False).encode('utf-8')
+        self._set_bytes(self.qa_key(question, slide_id, language, deck, context), data, QA, ttl)
 
     def clear_cache(self, pattern: str = "*"):
-        """Очистить кеш по шаблону"""
+        """Очистить кеш по шаблону (память и общий SQLite очищаются целиком)"""
+        self.memory.clear()
+        if self.shared is not None:
+            try:
+                self.shared.clear()
+            except Exception as e:
+                print(f"Ошибка очистки общего кеша: {e}")
         if not self.enabled or not self.redis_client:
             return
         
@@ -102,6 +287,3 @@ class CacheService:
                 print(f"✅ Очищено {len(keys)} ключей из кеша")
         except Exception as e:
             print(f"Ошибка очистки кеша: {e}")
-
-# Создать глобальный экземпляр
-cache_service = CacheService()
@@ -0,0 +1,276 @@
+"""Политика кеша в памяти процесса: классы записей и допуск по частоте.
+
+Записи делятся на классы с разным временем жизни и долей памяти:
+
+    narration  озвучка слайдов — её переигрывает каждая сессия
+    answer     озвучка ответов на вопросы
+    adhoc      прочий синтез (/api/tts с произвольным текстом, задачи)
+    qa         тексты ответов LLM
+    meta       метаданные озвучки (services/audio_meta)
+
+Доля класса — гарантированный объём: пока класс в неё укладывается,
+новая запись вытесняет записи классов, вышедших за свою долю. Свободную
+память класс может занимать и сверх доли.
+
+Сверх доли действует допуск TinyLFU: частота обращений к ключам
+приблизительно считается в count-min sketch (4 строки 4-битных
+счётчиков, периодически делятся пополам — старая популярность забывается).
+Новая запись вытесняет давно не читанные записи (сначала классов, занявших
+память сверх своей доли, затем своего класса), только если к ней
+обращались чаще, чем к каждой из них. Поэтому разовые запросы не
+выталкивают озвучку, которую проигрывают весь день.
+
+Срок жизни классов со скользящим сроком продлевается при каждом попадании.
+
+Настройки (NAME — имя класса в верхнем регистре):
+    CACHE_CLASS_<NAME>_TTL=        время жизни, секунды
+    CACHE_CLASS_<NAME>_SHARE=      доля памяти процесса (0..1)
+    CACHE_CLASS_<NAME>_SLIDING=    продлевать срок при попадании
+    CACHE_SKETCH_WIDTH=4096        счётчиков в строке sketch (степень двойки)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from services.metrics import CACHE_ADMISSIONS, CACHE_EVICTIONS, CACHE_MEMORY_BYTES, CACHE_MEMORY_ENTRIES
+
+NARRATION = "narration"
+ANSWER = "answer"
+ADHOC = "adhoc"
+QA = "qa"
+META = "meta"
+
+
+class EntryClass(NamedTuple):
+    name: str
+    ttl: int
+    share: float
+    sliding: bool
+
+
+# имя -> (время жизни, доля памяти, скользящий срок)
+_DEFAULTS: Dict[str, Tuple[int, float, bool]] = {
+    NARRATION: (7 * 86400, 0.5, True),
+    ANSWER: (86400, 0.2, True),
+    ADHOC: (6 * 3600, 0.15, False),
+    QA: (86400, 0.05, True),
+    META: (7 * 86400, 0.1, True),
+}
+
+
+def load_classes() -> Dict[str, EntryClass]:
+    classes = {}
+    for name, (ttl, share, sliding) in _DEFAULTS.items():
+        prefix = f"CACHE_CLASS_{name.upper()}_"
+        classes[name] = EntryClass(
+            name=name,
+            ttl=int(os.getenv(prefix + "TTL", str(ttl))),
+            share=float(os.getenv(prefix + "SHARE", str(share))),
+            sliding=os.getenv(prefix + "SLIDING", "true" if sliding else "false").strip().lower() in {"1", "true", "yes", "y", "on"},
+        )
+    return classes
+
+
+# Таблица для деления всех счётчиков пополам одним bytes.translate
+_HALVE = bytes(i >> 1 for i in range(256))
+_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+_MASK64 = (1 << 64) - 1
+
+
+class FrequencySketch:
+    """Приблизительные частоты ключей (count-min sketch с «старением»)"""
+
+    def __init__(self, width: int = 4096, max_count: int = 15):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.max_count = max_count
+        self._table = bytearray(self.width * len(_SEEDS))
+        self._additions = 0
+        # Через столько приращений все счётчики делятся пополам
+        self.sample_size = 10 * self.width
+
+    def _indexes(self, key: str) -> List[int]:
+        h = hash(key) & _MASK64
+        shift = 64 - self.width.bit_length() + 1
+        return [row * self.width + (((h * seed) & _MASK64) >> shift) for row, seed in enumerate(_SEEDS)]
+
+    def increment(self, key: str):
+        table = self._table
+        added = False
+        for i in self._indexes(key):
+            if table[i] < self.max_count:
+                table[i] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._table = bytearray(self._table.translate(_HALVE))
+                self._additions //= 2
+
+    def frequency(self, key: str) -> int:
+        table = self._table
+        return min(table[i] for i in self._indexes(key))
+
+
+class PolicyCache:
+    """Кеш байтов в памяти процесса с классами записей и допуском TinyLFU"""
+
+    def __init__(self, max_bytes: int, classes: Optional[Dict[str, EntryClass]] = None, sketch_width: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.classes = classes or load_classes()
+        self.sketch = FrequencySketch(sketch_width or int(os.getenv("CACHE_SKETCH_WIDTH", "4096")))
+        self.size = 0
+        self._sizes: Dict[str, int] = {name: 0 for name in self.classes}
+        # Класс -> ключ -> (значение, когда истекает); порядок — от давно читанных
+        self._items: Dict[str, "OrderedDict[str, Tuple[bytes, float]]"] = {name: OrderedDict() for name in self.classes}
+        self._where: Dict[str, str] = {}
+        # Счётчики для stats(): попадания, решения допуска, вытеснения
+        self._counters: Dict[str, Dict[str, int]] = {
+            name: {"hits": 0, "admitted": 0, "rejected": 0, "evicted": 0} for name in self.classes
+        }
+        self._lock = threading.Lock()
+
+    def budget(self, entry_class: str) -> int:
+        return int(self.max_bytes * self.classes[entry_class].share)
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            self.sketch.increment(key)
+            name = self._where.get(key)
+            if name is None:
+                return None
+            items = self._items[name]
+            value, expires_at = items[key]
+            if expires_at <= now:
+                self._remove(name, key)
+                CACHE_EVICTIONS.inc(entry_class=name, reason="expired")
+                self._counters[name]["evicted"] += 1
+                self._report(name)
+                return None
+            entry_class = self.classes[name]
+            if entry_class.sliding:
+                items[key] = (value, now + entry_class.ttl)
+            items.move_to_end(key)
+            self._counters[name]["hits"] += 1
+            return value
+
+    def set(self, key: str, value: bytes, entry_class: str):
+        cls = self.classes[entry_class]
+        size = len(value)
+        with self._lock:
+            old_class = self._where.get(key)
+            if old_class is not None:
+                # Старое значение убирается, новое проходит обычный допуск
+                self._remove(old_class, key)
+                self._report(old_class)
+            if size > self.max_bytes:
+                CACHE_ADMISSIONS.inc(entry_class=entry_class, result="too_large")
+                self._counters[entry_class]["rejected"] += 1
+                return
+            victims = self._select_victims(entry_class, key, size)
+            if victims is None:
+                CACHE_ADMISSIONS.inc(entry_class=entry_class, result="rejected")
+                self._counters[entry_class]["rejected"] += 1
+                return
+            touched = {entry_class}
+            for victim_class, victim_key, reason in victims:
+                self._remove(victim_class, victim_key)
+                CACHE_EVICTIONS.inc(entry_class=victim_class, reason=reason)
+                self._counters[victim_class]["evicted"] += 1
+                touched.add(victim_class)
+            self._items[entry_class][key] = (value, time.time() + cls.ttl)
+            self._where[key] = entry_class
+            self._sizes[entry_class] += size
+            self.size += size
+            CACHE_ADMISSIONS.inc(entry_class=entry_class, result="admitted")
+            self._counters[entry_class]["admitted"] += 1
+            for name in touched:
+                self._report(name)
+
+    def _select_victims(self, entry_class: str, key: str, size: int) -> Optional[List[Tuple[str, str, str]]]:
+        """Что вытеснить ради новой записи: [(класс, ключ, причина)]; None — не допускать"""
+        needed = self.size + size - self.max_bytes
+        if needed <= 0:
+            return []
+        now = time.time()
+        victims: List[Tuple[str, str, str]] = []
+        chosen = set()
+        freed = 0
+
+        # Сначала — истёкшие записи любых классов. Они копятся в начале
+        # порядка: при скользящем сроке он совпадает с порядком истечения
+        for name, items in self._items.items():
+            for victim_key, (value, expires_at) in items.items():
+                if freed >= needed:
+                    return victims
+                if expires_at > now:
+                    break
+                victims.append((name, victim_key, "expired"))
+                chosen.add(victim_key)
+                freed += len(value)
+
+        # Класс в пределах своей доли вытесняет записи классов, вышедших
+        # за свою, без сравнения частот. Иначе — допуск TinyLFU: новая запись
+        # должна быть популярнее каждой вытесняемой. Кандидаты — давно
+        # не читанные записи классов сверх доли, затем своего класса
+        within_budget = self._sizes[entry_class] + size <= self.budget(entry_class)
+        frequency = self.sketch.frequency(key)
+        over = {name: self._sizes[name] - self.budget(name) for name in self.classes}
+        order = sorted((name for name in self.classes if name != entry_class and over[name] > 0), key=over.get, reverse=True)
+        for name in order + [entry_class]:
+            for victim_key, (value, _) in self._items[name].items():
+                if freed >= needed:
+                    return victims
+                if name != entry_class and over[name] <= 0:
+                    break
+                if victim_key in chosen:
+                    continue
+                if not within_budget and self.sketch.frequency(victim_key) >= frequency:
+                    return None
+                victims.append((name, victim_key, "capacity"))
+                chosen.add(victim_key)
+                freed += len(value)
+                over[name] -= len(value)
+        return victims if freed >= needed else None
+
+    def _remove(self, entry_class: str, key: str):
+        value, _ = self._items[entry_class].pop(key)
+        del self._where[key]
+        self._sizes[entry_class] -= len(value)
+        self.size -= len(value)
+
+    def _report(self, entry_class: str):
+        CACHE_MEMORY_BYTES.set(self._sizes[entry_class], entry_class=entry_class)
+        CACHE_MEMORY_ENTRIES.set(len(self._items[entry_class]), entry_class=entry_class)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            name = self._where.get(key)
+            return name is not None and self._items[name][key][1] > time.time()
+
+    def clear(self):
+        with self._lock:
+            for name, items in self._items.items():
+                items.clear()
+                self._sizes[name] = 0
+                self._report(name)
+            self._where.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Dict]:
+        """Объём, число записей, доля, срок жизни и счётчики по классам
+        (для /cache/stats; счётчики — с запуска процесса)"""
+        with self._lock:
+            return {
+                name: {
+                    "entries": len(self._items[name]),
+                    "bytes": self._sizes[name],
+                    "budget_bytes": self.budget(name),
+                    "ttl": cls.ttl,
+                    "sliding": cls.sliding,
+                    **self._counters[name],
+                }
+                for name, cls in self.classes.items()
+            }
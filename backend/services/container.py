@@ -0,0 +1,193 @@
+"""Единые экземпляры сервисов приложения.
+
+Сервисы создаются лениво при первом обращении и переиспользуются всеми
+роутерами (через FastAPI Depends). Геттеры вызываются из разных потоков
+(цикл событий, пул потоков FastAPI для синхронных зависимостей, фоновая
+проверка ниже), поэтому создание идёт под общей блокировкой — иначе два
+потока могли бы создать два экземпляра одного сервиса. Блокирующие
+проверки зависимостей (Redis, импорт SDK OpenAI) выполняются в фоне
+после старта приложения — см. `probe_dependencies` и эндпоинт /ready.
+"""
+import asyncio
+import functools
+import importlib.util
+import logging
+import threading
+import time
+from typing import Callable, Dict, TypeVar
+
+from services.admission import AdmissionService
+from services.audio_pack import AudioPackRegistry
+from services.cache import CacheService
+from services.faq import FAQService
+from services.huggingface_tts import HuggingFaceTTS
+from services.jobs import JobManager, JobStore
+from services.openai_qa import OpenAIQA
+from services.sessions import SessionHub, SessionStore
+from services.singleflight import SingleFlight
+from services.speech import SpeechService
+from services.warmup import WarmupScheduler
+from services.whisper_stt import WhisperSTT
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Реентерабельная: геттеры вызывают друг друга (get_session_hub -> get_warmup_scheduler)
+_construct_lock = threading.RLock()
+
+
+def _singleton(factory: Callable[[], T]) -> Callable[[], T]:
+    """lru_cache, у которого создание экземпляра не гоняется между потоками"""
+    cached = functools.lru_cache(maxsize=None)(factory)
+
+    @functools.wraps(factory)
+    def getter() -> T:
+        if cached.cache_info().currsize:
+            return cached()
+        with _construct_lock:
+            return cached()
+
+    getter.cache_info = cached.cache_info  # type: ignore[attr-defined]
+    getter.cache_clear = cached.cache_clear  # type: ignore[attr-defined]
+    return getter
+
+
+@_singleton
+def get_cache_service() -> CacheService:
+    return CacheService()
+
+
+@_singleton
+def get_tts_service() -> HuggingFaceTTS:
+    return HuggingFaceTTS()
+
+
+@_singleton
+def get_qa_service() -> OpenAIQA:
+    return OpenAIQA()
+
+
+@_singleton
+def get_stt_service() -> WhisperSTT:
+    return WhisperSTT()
+
+
+@_singleton
+def get_faq_service() -> FAQService:
+    return FAQService()
+
+
+@_singleton
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+
+@_singleton
+def get_admission_service() -> AdmissionService:
+    return AdmissionService()
+
+
+@_singleton
+def get_audio_pack_registry() -> AudioPackRegistry:
+    return AudioPackRegistry()
+
+
+@_singleton
+def get_speech_service() -> SpeechService:
+    return SpeechService(get_tts_service(), get_cache_service(), get_single_flight())
+
+
+@_singleton
+def get_warmup_scheduler() -> WarmupScheduler:
+    return WarmupScheduler(get_speech_service(), get_faq_service(), get_audio_pack_registry())
+
+
+@_singleton
+def get_job_manager() -> JobManager:
+    return JobManager(JobStore(), get_speech_service(), get_admission_service())
+
+
+@_singleton
+def get_session_hub() -> SessionHub:
+    return SessionHub(SessionStore(), get_warmup_scheduler(), get_audio_pack_registry())
+
+
+# Состояние фоновой проверки зависимостей (для /ready)
+readiness: Dict = {
+    "ready": False,
+    "started_at": time.time(),
+    "dependencies": {},
+}
+
+
+_OPTIONAL_MODULES = {
+    "numpy": "audio metadata and cache audio codec use the pure-Python path (several times slower)",
+    "zstandard": "cache audio codec falls back to zlib (larger shared cache entries)",
+}
+
+
+def _probe_sync() -> Dict[str, Dict]:
+    results: Dict[str, Dict] = {}
+
+    start = time.perf_counter()
+    cache = get_cache_service()
+    redis_ok = cache.connect()
+    results["redis"] = {
+        "status": "ok" if redis_ok else "unavailable",
+        "required": False,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    # Создание сервисов подтягивает SDK OpenAI — делаем это до первого запроса
+    start = time.perf_counter()
+    tts = get_tts_service()
+    qa = get_qa_service()
+    stt = get_stt_service()
+    openai_ok = bool(tts.client) and qa.available and stt.available
+    results["openai"] = {
+        "status": "ok" if openai_ok else "unavailable",
+        "required": False,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    # Необязательные ускорители: без них сервис работает, но медленнее/крупнее
+    for module, degradation in _OPTIONAL_MODULES.items():
+        installed = importlib.util.find_spec(module) is not None
+        results[module] = {"status": "ok" if installed else "missing", "required": False}
+        if not installed:
+            logger.warning(f"{module} is not installed: {degradation}")
+    return results
+
+
+async def probe_dependencies():
+    """Проверить зависимости в фоне, не задерживая старт приложения"""
+    try:
+        readiness["dependencies"] = await asyncio.to_thread(_probe_sync)
+    except Exception as e:
+        logger.exception("Dependency probe failed")
+        readiness["dependencies"] = {"probe": {"status": "error", "error": str(e)}}
+    readiness["ready"] = True
+    readiness["ready_at"] = time.time()
+
+
+async def start_background():
+    """Фоновый старт: проверка зависимостей, затем воркеры задач
+    (им нужно продолжить задачи, оставшиеся в очереди с прошлого запуска)"""
+    await probe_dependencies()
+    try:
+        get_job_manager().start()
+    except Exception:
+        logger.exception("Failed to start job workers")
+
+
+async def shutdown():
+    if get_session_hub.cache_info().currsize:
+        await get_session_hub().stop()
+    if get_job_manager.cache_info().currsize:
+        await get_job_manager().stop()
+    if get_warmup_scheduler.cache_info().currsize:
+        await get_warmup_scheduler().stop()
+    if get_cache_service.cache_info().currsize and get_cache_service().shared is not None:
+        # Отметки о чтении, ещё не записанные в общий кеш
+        get_cache_service().shared.flush_touches()
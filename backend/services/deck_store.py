@@ -0,0 +1,234 @@
+"""Хранилище колод в SQLite с индексом по (язык, колода, позиция).
+
+Источник правды — JSON-файлы колод:
+    * встроенные колоды из `decks.SLIDES_FILES`;
+    * любые файлы data/decks/<язык>/<колода>.json (озвучка для них
+      ищется в data/audio/<язык>/<колода>/).
+
+Файл импортируется в базу при первом обращении к колоде и повторно —
+если изменилось время модификации JSON. Запросы к колоде — это выборка
+по индексу с LIMIT/OFFSET, поэтому их стоимость не зависит от числа
+колод; список колод берётся из таблицы decks без чтения слайдов.
+
+Настройки:
+    DECK_STORE_PATH=data/cache/decks.sqlite3
+    DECK_STORE_RESCAN_SECONDS=60   как часто искать новые JSON в data/decks
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decks (
+    language TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    title TEXT,
+    meta TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    source_mtime REAL NOT NULL,
+    audio_subdir TEXT NOT NULL,
+    slide_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (language, deck)
+);
+CREATE TABLE IF NOT EXISTS slides (
+    language TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    slide_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (language, deck, position)
+);
+CREATE INDEX IF NOT EXISTS slides_by_id ON slides(language, deck, slide_id);
+"""
+
+
+def project(slide: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Оставить в слайде только запрошенные поля"""
+    if not fields:
+        return slide
+    return {name: slide[name] for name in fields if name in slide}
+
+
+class DeckStore:
+    def __init__(self, path: Optional[Path] = None, sources: Optional[Dict[Tuple[str, str], Tuple[Path, str]]] = None,
+                 decks_dir: Optional[Path] = None):
+        from services import decks
+
+        self.path = Path(path or os.getenv("DECK_STORE_PATH", "") or decks.DATA_DIR / "cache" / "decks.sqlite3")
+        # (язык, колода) -> (JSON, подпапка озвучки); псевдонимы вроде ru/default
+        # не импортируются отдельно — их разрешает decks.normalize_deck
+        self.builtin = sources if sources is not None else decks.builtin_sources()
+        self.decks_dir = Path(decks_dir or decks.DECKS_DIR)
+        self.rescan_seconds = float(os.getenv("DECK_STORE_RESCAN_SECONDS", "60"))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- импорт ---
+
+    def _sources(self) -> Dict[Tuple[str, str], Tuple[Path, str]]:
+        sources = dict(self.builtin)
+        if self.decks_dir.is_dir():
+            for path in sorted(self.decks_dir.glob("*/*.json")):
+                key = (path.parent.name.lower(), path.stem.lower())
+                sources.setdefault(key, (path, f"{key[0]}/{key[1]}"))
+        return sources
+
+    def import_json(self, language: str, deck: str, path: Path, audio_subdir: str):
+        """(Пере)импортировать колоду из JSON"""
+        mtime = path.stat().st_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        slides = data.get("slides", [])
+        meta = {k: v for k, v in data.items() if k != "slides"}
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM slides WHERE language = ? AND deck = ?", (language, deck))
+            conn.executemany(
+                "INSERT INTO slides (language, deck, position, slide_id, data) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (language, deck, position, int(slide.get("id", position + 1)), json.dumps(slide, ensure_ascii=False))
+                    for position, slide in enumerate(slides)
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO decks (language, deck, title, meta, source_path, source_mtime, "
+                "audio_subdir, slide_count, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (language, deck, meta.get("title"), json.dumps(meta, ensure_ascii=False), str(path), mtime,
+                 audio_subdir, len(slides), time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Deck {language}/{deck} imported ({len(slides)} slides)")
+
+    def _refresh(self, language: str, deck: str, path: Path, audio_subdir: str):
+        """Импортировать, если JSON новее записи в базе"""
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        row = self._connect().execute(
+            "SELECT source_mtime FROM decks WHERE language = ? AND deck = ?", (language, deck)
+        ).fetchone()
+        if row is None or row[0] != mtime:
+            with self._lock:
+                self.import_json(language, deck, path, audio_subdir)
+
+    def sync(self, force: bool = False):
+        """Подтянуть все колоды из JSON (новые и изменённые)"""
+        now = time.monotonic()
+        if not force and now - self._last_scan < self.rescan_seconds:
+            return
+        self._last_scan = now
+        for (language, deck), (path, audio_subdir) in self._sources().items():
+            try:
+                self._refresh(language, deck, path, audio_subdir)
+            except (OSError, ValueError) as e:
+                logger.error(f"Deck {language}/{deck} import failed: {e}")
+
+    def _ensure(self, language: str, deck: str):
+        self.sync()
+        source = self.builtin.get((language, deck))
+        if source is None:
+            candidate = self.decks_dir / language / f"{deck}.json"
+            source = (candidate, f"{language}/{deck}") if candidate.exists() else None
+        if source is not None:
+            self._refresh(language, deck, *source)
+
+    # --- запросы ---
+
+    def list_decks(self, language: Optional[str] = None) -> List[Dict[str, Any]]:
+        self.sync()
+        query = "SELECT language, deck, title, slide_count FROM decks"
+        params: Tuple = ()
+        if language:
+            query += " WHERE language = ?"
+            params = (language,)
+        rows = self._connect().execute(query + " ORDER BY language, deck", params).fetchall()
+        return [{"language": r[0], "deck": r[1], "title": r[2], "total": r[3]} for r in rows]
+
+    def languages(self) -> List[str]:
+        self.sync()
+        return [r[0] for r in self._connect().execute("SELECT DISTINCT language FROM decks")]
+
+    def has_deck(self, language: str, deck: str) -> bool:
+        return self.get_deck(language, deck) is not None
+
+    def get_deck(self, language: str, deck: str) -> Optional[Dict[str, Any]]:
+        """Метаданные колоды (без слайдов)"""
+        self._ensure(language, deck)
+        row = self._connect().execute(
+            "SELECT meta, source_path, audio_subdir, slide_count FROM decks WHERE language = ? AND deck = ?",
+            (language, deck),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "meta": json.loads(row[0]),
+            "source_path": Path(row[1]),
+            "audio_subdir": row[2],
+            "total": row[3],
+        }
+
+    def find_by_audio_subdir(self, audio_subdir: str) -> Optional[Tuple[str, str]]:
+        """(язык, колода), чья озвучка лежит в data/audio/<audio_subdir>"""
+        self.sync()
+        row = self._connect().execute(
+            "SELECT language, deck FROM decks WHERE audio_subdir = ? ORDER BY language, deck LIMIT 1", (audio_subdir,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def get_slides(
+        self,
+        language: str,
+        deck: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """(всего слайдов, слайды страницы)"""
+        info = self.get_deck(language, deck)
+        if info is None:
+            raise FileNotFoundError(f"Deck {language}/{deck} not found")
+        rows = self._connect().execute(
+            "SELECT data FROM slides WHERE language = ? AND deck = ? AND position >= ? ORDER BY position LIMIT ?",
+            (language, deck, max(0, offset), -1 if limit is None else limit),
+        ).fetchall()
+        return info["total"], [project(json.loads(r[0]), fields) for r in rows]
+
+    def get_slide_at(self, language: str, deck: str, position: int, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Слайд по позиции (0-based)"""
+        self._ensure(language, deck)
+        row = self._connect().execute(
+            "SELECT data FROM slides WHERE language = ? AND deck = ? AND position = ?", (language, deck, position)
+        ).fetchone()
+        return project(json.loads(row[0]), fields) if row else None
+
+
+@lru_cache(maxsize=None)
+def get_deck_store() -> DeckStore:
+    return DeckStore()
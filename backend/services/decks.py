@@ -0,0 +1,136 @@
+"""Реестр презентаций (язык + колода) и путей к их данным.
+
+Используется роутерами, генератором аудио и FAQ-индексом, чтобы
+соответствие «язык/колода -> файл слайдов / папка аудио» было в одном месте.
+
+Колоды читаются из индексированного хранилища (services/deck_store.py),
+которое импортирует встроенные JSON ниже и файлы data/decks/<язык>/<колода>.json.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.deck_store import get_deck_store
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+AUDIO_DIR = DATA_DIR / "audio"
+FAQ_DIR = DATA_DIR / "faq"
+# Дополнительные колоды: data/decks/<язык>/<колода>.json
+DECKS_DIR = DATA_DIR / "decks"
+
+# Путь к файлам со слайдами (lang + deck)
+SLIDES_FILES: Dict[str, Dict[str, Path]] = {
+    "ky": {
+        "default": DATA_DIR / "slides.json",
+    },
+    "ru": {
+        "rights": DATA_DIR / "slides_ru.json",
+        "mvd": DATA_DIR / "slides_ru_mvd.json",
+        "default": DATA_DIR / "slides_ru.json",
+    },
+}
+
+# Папки с готовой озвучкой относительно data/audio (lang + deck)
+AUDIO_SUBDIRS: Dict[str, Dict[str, str]] = {
+    "ky": {
+        "default": "",
+    },
+    "ru": {
+        "rights": "ru",
+        "mvd": "ru/mvd",
+        "default": "ru",
+    },
+}
+
+
+# Колоды по умолчанию для языков (ru "default" — это та же колода, что и "rights")
+DEFAULT_DECKS: Dict[str, str] = {
+    "ky": "default",
+    "ru": "rights",
+}
+
+
+def builtin_sources() -> Dict[Tuple[str, str], Tuple[Path, str]]:
+    """Встроенные колоды для импорта: (язык, колода) -> (JSON, подпапка озвучки).
+
+    Псевдонимы (колода с тем же файлом, что и колода по умолчанию) пропускаются.
+    """
+    sources: Dict[Tuple[str, str], Tuple[Path, str]] = {}
+    for language, files in SLIDES_FILES.items():
+        default_deck = DEFAULT_DECKS.get(language)
+        for deck_name, path in files.items():
+            if deck_name != default_deck and default_deck in files and files[default_deck] == path:
+                continue
+            sources[(language, deck_name)] = (path, AUDIO_SUBDIRS[language][deck_name])
+    return sources
+
+
+def normalize_lang(lang: Optional[str]) -> str:
+    normalized = (lang or "ky").strip().lower()
+    if normalized in SLIDES_FILES or normalized in get_deck_store().languages():
+        return normalized
+    return "ky"
+
+
+def normalize_deck(language: str, deck: Optional[str]) -> str:
+    default_deck = DEFAULT_DECKS.get(language, "default")
+    normalized = (deck or "default").strip().lower()
+    if normalized == "default":
+        normalized = default_deck
+    if get_deck_store().has_deck(language, normalized):
+        return normalized
+
+    # Backward compatible default behavior
+    if language in DEFAULT_DECKS or get_deck_store().has_deck(language, default_deck):
+        return default_deck
+    decks = get_deck_store().list_decks(language)
+    return decks[0]["deck"] if decks else default_deck
+
+
+def resolve_deck(lang: Optional[str], deck: Optional[str]) -> tuple[str, str]:
+    """Нормализовать пару (язык, колода)"""
+    language = normalize_lang(lang)
+    return language, normalize_deck(language, deck)
+
+
+def _deck_info(language: str, deck_name: str) -> Dict:
+    info = get_deck_store().get_deck(language, deck_name)
+    if info is None:
+        raise FileNotFoundError(f"Deck {language}/{deck_name} not found")
+    return info
+
+
+def slides_file(language: str, deck_name: str) -> Path:
+    return _deck_info(language, deck_name)["source_path"]
+
+
+def audio_dir(language: str, deck_name: str) -> Path:
+    subdir = _deck_info(language, deck_name)["audio_subdir"]
+    return AUDIO_DIR / subdir if subdir else AUDIO_DIR
+
+
+def audio_filename(slide_id: int) -> str:
+    return f"slide_{slide_id:02d}.wav"
+
+
+def faq_index_file(language: str, deck_name: str) -> Path:
+    return FAQ_DIR / f"{language}_{deck_name}.json"
+
+
+def faq_audio_dir(language: str, deck_name: str) -> Path:
+    return AUDIO_DIR / "faq" / language / deck_name
+
+
+def load_deck(language: str, deck_name: str) -> Dict:
+    """Колода целиком (title, language, slides, ...)"""
+    deck = dict(_deck_info(language, deck_name)["meta"])
+    deck["slides"] = load_slides(language, deck_name)
+    return deck
+
+
+def load_slides(language: str, deck_name: str) -> List[Dict]:
+    return get_deck_store().get_slides(language, deck_name)[1]
+
+
+def speak_text(slide: Dict) -> str:
+    """Текст, который озвучивается для слайда (как во фронтенде: tts ?? content)"""
+    return slide.get("tts") or slide.get("content") or ""
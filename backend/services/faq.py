@@ -0,0 +1,171 @@
+"""Индекс заранее подготовленных ответов на частые вопросы (FAQ).
+
+Индекс строится офлайн (`generate_all_audio.py --faq`) из поля `faq`
+слайдов и хранится в data/faq/<lang>_<deck>.json. Озвучка ответов лежит
+в data/audio/faq/<lang>/<deck>/ и раздаётся также через /audio.
+
+/api/qa сначала ищет вопрос в индексе и только при промахе идёт в LLM.
+"""
+import json
+import logging
+import os
+import re
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.decks import AUDIO_DIR, faq_index_file
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Привести вопрос к виду для сравнения: регистр, ё, пунктуация, пробелы"""
+    q = (text or "").lower().replace("ё", "е")
+    q = _PUNCT_RE.sub(" ", q)
+    return _SPACE_RE.sub(" ", q).strip()
+
+
+def question_similarity(a: str, b: str) -> float:
+    """Похожесть двух нормализованных вопросов (0..1)"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    ratio = SequenceMatcher(None, a, b).ratio()
+    return max(jaccard, ratio)
+
+
+def group_similar_questions(questions: List[str], threshold: float = 0.9) -> List[List[int]]:
+    """Сгруппировать почти одинаковые вопросы: [[индексы группы], ...].
+
+    Группа — первый вопрос и все похожие на него не меньше threshold;
+    порядок групп и индексов внутри — как во входном списке. Пустые
+    вопросы получают отдельные группы.
+    """
+    groups: List[List[int]] = []
+    representatives: List[str] = []
+    for i, question in enumerate(questions):
+        normalized = normalize_question(question)
+        for group, representative in zip(groups, representatives):
+            if normalized and question_similarity(normalized, representative) >= threshold:
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+            representatives.append(normalized)
+    return groups
+
+
+def iter_slide_faq(slide: Dict) -> List[Dict]:
+    """Вопросы слайда в едином виде: {"question", "answer"?, "variants"}
+
+    В JSON колоды поле `faq` может быть списком строк или объектов
+    {"question": "...", "answer": "...", "variants": ["..."]}.
+    """
+    items: List[Dict] = []
+    for raw in slide.get("faq") or []:
+        if isinstance(raw, str):
+            item = {"question": raw}
+        elif isinstance(raw, dict) and raw.get("question"):
+            item = dict(raw)
+        else:
+            continue
+        item["question"] = str(item["question"]).strip()
+        item["variants"] = [str(v).strip() for v in item.get("variants") or [] if str(v).strip()]
+        if item["question"]:
+            items.append(item)
+    return items
+
+
+class FAQIndex:
+    """Индекс FAQ одной колоды"""
+
+    def __init__(self, entries: List[Dict], language: str, deck: str):
+        self.language = language
+        self.deck = deck
+        self.entries = entries
+        # (нормализованный вопрос, индекс записи) — включая варианты формулировок
+        self._keys: List[Tuple[str, int]] = []
+        for i, entry in enumerate(entries):
+            for q in [entry.get("question", "")] + list(entry.get("variants") or []):
+                normalized = normalize_question(q)
+                if normalized:
+                    self._keys.append((normalized, i))
+
+    @classmethod
+    def load(cls, path: Path, language: str, deck: str) -> "FAQIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("entries", []), language, deck)
+
+    def match(self, question: str, slide_id: int = 0, threshold: float = 0.82) -> Optional[Dict]:
+        """Найти наиболее похожий вопрос; вопросы текущего слайда в приоритете"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+
+        best: Optional[Tuple[float, int]] = None
+        for key, i in self._keys:
+            score = question_similarity(normalized, key)
+            if score < threshold:
+                continue
+            # Небольшой бонус за совпадение слайда, чтобы при равенстве
+            # выбирался ответ именно к текущему слайду.
+            if slide_id and self.entries[i].get("slide_id") == slide_id:
+                score += 0.05
+            if best is None or score > best[0]:
+                best = (score, i)
+
+        return self.entries[best[1]] if best else None
+
+
+class FAQService:
+    """Ленивая загрузка индексов FAQ с перечитыванием при изменении файла"""
+
+    def __init__(self):
+        self.threshold = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.82"))
+        self._indexes: Dict[Tuple[str, str], Tuple[float, FAQIndex]] = {}
+
+    def get_index(self, language: str, deck: str) -> Optional[FAQIndex]:
+        path = faq_index_file(language, deck)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+
+        cached = self._indexes.get((language, deck))
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            index = FAQIndex.load(path, language, deck)
+        except Exception as e:
+            logger.warning(f"FAQ index {path} is not readable: {e}")
+            return None
+
+        self._indexes[(language, deck)] = (mtime, index)
+        return index
+
+    def match(self, question: str, language: str, deck: str, slide_id: int = 0) -> Optional[Dict]:
+        index = self.get_index(language, deck)
+        if index is None:
+            return None
+        return index.match(question, slide_id=slide_id, threshold=self.threshold)
+
+    def load_audio(self, entry: Dict) -> Optional[bytes]:
+        """Прочитать озвучку ответа (путь в индексе относительно data/audio)"""
+        rel = entry.get("audio")
+        if not rel:
+            return None
+        try:
+            return (AUDIO_DIR / rel).read_bytes()
+        except OSError as e:
+            logger.warning(f"FAQ audio {rel} is missing: {e}")
+            return None
@@ -1,23 +1,22 @@
 import os
 import asyncio
+import importlib.util
 import logging
-import struct
 import wave
 import io
 import tempfile
-from typing import Optional
+import time
+from typing import Optional, Tuple
 
-try:
-    from openai import AsyncOpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from services import audio_meta
+from services.metrics import PROVIDER_ERRORS, PROVIDER_FALLBACKS, PROVIDER_IN_FLIGHT, TTS_CHARACTERS, TTS_SECONDS
+from services.resilience import AllProvidersFailed, FallbackChain, get_provider
+from services.tts_text import canonicalize
 
-try:
-    import pyttsx3
-    PYTTSX3_AVAILABLE = True
-except ImportError:
-    PYTTSX3_AVAILABLE = False
+# SDK импортируются лениво (при создании клиента / первом локальном синтезе),
+# чтобы импорт приложения не платил за них при старте.
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+PYTTSX3_AVAILABLE = importlib.util.find_spec("pyttsx3") is not None
 
 logger = logging.getLogger(__name__)
 
@@ -33,9 +32,21 @@ class HuggingFaceTTS:
         self.api_key = os.getenv("OPENAI_API_KEY", "")
         self.voice = os.getenv("TTS_VOICE", "onyx")
         self.model = os.getenv("TTS_MODEL", "tts-1-hd")
+        # Дедлайн одной попытки; ретраи SDK отключены — повтор и переход
+        # на запасной бэкенд делает цепочка fallback-ов.
+        self.timeout = float(os.getenv("TTS_TIMEOUT", "30"))
+        self.local_timeout = float(os.getenv("TTS_LOCAL_TIMEOUT", "60"))
+
+        self.openai_provider = get_provider("tts.openai", timeout=self.timeout, hedge=True)
+        self.local_provider = get_provider("tts.pyttsx3", timeout=self.local_timeout)
+        self.chain = FallbackChain(
+            "tts", on_fallback=lambda name: PROVIDER_FALLBACKS.inc(service="tts", to=name.split(".", 1)[-1])
+        )
 
         if self.api_key and OPENAI_AVAILABLE:
-            self.client = AsyncOpenAI(api_key=self.api_key)
+            from openai import AsyncOpenAI
+
+            self.client = AsyncOpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=0)
             logger.info(f"✅ OpenAI TTS initialized (model: {self.model}, voice: {self.voice})")
         else:
             self.client = None
@@ -50,18 +61,51 @@ class HuggingFaceTTS:
             language: Код языка
             
         Returns:
-            bytes: Аудио данные в формате WAV
+            bytes: Аудио данные в формате WAV (приведённые к целевой громкости);
+            если все провайдеры недоступны — заглушка (тишина)
+        """
+        audio_data, _ = await self.synthesize_cacheable(text, language)
+        return audio_data
+
+    async def synthesize_cacheable(self, text: str, language: str = "ky") -> Tuple[bytes, bool]:
+        """
+        Синтез речи с признаком, что это настоящая озвучка.
+
+        Returns:
+            (bytes, bool): WAV и False, если все провайдеры недоступны и вернулась
+            заглушка — её нельзя кешировать и сохранять вместо озвучки.
         """
-        _ = language
-        return await self._synthesize_openai(text)
+        # Провайдер получает каноническую форму (без эмодзи, числа словами)
+        text = canonicalize(text, language)
+        TTS_CHARACTERS.inc(len(text), stage="synthesized")
+        try:
+            with PROVIDER_IN_FLIGHT.track_inprogress(service="tts"):
+                audio_data = await self._synthesize_openai(text)
+        except AllProvidersFailed:
+            PROVIDER_FALLBACKS.inc(service="tts", to="mock")
+            return self._generate_mock_audio(), False
+        # OpenAI и pyttsx3 звучат с разной громкостью — выравниваем один раз здесь
+        return await asyncio.to_thread(audio_meta.normalize, audio_data), True
     
     async def _synthesize_openai(self, text: str) -> bytes:
-        """Синтез через OpenAI TTS API"""
-        if not hasattr(self, 'client') or not self.client:
+        """Синтез через OpenAI TTS API с переходом на локальный TTS.
+
+        Бэкенды с разомкнутой цепью пропускаются сразу, поэтому во время
+        сбоя OpenAI запрос переходит на запасной вариант без ожидания таймаута.
+        Если не ответил никто — AllProvidersFailed.
+        """
+        attempts = []
+        if self.client:
+            attempts.append((self.openai_provider, lambda: self._call_openai(text)))
+        else:
             logger.warning("OpenAI TTS not available, using mock audio")
-            local = await self._try_synthesize_local(text)
-            return local if local else self._generate_mock_audio()
-        
+        if PYTTSX3_AVAILABLE:
+            attempts.append((self.local_provider, lambda: self._call_local(text)))
+
+        return await self.chain.run(attempts)
+
+    async def _call_openai(self, text: str) -> bytes:
+        start = time.perf_counter()
         try:
             logger.info(f"Synthesizing with OpenAI TTS: {text[:100]}...")
             
@@ -73,29 +117,42 @@ class HuggingFaceTTS:
             )
             
             audio_bytes = response.content
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="openai", status="ok")
             logger.info(f"Successfully generated audio, size: {len(audio_bytes)} bytes")
             return audio_bytes
                 
+        except asyncio.CancelledError:
+            # Отмена (проигравший hedge, клиент ушёл) — не ошибка провайдера
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="openai", status="cancelled")
+            raise
         except Exception as e:
-            logger.error(f"OpenAI TTS error: {str(e)}")
-            local = await self._try_synthesize_local(text)
-            return local if local else self._generate_mock_audio()
-
-
-    async def _try_synthesize_local(self, text: str) -> Optional[bytes]:
-        """Best-effort local TTS (Windows SAPI via pyttsx3) to avoid silence files."""
-        if not PYTTSX3_AVAILABLE:
-            return None
-
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="openai", status="error")
+            PROVIDER_ERRORS.inc(service="tts", provider="openai")
+            logger.error(f"OpenAI TTS error: {type(e).__name__}: {str(e)}")
+            raise
+
+    async def _call_local(self, text: str) -> bytes:
+        """Local TTS (Windows SAPI via pyttsx3) to avoid silence files."""
+        start = time.perf_counter()
         try:
             loop = asyncio.get_running_loop()
-            return await loop.run_in_executor(None, self._synthesize_pyttsx3_sync, text)
+            audio_bytes = await loop.run_in_executor(None, self._synthesize_pyttsx3_sync, text)
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="pyttsx3", status="ok")
+            return audio_bytes
+        except asyncio.CancelledError:
+            # Отмена (проигравший hedge, клиент ушёл) — не ошибка провайдера
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="pyttsx3", status="cancelled")
+            raise
         except Exception as e:
+            TTS_SECONDS.observe(time.perf_counter() - start, provider="pyttsx3", status="error")
+            PROVIDER_ERRORS.inc(service="tts", provider="pyttsx3")
             logger.warning(f"Local TTS fallback failed: {e}")
-            return None
+            raise
 
 
     def _synthesize_pyttsx3_sync(self, text: str) -> bytes:
+        import pyttsx3
+
         engine = pyttsx3.init()
 
         # Try to pick a Russian voice if available, otherwise keep default.
@@ -162,9 +219,8 @@ class HuggingFaceTTS:
             wav_file.setsampwidth(2)   # 16-bit
             wav_file.setframerate(sample_rate)
             
-            # Записать тишину (нули)
-            silence = struct.pack('<' + 'h' * num_samples, *([0] * num_samples))
-            wav_file.writeframes(silence)
+            # Записать тишину: нулевые 16-битные отсчёты — просто нулевые байты
+            wav_file.writeframes(bytes(num_samples * 2))
         
         return buffer.getvalue()
 
@@ -0,0 +1,444 @@
+"""Фоновые задачи: синтез длинных текстов и перегенерация озвучки колоды.
+
+Задача создаётся запросом POST /api/jobs и сразу получает id; выполняет
+её ограниченный пул фоновых воркеров (JOB_WORKERS на процесс). Состояние
+хранится в SQLite, поэтому:
+    * задачу, созданную в одном воркере gunicorn, может выполнить любой;
+    * после перезапуска незавершённые задачи продолжаются — «зависшие»
+      в статусе running (нет обновлений дольше JOB_STALE_SECONDS)
+      возвращаются в очередь;
+    * прогресс виден всем процессам (GET /api/jobs/{id} и SSE).
+
+Повторная отправка с тем же Idempotency-Key возвращает уже созданную
+задачу, а не запускает новую.
+
+Результаты пишутся в хранилище аудио (data/audio), которое раздаётся
+через /audio. Файлы заменяются атомарно (tmp + os.replace) — колоду
+можно перегенерировать, не останавливая сервис. После перегенерации
+колоды пересобирается и её архив (services/audio_pack).
+
+Настройки:
+    JOBS_ENABLED=true
+    JOB_WORKERS=2
+    JOB_POLL_INTERVAL=2          как часто искать задачи из других процессов, сек
+    JOB_STALE_SECONDS=300
+    JOB_RETENTION_HOURS=72       сколько хранить завершённые задачи и их файлы
+    JOBS_DB_PATH=data/jobs/jobs.sqlite3
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services import audio_meta, decks, tracing
+from services.audio_pack import build_deck_pack
+from services.admission import AdmissionRejected, AdmissionService
+from services.cache_policy import ADHOC, NARRATION
+from services.speech import SpeechService
+from services.tts_text import canonicalize, split_for_tts
+from services.warmup import PRERENDERED_MIN_BYTES
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = decks.DATA_DIR / "jobs"
+JOB_AUDIO_DIR = decks.AUDIO_DIR / "jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+# Под каким клиентом задачи стоят в очереди допуска провайдера
+JOB_CLIENT_ID = "jobs"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at);
+"""
+
+_COLUMNS = (
+    "id", "kind", "params", "params_hash", "idempotency_key", "status", "progress", "total",
+    "result", "error", "created_at", "updated_at", "started_at", "finished_at",
+)
+
+
+class JobConflict(ValueError):
+    """Idempotency-Key уже использован для задачи с другими параметрами"""
+
+
+class JobCancelled(Exception):
+    """Задачу отменили во время выполнения"""
+
+
+def _params_hash(kind: str, params: Dict) -> str:
+    payload = json.dumps({"kind": kind, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class JobStore:
+    """Задачи в SQLite; общее состояние для всех воркеров"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or os.getenv("JOBS_DB_PATH", "") or JOBS_DIR / "jobs.sqlite3")
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job.pop("params_hash")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def create(self, kind: str, params: Dict, idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Создать задачу; (задача, создана ли новая)"""
+        params_hash = _params_hash(kind, params)
+        conn = self._connect()
+        if idempotency_key:
+            row = conn.execute(
+                "SELECT id, params_hash FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+            if row is not None:
+                if row[1] != params_hash:
+                    raise JobConflict("Idempotency-Key was already used with different parameters")
+                return self.get(row[0]), False
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, params_hash, idempotency_key, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), params_hash, idempotency_key or None, QUEUED, now, now),
+            )
+        except sqlite3.IntegrityError:
+            # Тот же ключ одновременно пришёл в другой воркер
+            return self.create(kind, params, idempotency_key)
+        return self.get(job_id), True
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Атомарно взять самую старую задачу из очереди"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                (RUNNING, now, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row[0])
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        if fields.get("status") in TERMINAL_STATUSES:
+            fields["finished_at"] = fields["updated_at"]
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменить задачу; выполняющаяся остановится на ближайшем шаге"""
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (CANCELLED, now, now, job_id, QUEUED, RUNNING),
+        )
+        return cursor.rowcount > 0
+
+    def requeue_stale(self, stale_seconds: float) -> int:
+        """Вернуть в очередь задачи, воркер которых перестал обновлять их статус"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            (QUEUED, time.time(), RUNNING, time.time() - stale_seconds),
+        )
+        return cursor.rowcount
+
+    def prune(self, retention_seconds: float) -> List[Dict[str, Any]]:
+        """Удалить давно завершённые задачи; вернуть удалённые"""
+        conn = self._connect()
+        cutoff = time.time() - retention_seconds
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        ).fetchall()
+        conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        return [self._row_to_job(row) for row in rows]
+
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class JobManager:
+    """Пул фоновых воркеров, выполняющих задачи из JobStore"""
+
+    KINDS = ("tts", "deck_audio")
+
+    def __init__(self, store: JobStore, speech: SpeechService, admission: Optional[AdmissionService] = None):
+        self.store = store
+        self.speech = speech
+        # Синтез задач делит слоты провайдера с /api/tts (очередь допуска "tts")
+        self.admission = admission
+        self.enabled = os.getenv("JOBS_ENABLED", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+        self.concurrency = max(1, int(os.getenv("JOB_WORKERS", "2")))
+        self.poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+        self.stale_seconds = float(os.getenv("JOB_STALE_SECONDS", "300"))
+        self.retention_seconds = float(os.getenv("JOB_RETENTION_HOURS", "72")) * 3600
+        self.maintenance_interval = 60.0
+        self._handlers: Dict[str, Callable[[Dict, ProgressCallback], Awaitable[Dict]]] = {
+            "tts": self._run_tts,
+            "deck_audio": self._run_deck_audio,
+        }
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_maintenance = 0.0
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self._workers and not all(w.done() for w in self._workers):
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, kind: str, params: Dict, idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job, created = self.store.create(kind, params, idempotency_key)
+        if created:
+            self.start()
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return job, created
+
+    def _maintenance(self):
+        now = time.monotonic()
+        if now - self._last_maintenance < self.maintenance_interval:
+            return
+        self._last_maintenance = now
+        requeued = self.store.requeue_stale(self.stale_seconds)
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale job(s)")
+        for job in self.store.prune(self.retention_seconds):
+            if job["kind"] == "tts":
+                (JOB_AUDIO_DIR / f"{job['id']}.wav").unlink(missing_ok=True)
+
+    async def _worker(self):
+        while True:
+            try:
+                self._maintenance()
+                job = self.store.claim()
+            except sqlite3.Error:
+                logger.exception("Job store error")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["id"]
+
+        def progress(done: int, total: int):
+            current = self.store.get(job_id)
+            if current is None or current["status"] == CANCELLED:
+                raise JobCancelled()
+            self.store.update(job_id, progress=done, total=total)
+
+        logger.info(f"Job {job_id} ({job['kind']}) started")
+        try:
+            with tracing.start_trace(f"job {job['kind']}", kind=tracing.KIND_INTERNAL, job_id=job_id):
+                result = await self._handlers[job["kind"]](job, progress)
+        except JobCancelled:
+            logger.info(f"Job {job_id} cancelled")
+            return
+        except asyncio.CancelledError:
+            # Остановка процесса — задачу продолжит другой воркер или следующий запуск
+            self.store.update(job_id, status=QUEUED)
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            self.store.update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}")
+            return
+        if self.store.get(job_id)["status"] != CANCELLED:
+            self.store.update(job_id, status=SUCCEEDED, result=result)
+            logger.info(f"Job {job_id} finished")
+
+    async def _run_tts(self, job: Dict, progress: ProgressCallback) -> Dict:
+        params = job["params"]
+        language = params.get("language", "ky")
+        # Провайдер принимает ограниченный объём текста за запрос: длинный
+        # текст озвучивается частями по границам предложений и склеивается.
+        # Части делятся после канонизации — она раскрывает числа и удлиняет текст
+        chunks = split_for_tts(canonicalize(params["text"], language))
+        if not chunks:
+            raise ValueError("Nothing to synthesize")
+        progress(0, len(chunks))
+        parts: List[bytes] = []
+        all_cached = True
+        for index, chunk in enumerate(chunks, 1):
+            # Заглушка вместо части — сбой задачи, а не «успех» с тишиной
+            audio_data, cached = await self._synthesize(chunk, language)
+            parts.append(audio_data)
+            all_cached = all_cached and cached
+            progress(index, len(chunks))
+        audio_data = parts[0] if len(parts) == 1 else audio_meta.join_wav(parts)
+        path = JOB_AUDIO_DIR / f"{job['id']}.wav"
+        _atomic_write(path, audio_data)
+        return {
+            "audio_url": f"/audio/jobs/{path.name}",
+            "bytes": len(audio_data),
+            "chunks": len(chunks),
+            "cached": all_cached,
+        }
+
+    async def _synthesize(self, text: str, language: str) -> Tuple[bytes, bool]:
+        """Озвучка части задачи: из кеша сразу, иначе — через слот провайдера"""
+        audio_data = await self.speech.get_cached(text, language, ADHOC)
+        if audio_data is not None:
+            return audio_data, True
+        if self.admission is None:
+            return await self.speech.get_audio(text, language, ADHOC, allow_fallback=False)
+        while True:
+            try:
+                # Лимит клиента списан при постановке задачи (routers/jobs.py)
+                async with self.admission.admit("tts", JOB_CLIENT_ID, rate_limit=False):
+                    return await self.speech.get_audio(text, language, ADHOC, allow_fallback=False)
+            except AdmissionRejected as e:
+                # Очередь занята живыми запросами — задача подождёт, а не упадёт
+                await asyncio.sleep(e.retry_after)
+
+    async def _run_deck_audio(self, job: Dict, progress: ProgressCallback) -> Dict:
+        params = job["params"]
+        language, deck_name = decks.resolve_deck(params.get("lang"), params.get("deck"))
+        force = bool(params.get("force", False))
+        slides = decks.load_slides(language, deck_name)
+        target_dir = decks.audio_dir(language, deck_name)
+
+        written: List[str] = []
+        skipped: List[str] = []
+        failed: List[Dict[str, str]] = []
+        progress(0, len(slides))
+        for index, slide in enumerate(slides, 1):
+            slide_id = int(slide.get("id", index))
+            filename = decks.audio_filename(slide_id)
+            path = target_dir / filename
+            existing_size = path.stat().st_size if path.exists() else 0
+            text = decks.speak_text(slide)
+
+            if not text or (not force and existing_size > PRERENDERED_MIN_BYTES):
+                skipped.append(filename)
+                # Озвучка есть, а метаданных (ещё) нет — досчитать
+                if existing_size and audio_meta.read_sidecar(path) is None:
+                    try:
+                        await asyncio.to_thread(audio_meta.write_sidecar, path)
+                    except OSError as e:
+                        logger.warning(f"Deck audio job {job['id']}: metadata for {filename} failed: {e}")
+            else:
+                try:
+                    if force:
+                        audio_data, cacheable = await self.speech.tts_service.synthesize_cacheable(text, language)
+                    else:
+                        audio_data, _ = await self.speech.get_audio(text, language, NARRATION, allow_fallback=False)
+                        cacheable = True
+                    # Заглушку (все провайдеры недоступны) вместо озвучки не пишем
+                    if not cacheable:
+                        failed.append({"file": filename, "error": "provider returned placeholder audio"})
+                    else:
+                        _atomic_write(path, audio_data)
+                        await asyncio.to_thread(audio_meta.write_sidecar, path, audio_data)
+                        written.append(filename)
+                except Exception as e:
+                    logger.warning(f"Deck audio job {job['id']}: {filename} failed: {e}")
+                    failed.append({"file": filename, "error": f"{type(e).__name__}: {e}"})
+            progress(index, len(slides))
+
+        pack = None
+        if written:
+            # Новый архив подменяет старый атомарно — сервер подхватит его сам
+            pack_file, entries = await asyncio.to_thread(build_deck_pack, language, deck_name)
+            pack = {"file": pack_file.name, "entries": len(entries)}
+
+        return {
+            "language": language,
+            "deck": deck_name,
+            "written": written,
+            "skipped": skipped,
+            "failed": failed,
+            "pack": pack,
+        }
@@ -0,0 +1,471 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Небольшая реализация без внешних зависимостей: счётчики, gauge и
+гистограммы с метками. Все метрики регистрируются в глобальном `registry`
+и отдаются эндпоинтом GET /metrics.
+
+Значения хранятся в памяти процесса. При нескольких воркерах
+(WEB_CONCURRENCY > 1) /metrics отдаёт воркер, принявший запрос, поэтому
+каждый воркер раз в METRICS_SNAPSHOT_INTERVAL секунд (и при остановке)
+сохраняет снимок своих метрик в общий каталог, а /metrics сводит снимки
+всех воркеров:
+    * счётчики и гистограммы суммируются, включая завершившиеся воркеры —
+      иначе сумма «сбрасывалась» бы при перезапуске воркера;
+    * gauge — только по живым процессам, по multiprocess_mode метрики:
+      sum (в полёте, очереди, память), max (худшее состояние) или pid
+      (серия на воркер с меткой pid).
+Каталог очищается при старте gunicorn (gunicorn.conf.py, on_starting).
+
+Настройки:
+    METRICS_MULTIPROC=auto            auto (при WEB_CONCURRENCY > 1) | true | false
+    METRICS_MULTIPROC_DIR=data/metrics
+    METRICS_SNAPSHOT_INTERVAL=5
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelValues = Tuple[str, ...]
+# Снимок метрики другого процесса: (pid, жив ли процесс, значения из _export)
+Snapshot = Tuple[int, bool, List[Any]]
+
+# Не services.decks.DATA_DIR: модуль импортируется и в мастере gunicorn
+DEFAULT_MULTIPROC_DIR = Path(__file__).resolve().parent.parent / "data" / "metrics"
+
+
+def _multiprocess_dir() -> Optional[Path]:
+    value = os.getenv("METRICS_MULTIPROC", "auto").strip().lower()
+    if value == "auto":
+        enabled = int(os.getenv("WEB_CONCURRENCY", "1") or "1") > 1
+    else:
+        enabled = value in {"1", "true", "yes", "y", "on"}
+    if not enabled:
+        return None
+    return Path(os.getenv("METRICS_MULTIPROC_DIR", "") or DEFAULT_MULTIPROC_DIR)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels_text(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None,
+                     names: Optional[Tuple[str, ...]] = None) -> str:
+        pairs = list(zip(names or self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def _items(self) -> Dict[LabelValues, Any]:
+        raise NotImplementedError
+
+    def _export(self) -> List[Any]:
+        """Значения процесса для снимка (JSON)"""
+        raise NotImplementedError
+
+    def _merge(self, snapshots: List[Snapshot]) -> Dict[LabelValues, Any]:
+        """Сводные значения по снимкам всех воркеров"""
+        raise NotImplementedError
+
+    def _samples(self, items: Dict[LabelValues, Any]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self, snapshots: Optional[List[Snapshot]] = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self._items() if snapshots is None else self._merge(snapshots)))
+        return "\n".join(lines)
+
+
+class _ScalarMetric(_Metric):
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _items(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _export(self) -> List[Any]:
+        return [[list(key), value] for key, value in self._items().items()]
+
+    def _merge(self, snapshots: List[Snapshot]) -> Dict[LabelValues, float]:
+        merged: Dict[LabelValues, float] = {}
+        for _, _, values in snapshots:
+            for key, value in values:
+                merged[tuple(key)] = merged.get(tuple(key), 0.0) + value
+        return merged
+
+    def _samples(self, items: Dict[LabelValues, float]) -> List[str]:
+        return [f"{self.name}{self._labels_text(k)} {_format_value(v)}" for k, v in sorted(items.items())]
+
+
+class Counter(_ScalarMetric):
+    kind = "counter"
+
+
+class Gauge(_ScalarMetric):
+    kind = "gauge"
+
+    MODES = ("sum", "max", "pid")
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in self.MODES:
+            raise ValueError(f"{name}: unknown multiprocess_mode {multiprocess_mode!r}")
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _merge(self, snapshots: List[Snapshot]) -> Dict[LabelValues, float]:
+        # Значение завершившегося воркера больше ничего не описывает
+        live = [snapshot for snapshot in snapshots if snapshot[1]]
+        if self.multiprocess_mode == "sum":
+            return super()._merge(live)
+        merged: Dict[LabelValues, float] = {}
+        for pid, _, values in live:
+            for key, value in values:
+                if self.multiprocess_mode == "pid":
+                    merged[tuple(key) + (str(pid),)] = value
+                else:
+                    merged[tuple(key)] = max(value, merged.get(tuple(key), value))
+        return merged
+
+    def _samples(self, items: Dict[LabelValues, float]) -> List[str]:
+        # В режиме pid сводные ключи длиннее на значение метки pid
+        names = self.labelnames + ("pid",)
+        return [f"{self.name}{self._labels_text(k, names=names)} {_format_value(v)}" for k, v in sorted(items.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # На каждую комбинацию меток: [счётчики по бакетам..., +Inf], сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def _items(self) -> Dict[LabelValues, Tuple[List[int], float]]:
+        with self._lock:
+            return {k: (list(c), t[0]) for k, (c, t) in self._values.items()}
+
+    def _export(self) -> List[Any]:
+        return [[list(key), counts, total] for key, (counts, total) in self._items().items()]
+
+    def _merge(self, snapshots: List[Snapshot]) -> Dict[LabelValues, Tuple[List[int], float]]:
+        merged: Dict[LabelValues, Tuple[List[int], float]] = {}
+        for _, _, values in snapshots:
+            for key, counts, total in values:
+                if len(counts) != len(self.buckets) + 1:
+                    # Снимок версии с другими бакетами — не складывается
+                    continue
+                current, current_total = merged.get(tuple(key), ([0] * len(counts), 0.0))
+                merged[tuple(key)] = ([a + b for a, b in zip(current, counts)], current_total + total)
+        return merged
+
+    def _samples(self, items: Dict[LabelValues, Tuple[List[int], float]]) -> List[str]:
+        lines: List[str] = []
+        for key, (counts, total) in sorted(items.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{self._labels_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels_text(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self, multiprocess_dir: Optional[Path] = None):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_file: Optional[Path] = None
+        self._snapshot_pid = 0
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._snapshot_stop = threading.Event()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum"
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, multiprocess_mode))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    # --- снимки для нескольких воркеров ---
+
+    def write_snapshot(self):
+        """Сохранить метрики процесса в общий каталог (атомарно)"""
+        if self.multiprocess_dir is None:
+            return
+        with self._lock:
+            metrics = list(self._metrics.values())
+        data = {"pid": os.getpid(), "metrics": {metric.name: metric._export() for metric in metrics}}
+        with self._snapshot_lock:
+            if self._snapshot_pid != os.getpid():
+                # Файл на запуск процесса: pid может достаться новому воркеру,
+                # а счётчики завершившегося должны остаться в сумме
+                self._snapshot_pid = os.getpid()
+                self._snapshot_file = self.multiprocess_dir / f"{os.getpid()}_{time.time_ns()}.json"
+            path = self._snapshot_file
+            assert path is not None
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, path)
+
+    def _read_snapshots(self) -> Dict[str, List[Snapshot]]:
+        assert self.multiprocess_dir is not None
+        by_metric: Dict[str, List[Snapshot]] = {}
+        for path in sorted(self.multiprocess_dir.glob("*.json")):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                # Файл удалён или дописывается — пропустить до следующего раза
+                continue
+            pid = int(data.get("pid", 0))
+            alive = _pid_alive(pid)
+            for name, values in data.get("metrics", {}).items():
+                by_metric.setdefault(name, []).append((pid, alive, values))
+        return by_metric
+
+    def start_snapshots(self, interval: Optional[float] = None):
+        """Фоновые снимки раз в interval секунд (вызывается в lifespan)"""
+        if self.multiprocess_dir is None or self._snapshot_thread is not None:
+            return
+        interval = interval or float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+        self._snapshot_stop.clear()
+
+        def loop():
+            while not self._snapshot_stop.wait(interval):
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    pass
+
+        self._snapshot_thread = threading.Thread(target=loop, name="metrics-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def stop_snapshots(self):
+        """Остановить фоновые снимки и сохранить последний"""
+        if self._snapshot_thread is not None:
+            self._snapshot_stop.set()
+            self._snapshot_thread.join(timeout=5)
+            self._snapshot_thread = None
+        try:
+            self.write_snapshot()
+        except OSError:
+            pass
+
+    def clear_snapshots(self):
+        """Удалить снимки прошлого запуска (мастер gunicorn до старта воркеров)"""
+        if self.multiprocess_dir is None or not self.multiprocess_dir.exists():
+            return
+        for path in self.multiprocess_dir.iterdir():
+            if path.suffix in {".json", ".tmp"}:
+                path.unlink(missing_ok=True)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        if self.multiprocess_dir is None:
+            return "\n".join(metric.render() for metric in metrics) + "\n"
+        # Свой снимок — свежий, остальные — не старше интервала снимков
+        self.write_snapshot()
+        snapshots = self._read_snapshots()
+        return "\n".join(metric.render(snapshots.get(metric.name, [])) for metric in metrics) + "\n"
+
+
+registry = Registry(_multiprocess_dir())
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- HTTP ---
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ("route",)
+)
+
+# --- Провайдеры (LLM / TTS / STT) ---
+LLM_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "LLM (chat completion) call latency", ("model", "status")
+)
+TTS_SECONDS = registry.histogram(
+    "tts_synthesis_duration_seconds", "TTS synthesis latency per backend", ("provider", "status")
+)
+STT_SECONDS = registry.histogram(
+    "stt_transcription_duration_seconds", "Speech-to-text latency", ("status",)
+)
+TTS_CHARACTERS = registry.counter(
+    "tts_characters_total", "TTS text characters requested vs sent to a provider", ("stage",)
+)
+PROVIDER_IN_FLIGHT = registry.gauge(
+    "provider_requests_in_flight", "Provider calls currently in progress", ("service",)
+)
+PROVIDER_ERRORS = registry.counter(
+    "provider_errors_total", "Provider call errors", ("service", "provider")
+)
+PROVIDER_FALLBACKS = registry.counter(
+    "provider_fallbacks_total", "Fallbacks to a secondary backend", ("service", "to")
+)
+
+# --- Кеш ---
+CACHE_SECONDS = registry.histogram(
+    "cache_operation_duration_seconds",
+    "Cache get/set latency per tier",
+    ("tier", "op"),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5),
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "Cache lookups per tier and result", ("tier", "kind", "entry_class", "result")
+)
+CACHE_ADMISSIONS = registry.counter(
+    "cache_admissions_total", "In-process cache admission decisions (TinyLFU)", ("entry_class", "result")
+)
+CACHE_EVICTIONS = registry.counter(
+    "cache_evictions_total", "In-process cache evictions", ("entry_class", "reason")
+)
+CACHE_MEMORY_BYTES = registry.gauge(
+    "cache_memory_bytes", "In-process cache size per entry class", ("entry_class",)
+)
+CACHE_MEMORY_ENTRIES = registry.gauge(
+    "cache_memory_entries", "In-process cache entries per entry class", ("entry_class",)
+)
+CACHE_CODEC_BYTES = registry.counter(
+    "cache_codec_bytes_total", "Audio bytes before/after cache compression", ("codec", "stage")
+)
+CACHE_CODEC_SECONDS = registry.histogram(
+    "cache_codec_duration_seconds",
+    "Cache audio encode/decode latency",
+    ("op",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# --- Слайды / FAQ / прогрев ---
+SLIDES_LOAD_SECONDS = registry.histogram(
+    "slides_load_duration_seconds",
+    "Deck loading latency",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+FAQ_LOOKUPS = registry.counter(
+    "faq_lookups_total", "Precomputed FAQ lookups in /api/qa", ("result",)
+)
+WARMUP_TASKS = registry.counter(
+    "warmup_tasks_total", "Warm-up tasks by outcome", ("result",)
+)
+WARMUP_QUEUE_DEPTH = registry.gauge(
+    "warmup_queue_depth", "Warm-up tasks waiting in the queue"
+)
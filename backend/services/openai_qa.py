@@ -1,11 +1,17 @@
+import asyncio
+import importlib.util
+import json
 import os
-from typing import Optional
+from typing import List, Optional, Tuple
 import logging
+import time
 
-try:
-    import openai
-except ImportError:
-    openai = None
+from services import tracing
+from services.metrics import LLM_SECONDS, PROVIDER_ERRORS, PROVIDER_IN_FLIGHT
+from services.resilience import CircuitOpenError, get_provider
+
+# SDK импортируется лениво, при первом запросе к API
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 logger = logging.getLogger(__name__)
 
@@ -16,12 +22,25 @@ class OpenAIQA:
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY", "")
-        if self.api_key and openai:
-            openai.api_key = self.api_key
+        self.available = bool(self.api_key) and OPENAI_AVAILABLE
         # Newer + cheaper default model; can be overridden with QA_MODEL.
         # Examples: gpt-4o-mini (cheap), gpt-4o (stronger), etc.
         self.model = os.getenv("QA_MODEL", "gpt-4o-mini").strip() or "gpt-4o-mini"
         self.allow_general = os.getenv("QA_ALLOW_GENERAL", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+        # Дедлайн запроса к LLM; при серии ошибок цепь размыкается и ответ
+        # об недоступности возвращается сразу, без ожидания таймаута.
+        self.timeout = float(os.getenv("QA_TIMEOUT", "20"))
+        self.provider = get_provider("llm.openai", timeout=self.timeout, hedge=True)
+        self._client = None
+
+    def _get_client(self):
+        """Общий асинхронный клиент OpenAI (создаётся при первом запросе)"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            # Ретраи SDK отключены: повторы и дедлайн контролирует self.provider
+            self._client = AsyncOpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+        return self._client
 
     def _maybe_fact_override(self, question: str, language: str) -> Optional[str]:
         q = (question or "").strip().lower()
@@ -44,6 +63,32 @@ class OpenAIQA:
 
         return None
     
+    def _system_prompt(self, lang: str) -> str:
+        """Системный промпт на языке презентации"""
+        allow_general = self.allow_general
+
+        if lang == "ru":
+            system_prompt = """Вы эксперт-ассистент.
+Отвечайте на русском языке чётко, понятно и кратко (обычно 1–4 предложения).
+
+Проверенные факты (используйте как опорные):
+- Действующая Конституция Кыргызской Республики вступила в силу 5 мая 2021 года.
+
+Если дан дополнительный контекст, используйте его как вспомогательный источник.
+Никогда не упоминайте «презентацию», «слайды», «в презентации нет/не указано» и не оправдывайтесь отсутствием информации.
+""" + ("Если контекст недостаточен, всё равно отвечайте по сути, опираясь на общие знания. Если уверенности нет — прямо скажите, что не уверены, и кратко уточните." if allow_general else "Если контекст недостаточен — скажите, что данных недостаточно, и задайте 1 уточняющий вопрос.")
+        else:
+            system_prompt = """Сиз эксперт-ассистентсиз.
+Суроолорго кыргыз тилинде так, түшүнүктүү жана кыска жооп бериңиз (адатта 1–4 сүйлөм).
+
+Текшерилген фактылар (таянуу үчүн):
+- Кыргыз Республикасынын Конституциясынын азыркы редакциясы 2021-жылдын 5-майында күчүнө кирген.
+
+Эгер кошумча контекст берилсе, аны жардамчы булак катары колдонуңуз.
+Эч качан «презентация», «слайд» же «презентацияда маалымат жок/көрсөтүлгөн эмес» деген сөздөрдү айтпаңыз.
+""" + ("Эгер контекст жетишсиз болсо да, жалпы билимге таянып түз жооп бериңиз. Эгер ишеним жок болсо — кыскача ишенбестигиңизди айтыңыз жана тактоо үчүн 1 суроо бериңиз." if allow_general else "Эгер контекст жетишсиз болсо — маалымат жетишсиз экенин айтыңыз жана 1 тактоочу суроо бериңиз.")
+        return system_prompt
+
     async def get_answer(
         self,
         question: str,
@@ -51,6 +96,17 @@ class OpenAIQA:
         slide_id: int = 0,
         language: str = "ky",
     ) -> str:
+        """Получить ответ на вопрос (только текст, см. `answer`)"""
+        answer, _ = await self.answer(question, context=context, slide_id=slide_id, language=language)
+        return answer
+
+    async def answer(
+        self,
+        question: str,
+        context: str = "",
+        slide_id: int = 0,
+        language: str = "ky",
+    ) -> Tuple[str, bool]:
         """
         Получить ответ на вопрос с учетом контекста презентации
         
@@ -60,43 +116,24 @@ class OpenAIQA:
             slide_id: ID текущего слайда
             
         Returns:
-            str: Ответ на языке презентации (ky или ru)
+            (str, bool): Ответ на языке презентации (ky или ru) и признак
+            того, что это настоящий ответ (не заглушка и не текст ошибки) —
+            только такие ответы можно кешировать.
         """
         override = self._maybe_fact_override(question=question, language=language)
+        tracing.current_span().set_attribute("qa.fact_override", bool(override))
         if override:
-            return override
+            return override, True
 
-        if not self.api_key or not openai:
+        if not self.available:
             logger.warning("OPENAI_API_KEY not set, returning mock answer")
             if (language or "").strip().lower() == "ru":
-                return "Это тестовый ответ. Укажите OPENAI_API_KEY. Вопрос: " + question
-            return "Бул тест жообу. OpenAI API ачкычын коюңуз. Суроо: " + question
+                return "Это тестовый ответ. Укажите OPENAI_API_KEY. Вопрос: " + question, False
+            return "Бул тест жообу. OpenAI API ачкычын коюңуз. Суроо: " + question, False
         
         lang = (language or "ky").strip().lower()
 
-        allow_general = self.allow_general
-
-        # Системный промпт
-        if lang == "ru":
-            system_prompt = """Вы эксперт-ассистент.
-Отвечайте на русском языке чётко, понятно и кратко (обычно 1–4 предложения).
-
-Проверенные факты (используйте как опорные):
-- Действующая Конституция Кыргызской Республики вступила в силу 5 мая 2021 года.
-
-Если дан дополнительный контекст, используйте его как вспомогательный источник.
-Никогда не упоминайте «презентацию», «слайды», «в презентации нет/не указано» и не оправдывайтесь отсутствием информации.
-""" + ("Если контекст недостаточен, всё равно отвечайте по сути, опираясь на общие знания. Если уверенности нет — прямо скажите, что не уверены, и кратко уточните." if allow_general else "Если контекст недостаточен — скажите, что данных недостаточно, и задайте 1 уточняющий вопрос.")
-        else:
-            system_prompt = """Сиз эксперт-ассистентсиз.
-Суроолорго кыргыз тилинде так, түшүнүктүү жана кыска жооп бериңиз (адатта 1–4 сүйлөм).
-
-Текшерилген фактылар (таянуу үчүн):
-- Кыргыз Республикасынын Конституциясынын азыркы редакциясы 2021-жылдын 5-майында күчүнө кирген.
-
-Эгер кошумча контекст берилсе, аны жардамчы булак катары колдонуңуз.
-Эч качан «презентация», «слайд» же «презентацияда маалымат жок/көрсөтүлгөн эмес» деген сөздөрдү айтпаңыз.
-""" + ("Эгер контекст жетишсиз болсо да, жалпы билимге таянып түз жооп бериңиз. Эгер ишеним жок болсо — кыскача ишенбестигиңизди айтыңыз жана тактоо үчүн 1 суроо бериңиз." if allow_general else "Эгер контекст жетишсиз болсо — маалымат жетишсиз экенин айтыңыз жана 1 тактоочу суроо бериңиз.")
+        system_prompt = self._system_prompt(lang)
 
         # Пользовательский промпт с контекстом
         if lang == "ru":
@@ -114,25 +151,148 @@ class OpenAIQA:
 
 Жооп:"""
 
+        async def call_llm() -> str:
+            start = time.perf_counter()
+            try:
+                with PROVIDER_IN_FLIGHT.track_inprogress(service="llm"):
+                    response = await self._get_client().chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=0.3,
+                        max_tokens=500
+                    )
+                LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="ok")
+                return response.choices[0].message.content.strip()
+            except asyncio.CancelledError:
+                # Отмена (проигравший hedge, клиент ушёл) — не ошибка провайдера
+                LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="cancelled")
+                raise
+            except ExceptionNone:
+                LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="error")
+                PROVIDER_ERRORS.inc(service="llm", provider="openai")
+                raise
+
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.api_key)
-            
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=500
-            )
-            
-            answer = response.choices[0].message.content.strip()
-            return answer
-            
+            answer = await self.provider.call(call_llm)
+            return answer, True
+
+        except CircuitOpenError:
+            logger.warning("OpenAI circuit is open, answering with unavailability notice")
+            return self._unavailable_notice(lang), False
+
         except Exception as e:
-            logger.error(f"OpenAI API error: {str(e)}")
+            logger.error(f"OpenAI API error: {type(e).__name__}: {str(e)}")
             if lang == "ru":
-                return f"Произошла ошибка при получении ответа: {str(e)}"
-            return f"Жообун алууда катачылык болду: {str(e)}"
+                return f"Произошла ошибка при получении ответа: {str(e)}", False
+            return f"Жообун алууда катачылык болду: {str(e)}", False
+
+    @staticmethod
+    def _unavailable_notice(lang: str) -> str:
+        if lang == "ru":
+            return "Сервис ответов временно недоступен. Попробуйте задать вопрос чуть позже."
+        return "Жооп берүү кызматы убактылуу жеткиликсиз. Суроону бир аздан кийин кайра бериңиз."
+
+    async def answer_many(
+        self,
+        questions: List[str],
+        context: str = "",
+        slide_id: int = 0,
+        language: str = "ky",
+    ) -> List[Tuple[str, bool]]:
+        """
+        Ответы на несколько вопросов к одному слайду одним вызовом LLM
+        (пакетный /api/qa/batch): контекст слайда и системный промпт
+        передаются один раз, а не на каждый вопрос.
+
+        Возвращает [(ответ, можно ли кешировать)] в порядке вопросов.
+        Если модель вернула не то число ответов или не JSON, вопросы
+        задаются по одному через `answer`; так же — вопросы, вместо ответа
+        на которые пришла не строка или пустая строка.
+        """
+        results: List[Optional[Tuple[str, bool]]] = [None] * len(questions)
+        pending = []
+        for i, question in enumerate(questions):
+            override = self._maybe_fact_override(question=question, language=language)
+            if override:
+                results[i] = (override, True)
+            else:
+                pending.append(i)
+
+        if len(pending) > 1 and self.available:
+            lang = (language or "ky").strip().lower()
+            try:
+                # Ответ на несколько вопросов длиннее — и дедлайн больше
+                content = await self.provider.call(
+                    lambda: self._call_combined([questions[i] for i in pending], context, lang),
+                    timeout=self.timeout * 2,
+                )
+                answers = json.loads(content or "{}").get("answers")
+                if not isinstance(answers, list) or len(answers) != len(pending):
+                    raise ValueError(f"expected {len(pending)} answers, got {answers!r:.200}")
+                invalid = []
+                for i, answer in zip(pending, answers):
+                    if isinstance(answer, str) and answer.strip():
+                        results[i] = (answer.strip(), True)
+                    else:
+                        invalid.append(i)
+                if invalid:
+                    logger.warning(f"Combined answer has {len(invalid)} invalid items, asking them one by one")
+                pending = invalid
+            except CircuitOpenError:
+                logger.warning("OpenAI circuit is open, answering with unavailability notice")
+                for i in pending:
+                    results[i] = (self._unavailable_notice(lang), False)
+                pending = []
+            except Exception as e:
+                logger.warning(f"Combined answer failed, asking one by one: {type(e).__name__}: {e}")
+
+        if pending:
+            answered = await asyncio.gather(*(
+                self.answer(questions[i], context=context, slide_id=slide_id, language=language) for i in pending
+            ))
+            for i, result in zip(pending, answered):
+                results[i] = result
+        return [r for r in results if r is not None]
+
+    async def _call_combined(self, questions: List[str], context: str, lang: str) -> str:
+        if lang == "ru":
+            instruction = (
+                "\nНа каждый вопрос ответьте отдельно и независимо от остальных. "
+                'Верните JSON-объект {"answers": [...]} — строки ответов в порядке вопросов.'
+            )
+            numbered = "\n".join(f"{n}. {q}" for n, q in enumerate(questions, 1))
+            user_prompt = f"Контекст (может быть пустым):\n{context}\n\nВопросы:\n{numbered}"
+        else:
+            instruction = (
+                "\nАр бир суроого өзүнчө жана башкаларынан көз карандысыз жооп бериңиз. "
+                'JSON-объект {"answers": [...]} кайтарыңыз — жооптор суроолордун тартибинде.'
+            )
+            numbered = "\n".join(f"{n}. {q}" for n, q in enumerate(questions, 1))
+            user_prompt = f"Контекст (бош болушу мүмкүн):\n{context}\n\nСуроолор:\n{numbered}"
+
+        start = time.perf_counter()
+        try:
+            with PROVIDER_IN_FLIGHT.track_inprogress(service="llm"):
+                response = await self._get_client().chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": self._system_prompt(lang) + instruction},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    temperature=0.3,
+                    max_tokens=min(4000, 400 * len(questions)),
+                    response_format={"type": "json_object"},
+                )
+            LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="ok")
+            return response.choices[0].message.content
+        except asyncio.CancelledError:
+            # Отмена (проигравший hedge, клиент ушёл) — не ошибка провайдера
+            LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="cancelled")
+            raise
+        except ExceptionNone:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=self.model, status="error")
+            PROVIDER_ERRORS.inc(service="llm", provider="openai")
+            raise
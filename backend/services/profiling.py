@@ -0,0 +1,483 @@
+"""Сэмплирующий профилировщик для продакшен-трафика.
+
+Два режима, оба пишут профили в формате speedscope
+(https://www.speedscope.app) в data/profiles/:
+
+    * по запросу — админ добавляет к запросу заголовки
+      `X-Profile: 1` и `X-Admin-Token: <PROFILING_ADMIN_TOKEN>`
+      (или параметр `?__profile=<токен>` из браузера). Пока запрос
+      выполняется, его задача сэмплируется каждые PROFILE_INTERVAL_MS:
+      если она сейчас выполняется в event loop — берётся реальный стек,
+      если ждёт — цепочка await-ов (лист `(await Future)` и т.п.), так
+      что профиль показывает и CPU, и ожидание. Id профиля — в заголовке
+      ответа `X-Profile-Id` и в атрибуте `profile.id` корневого span-а.
+    * фоновый — с частотой PROFILE_BACKGROUND_HZ сэмплируются все потоки
+      процесса (простаивающие пропускаются); каждые
+      PROFILE_BACKGROUND_WINDOW_S секунд накопленное сбрасывается в файл.
+
+Сэмплы снимает отдельный поток через sys._current_frames(), код
+запросов не инструментируется. Если профилирование выключено (не задан
+токен и фоновый режим), поток не запускается, а middleware сводится
+к одной проверке атрибута.
+
+Получить профили: GET /api/profiles и /api/profiles/{id}
+(?format=collapsed — свёрнутые стеки для flamegraph.pl).
+
+Настройки:
+    PROFILING_ADMIN_TOKEN=          без него профилирование по запросу и выдача выключены
+    PROFILE_INTERVAL_MS=5
+    PROFILE_MAX_SECONDS=60          дольше (SSE, WebSocket) запрос не сэмплируется
+    PROFILE_MAX_ACTIVE=4            одновременно профилируемых запросов
+    PROFILE_BACKGROUND_HZ=0         0 — фоновый режим выключен
+    PROFILE_BACKGROUND_WINDOW_S=300
+    PROFILE_KEEP=100                хранить последних профилей
+    PROFILE_DIR=data/profiles
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+from services import tracing
+from services.decks import DATA_DIR
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PROFILES_WRITTEN = registry.counter(
+    "profiles_written_total", "Profiles written to disk", ("mode",)
+)
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+PROFILE_ID = re.compile(r"^(req|bg)-\d+-\d+-[0-9a-f]{8}$")
+
+# Поток, стоящий в одном из этих файлов, простаивает (select, Condition.wait,
+# очередь; uvloop ждёт событий в C, и лист стека — asyncio.Runner.run)
+_IDLE_FILES = (
+    "selectors.py",
+    "threading.py",
+    "queue.py",
+    os.path.join("concurrent", "futures", "thread.py"),
+    os.path.join("asyncio", "runners.py"),
+)
+
+StackItem = Union[Any, str]  # объект кода или синтетический кадр
+
+
+def _frame_stack(frame, stop=None) -> List[Any]:
+    """Коды кадров от корня к листу; stop — самый внешний кадр, который нужен"""
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        if frame is stop:
+            break
+        frame = frame.f_back
+    codes.reverse()
+    return codes
+
+
+def _await_stack(coro) -> List[StackItem]:
+    """Стек приостановленной корутины: цепочка cr_await от задачи до листа"""
+    stack: List[StackItem] = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append(frame.f_code)
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        if awaited is None:
+            break
+        if not any(hasattr(awaited, a) for a in ("cr_frame", "gi_frame", "ag_frame")):
+            stack.append(f"(await {type(awaited).__name__})")
+            break
+        coro = awaited
+    return stack
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_FILES)
+
+
+def _frame_info(item: StackItem) -> Dict[str, Any]:
+    if isinstance(item, str):
+        return {"name": item}
+    return {"name": item.co_qualname, "file": item.co_filename, "line": item.co_firstlineno}
+
+
+def to_speedscope(name: str, weights: "Counter[Tuple[StackItem, ...]]") -> Dict[str, Any]:
+    """Накопленные стеки (стек -> миллисекунды) в файл speedscope"""
+    frames: List[Dict[str, Any]] = []
+    index: Dict[StackItem, int] = {}
+    samples = []
+    sample_weights = []
+    for stack, weight in weights.most_common():
+        ids = []
+        for item in stack:
+            i = index.get(item)
+            if i is None:
+                i = index[item] = len(frames)
+                frames.append(_frame_info(item))
+            ids.append(i)
+        samples.append(ids)
+        sample_weights.append(round(weight, 3))
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "presentation-backend",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": round(sum(sample_weights), 3),
+            "samples": samples,
+            "weights": sample_weights,
+        }],
+    }
+
+
+def to_collapsed(document: Dict[str, Any]) -> str:
+    """speedscope -> свёрнутые стеки (`a;b;c вес`), вес — микросекунды"""
+    frames = document["shared"]["frames"]
+    names = []
+    for frame in frames:
+        label = frame["name"]
+        if "file" in frame:
+            label = f"{label} ({os.path.basename(frame['file'])}:{frame['line']})"
+        names.append(label.replace(";", ":"))
+    lines = []
+    profile = document["profiles"][0]
+    for sample, weight in zip(profile["samples"], profile["weights"]):
+        lines.append(f"{';'.join(names[i] for i in sample)} {max(1, round(weight * 1000))}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestProfile:
+    """Сэмплы одной задачи-запроса"""
+
+    def __init__(self, method: str, path: str, max_seconds: float):
+        self.id = f"req-{int(time.time())}-{os.getpid()}-{secrets.token_hex(4)}"
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.root_frame = self.task.get_coro().cr_frame if self.task is not None else None
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.deadline = self.started + max_seconds
+        self.finished: Optional[float] = None
+        self.last_sample = self.started
+        self.samples = 0
+        self.truncated = False
+        self.weights: "Counter[Tuple[StackItem, ...]]" = Counter()
+        # Сэмплер мог взять профиль до end(): запись и сохранение не пересекаются
+        self._lock = threading.Lock()
+
+    def sample(self, frames: Dict[int, Any], now: float):
+        with self._lock:
+            if self.finished is None:
+                self._sample(frames, now)
+
+    def _sample(self, frames: Dict[int, Any], now: float):
+        if self.task is None or self.task.done():
+            return
+        if now > self.deadline:
+            self.truncated = True
+            return
+        if asyncio.current_task(self.loop) is self.task:
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                return
+            stack = _frame_stack(frame, stop=self.root_frame)
+        else:
+            stack = _await_stack(self.task.get_coro())
+        if not stack:
+            return
+        # Вес — реальное время с прошлого сэмпла: интервал сна поток выдерживает неточно
+        self.weights[tuple(stack)] += (now - self.last_sample) * 1000
+        self.last_sample = now
+        self.samples += 1
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "mode": "request",
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(((self.finished or time.monotonic()) - self.started) * 1000, 1),
+            "samples": self.samples,
+            "truncated": self.truncated,
+            "pid": os.getpid(),
+        }
+
+
+class BackgroundProfile:
+    """Низкочастотные сэмплы всех потоков процесса за окно"""
+
+    def __init__(self, own_thread: Optional[int]):
+        self.id = f"bg-{int(time.time())}-{os.getpid()}-{secrets.token_hex(4)}"
+        self.own_thread = own_thread
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.last_sample = self.started
+        self.samples = 0
+        self.weights: "Counter[Tuple[StackItem, ...]]" = Counter()
+
+    def sample(self, frames: Dict[int, Any], now: float):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        dt_ms = (now - self.last_sample) * 1000
+        self.last_sample = now
+        for thread_id, frame in frames.items():
+            if thread_id == self.own_thread or _is_idle(frame):
+                continue
+            stack: List[StackItem] = [f"[thread {names.get(thread_id, thread_id)}]"]
+            stack.extend(_frame_stack(frame))
+            self.weights[tuple(stack)] += dt_ms
+        self.samples += 1
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "mode": "background",
+            "started_at": self.started_at,
+            "duration_ms": round((time.monotonic() - self.started) * 1000, 1),
+            "samples": self.samples,
+            "pid": os.getpid(),
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self.admin_token = os.getenv("PROFILING_ADMIN_TOKEN", "").strip()
+        self.interval = max(1.0, float(os.getenv("PROFILE_INTERVAL_MS", "5"))) / 1000
+        self.max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+        self.max_active = int(os.getenv("PROFILE_MAX_ACTIVE", "4"))
+        background_hz = float(os.getenv("PROFILE_BACKGROUND_HZ", "0"))
+        self.background_interval = 1 / background_hz if background_hz > 0 else None
+        self.background_window = float(os.getenv("PROFILE_BACKGROUND_WINDOW_S", "300"))
+        self.keep = int(os.getenv("PROFILE_KEEP", "100"))
+        self.directory = Path(os.getenv("PROFILE_DIR", "") or DATA_DIR / "profiles")
+        self._active: List[RequestProfile] = []
+        self._background: Optional[BackgroundProfile] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- поток сэмплирования ---
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def start(self):
+        """Запустить фоновый режим, если он включён"""
+        if self.background_interval is not None:
+            self._ensure_thread()
+
+    def stop(self):
+        """Остановить поток и сбросить накопленный фоновый профиль"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        thread.join(timeout=5)
+        self._thread = None
+        background, self._background = self._background, None
+        if background is not None and background.samples:
+            self._save(background.id, "background", to_speedscope("background", background.weights), background.meta())
+
+    def _run(self):
+        own = threading.get_ident()
+        next_background = time.monotonic()
+        while not self._stopping:
+            with self._lock:
+                active = list(self._active)
+            if not active and self.background_interval is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            now = time.monotonic()
+            take_background = self.background_interval is not None and now >= next_background
+            if active or take_background:
+                frames = sys._current_frames()
+                for profile in active:
+                    try:
+                        profile.sample(frames, now)
+                    except Exception:
+                        # Задача могла смениться между чтением состояния и стека
+                        logger.debug("Profile sample failed", exc_info=True)
+                if take_background:
+                    self._sample_background(own, frames, now)
+                    next_background = now + self.background_interval
+                del frames
+
+            timeout = self.interval if active else max(0.0, next_background - time.monotonic())
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _sample_background(self, own: int, frames: Dict[int, Any], now: float):
+        if self._background is None:
+            self._background = BackgroundProfile(own)
+        background = self._background
+        background.sample(frames, now)
+        if now - background.started >= self.background_window:
+            self._background = None
+            try:
+                self._save(background.id, "background", to_speedscope("background", background.weights), background.meta())
+            except Exception as e:
+                logger.warning(f"Failed to write background profile: {e}")
+
+    # --- профили запросов ---
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        return bool(self.admin_token) and secrets.compare_digest(token or "", self.admin_token)
+
+    def begin(self, method: str, path: str) -> Optional[RequestProfile]:
+        """Начать сэмплирование текущей задачи; None — лимит активных профилей"""
+        profile = RequestProfile(method, path, self.max_seconds)
+        with self._lock:
+            if len(self._active) >= self.max_active:
+                return None
+            self._active.append(profile)
+        self._ensure_thread()
+        self._wake.set()
+        return profile
+
+    def end(self, profile: RequestProfile):
+        with profile._lock:
+            profile.finished = time.monotonic()
+        with self._lock:
+            if profile in self._active:
+                self._active.remove(profile)
+
+    def save(self, profile: RequestProfile):
+        name = f"{profile.method} {profile.route or profile.path}"
+        self._save(profile.id, "request", to_speedscope(name, profile.weights), profile.meta())
+
+    # --- хранение ---
+
+    def _write(self, path: Path, document: Dict[str, Any]):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def _save(self, profile_id: str, mode: str, document: Dict[str, Any], meta: Dict[str, Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Сначала профиль, потом метаданные: в списке появляются только готовые
+        self._write(self.directory / f"{profile_id}.json", document)
+        self._write(self.directory / f"{profile_id}.meta.json", meta)
+        PROFILES_WRITTEN.inc(mode=mode)
+        self._prune()
+
+    def _prune(self):
+        metas = sorted(self.directory.glob("*.meta.json"), key=lambda p: p.stat().st_mtime)
+        for meta_path in metas[:max(0, len(metas) - self.keep)]:
+            profile_id = meta_path.name[:-len(".meta.json")]
+            for path in (meta_path, self.directory / f"{profile_id}.json"):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        if not self.directory.is_dir():
+            return []
+        metas = sorted(self.directory.glob("*.meta.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        result = []
+        for meta_path in metas[:limit]:
+            try:
+                result.append(json.loads(meta_path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return result
+
+    def path_for(self, profile_id: str) -> Optional[Path]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.json"
+        return path if path.is_file() else None
+
+
+profiler = Profiler()
+
+
+def _requested_token(scope) -> Optional[str]:
+    """Токен, если запрос просит профилирование (заголовок или ?__profile=)"""
+    flagged = False
+    token = None
+    for key, value in scope.get("headers", []):
+        if key == b"x-profile":
+            flagged = value.strip() not in (b"", b"0")
+        elif key == b"x-admin-token":
+            token = value.decode("latin-1")
+    if flagged:
+        return token
+    query = scope.get("query_string", b"")
+    if b"__profile=" in query:
+        return (parse_qs(query.decode("latin-1")).get("__profile") or [None])[0]
+    return None
+
+
+class ProfilingMiddleware:
+    """Профиль отдельного запроса по флагу администратора"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.admin_token or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _requested_token(scope)
+        profile = None
+        if token is not None and profiler.is_authorized(token):
+            profile = profiler.begin(scope["method"], scope["path"])
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        tracing.current_span().set_attribute("profile.id", profile.id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.end(profile)
+            profile.route = getattr(scope.get("route"), "path", None)
+            try:
+                await asyncio.to_thread(profiler.save, profile)
+            except Exception as e:
+                logger.warning(f"Failed to write profile {profile.id}: {e}")
@@ -0,0 +1,302 @@
+"""Устойчивость к сбоям провайдеров (OpenAI и локальные fallback-и).
+
+Общий слой для QA, TTS и STT:
+    * CircuitBreaker — после серии ошибок провайдер считается «сломанным»
+      и не вызывается до истечения паузы; затем пропускается пробный
+      запрос (half-open), по его результату цепь замыкается или снова
+      размыкается;
+    * строгий дедлайн на каждую попытку;
+    * hedged-запрос — если первая попытка дольше p95, параллельно
+      запускается вторая, берётся первый успешный ответ;
+    * FallbackChain — цепочка бэкендов, где провайдеры с разомкнутой
+      цепью пропускаются сразу, без ожидания таймаута.
+
+Состояние цепей у каждого воркера своё (в /metrics — худшее по воркерам):
+при сбое провайдера каждый воркер размыкает цепь после своих
+BREAKER_FAILURE_THRESHOLD ошибок — до размыкания во всех процессах
+проходит не больше WEB_CONCURRENCY × порог запросов.
+
+Настройки (переменные окружения):
+    BREAKER_FAILURE_THRESHOLD=5   ошибок подряд до размыкания
+    BREAKER_RESET_SECONDS=30      пауза до пробного запроса
+    HEDGE_ENABLED=false           разрешить hedged-запросы
+    HEDGE_MIN_DELAY=0.5           минимальная задержка перед вторым запросом, сек
+    HEDGE_MIN_SAMPLES=20          сколько замеров нужно, чтобы доверять p95
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from services import tracing
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = registry.gauge(
+    "circuit_breaker_state", "Circuit state per provider (0=closed, 1=half-open, 2=open)", ("provider",),
+    # У каждого воркера свой автомат; по всем — худшее состояние
+    multiprocess_mode="max",
+)
+BREAKER_REJECTIONS = registry.counter(
+    "circuit_breaker_rejections_total", "Calls skipped because the circuit was open", ("provider",)
+)
+HEDGED_REQUESTS = registry.counter(
+    "hedged_requests_total", "Hedged second attempts by outcome", ("provider", "winner")
+)
+DEADLINE_EXCEEDED = registry.counter(
+    "provider_deadline_exceeded_total", "Provider attempts cut off by the deadline", ("provider",)
+)
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Говорит ли ошибка о сбое провайдера (а не о плохом запросе).
+
+    Цепь размыкают таймауты, ошибки соединения, 429 и 5xx. Ответы 4xx
+    (BadRequestError и т.п. — слишком длинный текст, отказ модерации)
+    и ошибки входных данных провайдер не «ломают»: иначе серия плохих
+    запросов одного клиента отключила бы его для всех.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return not isinstance(error, (ValueError, TypeError))
+
+
+class CircuitOpenError(RuntimeError):
+    """Провайдер пропущен: цепь разомкнута"""
+
+
+class AllProvidersFailed(RuntimeError):
+    """Ни один бэкенд цепочки не ответил"""
+
+    def __init__(self, errors: List[Tuple[str, BaseException]]):
+        self.errors = errors
+        details = "; ".join(f"{name}: {type(e).__name__}: {e}" for name, e in errors) or "no providers"
+        super().__init__(f"All providers failed ({details})")
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        BREAKER_STATE.set(_STATE_VALUES[CLOSED], provider=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit '{self.name}': {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], provider=self.name)
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к провайдеру"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            # Пропускаем ровно один пробный запрос
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Пробный запрос отменён — не считаем его ни успехом, ни ошибкой"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных вызовов для оценки p95"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Provider:
+    """Провайдер с цепью, дедлайном и (опционально) hedged-запросами"""
+
+    def __init__(self, name: str, timeout: float, hedge: bool = False):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge and _env_bool("HEDGE_ENABLED", "false")
+        self.hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        p95 = self.latency.percentile(0.95)
+        if p95 is None:
+            return None
+        return max(self.hedge_min_delay, p95)
+
+    async def _attempt(self, factory: Callable[[], Awaitable[T]], deadline: float, attempt: str = "primary") -> T:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        with tracing.span(f"{self.name} attempt", kind=tracing.KIND_CLIENT, attempt=attempt,
+                          deadline_ms=round(remaining * 1000)) as span:
+            try:
+                return await asyncio.wait_for(factory(), timeout=remaining)
+            except asyncio.TimeoutError:
+                DEADLINE_EXCEEDED.inc(provider=self.name)
+                span.set_attribute("deadline_exceeded", True)
+                raise
+
+    async def call(self, factory: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Вызвать провайдера; CircuitOpenError — если цепь разомкнута"""
+        with tracing.span(f"provider {self.name}", provider=self.name, breaker=self.breaker.state):
+            return await self._call(factory, timeout)
+
+    async def _call(self, factory: Callable[[], Awaitable[T]], timeout: Optional[float]) -> T:
+        if not self.breaker.allow():
+            BREAKER_REJECTIONS.inc(provider=self.name)
+            raise CircuitOpenError(f"{self.name}: circuit open")
+
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is None or hedge_delay >= deadline - start:
+                result = await self._attempt(factory, deadline)
+            else:
+                tracing.current_span().set_attribute("hedge_delay_ms", round(hedge_delay * 1000))
+                result = await self._hedged(factory, deadline, hedge_delay)
+        except asyncio.CancelledError:
+            # Отмена запроса клиентом — не провал провайдера
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_provider_failure(e):
+                self.breaker.record_failure()
+            else:
+                tracing.current_span().set_attribute("client_error", type(e).__name__)
+                self.breaker.release_probe()
+            raise
+
+        self.breaker.record_success()
+        self.latency.observe(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, factory: Callable[[], Awaitable[T]], deadline: float, delay: float) -> T:
+        primary = asyncio.ensure_future(self._attempt(factory, deadline))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        secondary = asyncio.ensure_future(self._attempt(factory, deadline, attempt="hedge"))
+        pending = {primary, secondary}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        HEDGED_REQUESTS.inc(provider=self.name, winner="secondary" if task is secondary else "primary")
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class FallbackChain:
+    """Пробует бэкенды по порядку, пропуская те, у которых цепь разомкнута"""
+
+    def __init__(self, service: str, on_fallback: Optional[Callable[[str], None]] = None):
+        self.service = service
+        self.on_fallback = on_fallback
+
+    async def run(self, attempts: List[Tuple[Provider, Callable[[], Awaitable[T]]]]) -> T:
+        with tracing.span(f"{self.service} fallback chain", service=self.service) as span:
+            return await self._run(attempts, span)
+
+    async def _run(self, attempts: List[Tuple[Provider, Callable[[], Awaitable[T]]]], span) -> T:
+        errors: List[Tuple[str, BaseException]] = []
+        for index, (provider, factory) in enumerate(attempts):
+            if index > 0 and self.on_fallback is not None:
+                self.on_fallback(provider.name)
+            try:
+                result = await provider.call(factory)
+                span.set_attribute("provider", provider.name)
+                span.set_attribute("fallbacks", index)
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    logger.warning(f"{self.service}: provider '{provider.name}' failed: {type(e).__name__}: {e}")
+                errors.append((provider.name, e))
+        raise AllProvidersFailed(errors)
+
+
+_providers: Dict[str, Provider] = {}
+
+
+def get_provider(name: str, timeout: float, hedge: bool = False) -> Provider:
+    """Провайдер с общим на процесс состоянием цепи (по имени)"""
+    provider = _providers.get(name)
+    if provider is None:
+        provider = Provider(name, timeout=timeout, hedge=hedge)
+        _providers[name] = provider
+    return provider
@@ -0,0 +1,333 @@
+"""Синхронный показ: ведущий переключает слайды, зрители следуют за ним.
+
+Ведущий создаёт сессию (POST /api/sessions) и получает токен; его
+переходы по WebSocket (или HTTP) публикуются всем подписчикам сессии.
+Сообщение о переходе сериализуется один раз и раздаётся всем
+подключениям процесса; вместе с ним приходят подсказки предзагрузки —
+URL озвучки следующих слайдов, — а сервер заранее прогревает их синтез.
+
+Доставка между процессами (SESSION_PUBSUB):
+    local   только внутри процесса (один воркер);
+    sqlite  по умолчанию: состояние сессий в общем SQLite, каждый процесс
+            одним запросом опрашивает изменения (SESSION_POLL_INTERVAL)
+            и раздаёт их своим подключениям — работает для нескольких
+            воркеров gunicorn на одном узле;
+    redis   Redis pub/sub — для нескольких узлов (REDIS_HOST/REDIS_PORT).
+
+Прочие настройки:
+    SESSION_PREFETCH_AHEAD=2       сколько следующих слайдов подсказывать
+    SESSION_CLIENT_QUEUE=8         буфер сообщений на подключение
+    SESSION_TTL_HOURS=12           сессии без активности удаляются
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from services import decks
+from services.audio_pack import AudioPackRegistry
+from services.metrics import registry
+from services.warmup import PRERENDERED_MIN_BYTES, WarmupScheduler
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = decks.DATA_DIR / "sessions"
+REDIS_CHANNEL_PREFIX = "presentation:session:"
+
+SESSION_SUBSCRIBERS = registry.gauge(
+    "session_subscribers", "WebSocket viewers connected to this process"
+)
+SESSION_BROADCASTS = registry.counter(
+    "session_broadcasts_total", "Slide transitions fanned out to local subscribers", ("source",)
+)
+SESSION_DROPPED = registry.counter(
+    "session_messages_dropped_total", "Messages dropped for slow subscribers"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    token_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at);
+"""
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class SessionForbidden(PermissionError):
+    pass
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def audio_url(audio_packs: AudioPackRegistry, language: str, deck_name: str, slide_id: int) -> Optional[str]:
+    """URL готовой озвучки слайда в /audio или None, если её нет"""
+    filename = decks.audio_filename(slide_id)
+    if audio_packs.asset_size(language, deck_name, filename) <= PRERENDERED_MIN_BYTES:
+        return None
+    path = decks.audio_dir(language, deck_name) / filename
+    return "/audio/" + path.relative_to(decks.AUDIO_DIR).as_posix()
+
+
+class Subscriber:
+    """Очередь сообщений одного подключения; медленным клиентам
+    отбрасываются старые сообщения (каждое — полный снимок состояния)"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, message: str):
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                SESSION_DROPPED.inc()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+
+class SessionStore:
+    """Состояние сессий в SQLite (общий файл для воркеров узла)"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or os.getenv("SESSIONS_DB_PATH", "") or SESSIONS_DIR / "sessions.sqlite3")
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, session_id: str, token: str, state: Dict[str, Any]):
+        self._connect().execute(
+            "INSERT INTO sessions (id, token_hash, state, version, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, _hash_token(token), json.dumps(state, ensure_ascii=False), state["version"], time.time()),
+        )
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def check_token(self, session_id: str, token: str) -> bool:
+        row = self._connect().execute("SELECT token_hash FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row is not None and secrets.compare_digest(row[0], _hash_token(token or ""))
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        self._connect().execute(
+            "UPDATE sessions SET state = ?, version = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(state, ensure_ascii=False), state["version"], time.time(), session_id),
+        )
+
+    def changed_since(self, since: float) -> List[Dict[str, Any]]:
+        # Запас в 1 с: запись другого процесса может зафиксироваться позже
+        # более новой; повторы отсекаются по версии
+        rows = self._connect().execute(
+            "SELECT state, updated_at FROM sessions WHERE updated_at > ? ORDER BY updated_at", (since - 1.0,)
+        ).fetchall()
+        return [dict(json.loads(state), _updated_at=updated_at) for state, updated_at in rows]
+
+    def prune(self, ttl_seconds: float) -> int:
+        cursor = self._connect().execute(
+            "DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,)
+        )
+        return cursor.rowcount
+
+
+class SessionHub:
+    """Публикация переходов ведущего подписчикам сессии"""
+
+    def __init__(self, store: SessionStore, warmup_scheduler: WarmupScheduler, audio_packs: AudioPackRegistry):
+        self.store = store
+        self.warmup_scheduler = warmup_scheduler
+        self.audio_packs = audio_packs
+        self.backend = os.getenv("SESSION_PUBSUB", "sqlite").strip().lower()
+        self.prefetch_ahead = int(os.getenv("SESSION_PREFETCH_AHEAD", "2"))
+        self.client_queue = int(os.getenv("SESSION_CLIENT_QUEUE", "8"))
+        self.poll_interval = float(os.getenv("SESSION_POLL_INTERVAL", "0.25"))
+        self.ttl_seconds = float(os.getenv("SESSION_TTL_HOURS", "12")) * 3600
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        # Последняя версия каждой сессии, уже разосланная в этом процессе
+        self._delivered: Dict[str, int] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._redis = None
+
+    # --- состояние ---
+
+    def _build_state(self, session_id: str, language: str, deck_name: str, index: int, version: int) -> Dict[str, Any]:
+        slides = decks.load_slides(language, deck_name)
+        index = max(0, min(index, len(slides) - 1)) if slides else 0
+        prefetch = []
+        for slide in slides[index:index + 1 + self.prefetch_ahead]:
+            slide_id = int(slide.get("id", 0))
+            prefetch.append({"slide_id": slide_id, "audio_url": audio_url(self.audio_packs, language, deck_name, slide_id)})
+        return {
+            "type": "slide",
+            "session_id": session_id,
+            "language": language,
+            "deck": deck_name,
+            "index": index,
+            "slide_id": int(slides[index].get("id", index + 1)) if slides else None,
+            "total": len(slides),
+            "version": version,
+            "prefetch": prefetch,
+        }
+
+    def create(self, lang: Optional[str], deck: Optional[str]) -> Dict[str, Any]:
+        language, deck_name = decks.resolve_deck(lang, deck)
+        session_id = uuid.uuid4().hex[:12]
+        token = secrets.token_urlsafe(24)
+        state = self._build_state(session_id, language, deck_name, 0, 1)
+        self.store.create(session_id, token, state)
+        self.warmup_scheduler.schedule_after(language, deck_name, -1)
+        return {"session_id": session_id, "presenter_token": token, "state": state}
+
+    def get_state(self, session_id: str) -> Dict[str, Any]:
+        state = self.store.get(session_id)
+        if state is None:
+            raise SessionNotFound(session_id)
+        return state
+
+    def is_presenter(self, session_id: str, token: Optional[str]) -> bool:
+        return bool(token) and self.store.check_token(session_id, token)
+
+    async def goto(self, session_id: str, token: str, index: int) -> Dict[str, Any]:
+        """Переход ведущего на слайд `index` (0-based)"""
+        current = self.get_state(session_id)
+        if not self.is_presenter(session_id, token):
+            raise SessionForbidden(session_id)
+        state = self._build_state(session_id, current["language"], current["deck"], index, current["version"] + 1)
+        self.store.save(session_id, state)
+
+        # Озвучка следующих слайдов без готовых файлов — заранее в кеш TTS
+        self.warmup_scheduler.schedule_after(state["language"], state["deck"], state["index"])
+
+        message = json.dumps(state, ensure_ascii=False)
+        self._deliver_local(session_id, state["version"], message, source="local")
+        if self.backend == "redis":
+            await self._publish_redis(session_id, message)
+        return state
+
+    # --- подписки ---
+
+    def subscribe(self, session_id: str) -> Subscriber:
+        self._ensure_listener()
+        subscriber = Subscriber(self.client_queue)
+        self._subscribers.setdefault(session_id, set()).add(subscriber)
+        SESSION_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, session_id: str, subscriber: Subscriber):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            SESSION_SUBSCRIBERS.dec()
+            if not subscribers:
+                del self._subscribers[session_id]
+                self._delivered.pop(session_id, None)
+
+    def _deliver_local(self, session_id: str, version: int, message: str, source: str):
+        subscribers = self._subscribers.get(session_id)
+        if not subscribers or self._delivered.get(session_id, 0) >= version:
+            return
+        self._delivered[session_id] = version
+        SESSION_BROADCASTS.inc(source=source)
+        for subscriber in subscribers:
+            subscriber.push(message)
+
+    # --- доставка между процессами ---
+
+    def _ensure_listener(self):
+        if self.backend not in {"sqlite", "redis"}:
+            return
+        if self._listener is not None and not self._listener.done():
+            return
+        listener = self._listen_redis if self.backend == "redis" else self._poll_sqlite
+        self._listener = asyncio.create_task(listener())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def _poll_sqlite(self):
+        since = time.time()
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self._subscribers:
+                continue
+            try:
+                for state in self.store.changed_since(since):
+                    since = max(since, state.pop("_updated_at"))
+                    if state["session_id"] in self._subscribers:
+                        message = json.dumps(state, ensure_ascii=False)
+                        self._deliver_local(state["session_id"], state["version"], message, source="sqlite")
+                if time.monotonic() - last_prune > 3600:
+                    last_prune = time.monotonic()
+                    self.store.prune(self.ttl_seconds)
+            except sqlite3.Error:
+                logger.exception("Session poll failed")
+
+    def _redis_client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.Redis(
+                host=os.getenv("REDIS_HOST", "localhost"),
+                port=int(os.getenv("REDIS_PORT", 6379)),
+                db=0,
+                decode_responses=True,
+                socket_connect_timeout=2,
+            )
+        return self._redis
+
+    async def _publish_redis(self, session_id: str, message: str):
+        try:
+            await self._redis_client().publish(REDIS_CHANNEL_PREFIX + session_id, message)
+        except Exception as e:
+            logger.warning(f"Session publish to Redis failed: {e}")
+
+    async def _listen_redis(self):
+        while True:
+            try:
+                pubsub = self._redis_client().pubsub()
+                await pubsub.psubscribe(REDIS_CHANNEL_PREFIX + "*")
+                async for item in pubsub.listen():
+                    if item.get("type") != "pmessage":
+                        continue
+                    state = json.loads(item["data"])
+                    self._deliver_local(state["session_id"], state["version"], item["data"], source="redis")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Session Redis listener error: {e}; reconnecting")
+                await asyncio.sleep(1.0)
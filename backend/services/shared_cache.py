@@ -0,0 +1,169 @@
+"""Общий для всех воркеров кеш на SQLite.
+
+При запуске нескольких процессов (gunicorn + uvicorn workers) кеш в памяти
+у каждого свой. Этот уровень лежит в одном файле SQLite (WAL) на диске
+узла, поэтому результат, полученный одним воркером, сразу виден остальным
+и переживает перезапуск — без Redis.
+
+Настройки:
+    SHARED_CACHE_ENABLED=true
+    SHARED_CACHE_PATH=data/cache/shared_cache.sqlite3
+    SHARED_CACHE_MAX_MB=512      при превышении удаляются давно не читанные записи
+    SHARED_CACHE_TOUCH_INTERVAL=60  не чаще раза в столько секунд отмечать
+                                 чтение записи (accessed_at и продление TTL)
+
+Попадание — только чтение: отметки о чтении копятся в памяти и пишутся
+одной транзакцией (раз в TOUCH_FLUSH_SECONDS или по TOUCH_FLUSH_SIZE),
+а запись, отмеченная недавно, не отмечается снова. Иначе каждое
+попадание брало бы блокировку записи SQLite, общую для всех воркеров.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.decks import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = DATA_DIR / "cache"
+
+TOUCH_FLUSH_SECONDS = 5.0
+TOUCH_FLUSH_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries(expires_at);
+"""
+
+
+class SharedCache:
+    """Ключ-значение с TTL в SQLite; безопасно для нескольких процессов"""
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.path = Path(path or os.getenv("SHARED_CACHE_PATH", "") or CACHE_DIR / "shared_cache.sqlite3")
+        max_mb = float(os.getenv("SHARED_CACHE_MAX_MB", "512"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(max_mb * 1024 * 1024)
+        self._local = threading.local()
+        self._writes_since_prune = 0
+        self.touch_interval = float(os.getenv("SHARED_CACHE_TOUCH_INTERVAL", "60"))
+        # Ключ -> (время чтения, новый срок или 0); пишутся пачкой в flush_touches
+        self._touches: Dict[str, tuple] = {}
+        self._touches_lock = threading.Lock()
+        self._touches_flushed = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение на поток: sqlite3 не разрешает делить его между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, refresh_ttl: Optional[int] = None) -> Optional[bytes]:
+        """Значение по ключу; refresh_ttl — продлить срок записи при попадании"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        stale = now - accessed_at >= self.touch_interval
+        extend = bool(refresh_ttl) and expires_at < now + refresh_ttl - self.touch_interval
+        if stale or extend:
+            self._touch(key, now, now + refresh_ttl if extend else 0.0)
+        else:
+            self._maybe_flush_touches()
+        return bytes(value)
+
+    def _touch(self, key: str, now: float, expires_at: float):
+        with self._touches_lock:
+            self._touches[key] = (now, expires_at)
+        self._maybe_flush_touches()
+
+    def _maybe_flush_touches(self):
+        if self._touches and (
+            len(self._touches) >= TOUCH_FLUSH_SIZE
+            or time.monotonic() - self._touches_flushed >= TOUCH_FLUSH_SECONDS
+        ):
+            self.flush_touches()
+
+    def flush_touches(self):
+        """Записать накопленные отметки о чтении одной транзакцией"""
+        with self._touches_lock:
+            touches, self._touches = self._touches, {}
+            self._touches_flushed = time.monotonic()
+        if not touches:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE entries SET accessed_at = MAX(accessed_at, ?), expires_at = MAX(expires_at, ?) WHERE key = ?",
+                [(accessed_at, expires_at, key) for key, (accessed_at, expires_at) in touches.items()],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Отметки — подсказка для вытеснения, не данные: теряются без вреда
+            logger.warning(f"Shared cache touch flush failed: {e}")
+
+    def set(self, key: str, value: bytes, ttl: int):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(value), len(value), now + ttl, now),
+        )
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 50:
+            self._writes_since_prune = 0
+            self.prune()
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
+
+    def prune(self):
+        """Удалить просроченные записи и давно не читанные сверх лимита объёма"""
+        self.flush_touches()
+        conn = self._connect()
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        logger.info(f"Shared cache pruned {len(victims)} entries ({freed / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,154 @@
+"""Single-flight: один вызов провайдера на ключ — в процессе и между воркерами.
+
+Внутри процесса одинаковые запросы ждут общий Future. Между процессами
+используется файловая блокировка (fcntl.flock) на ключ: второй воркер
+ждёт, пока первый закончит, затем перепроверяет общий кеш и не делает
+повторного вызова провайдера.
+
+На платформах без fcntl (Windows) остаётся только дедупликация в процессе.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from services import tracing
+from services.shared_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _LeaderCancelled(Exception):
+    """Ведущий вызов отменён — ожидающие повторяют do() сами"""
+
+
+class SingleFlight:
+    """Дедупликация дорогих вызовов по ключу"""
+
+    def __init__(self, lock_dir: Optional[Path] = None):
+        self.cross_process = FCNTL_AVAILABLE and os.getenv("SINGLEFLIGHT_CROSS_PROCESS", "true").strip().lower() in {
+            "1", "true", "yes", "y", "on",
+        }
+        self.lock_dir = Path(lock_dir or CACHE_DIR / "locks")
+        self.lock_timeout = float(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "120"))
+        self.poll_interval = 0.05
+        self._inflight: Dict[str, asyncio.Future] = {}
+        if self.cross_process:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+    def _lock_path(self, key: str) -> Path:
+        return self.lock_dir / (hashlib.md5(key.encode()).hexdigest() + ".lock")
+
+    async def _acquire(self, key: str) -> Tuple[Optional[_FileLock], bool]:
+        """Дождаться межпроцессной блокировки.
+
+        Возвращает (блокировка или None, пришлось ли ждать другой процесс).
+        """
+        if not self.cross_process:
+            return None, False
+        lock = _FileLock(self._lock_path(key))
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while not lock.try_acquire():
+            waited = True
+            if time.monotonic() >= deadline:
+                # Владелец завис — лучше продублировать вызов, чем ждать вечно
+                logger.warning(f"Single-flight lock timeout for {key}, proceeding without it")
+                return None, True
+            await asyncio.sleep(self.poll_interval)
+        return lock, waited
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[T]],
+        recheck: Optional[Callable[[], Optional[T]]] = None,
+    ) -> T:
+        """Выполнить factory() один раз на ключ.
+
+        recheck вызывается, если пришлось ждать блокировку другого воркера:
+        если тот уже положил результат в общий кеш, он возвращается без
+        повторного вызова factory().
+
+        Отмена ведущего (клиент ушёл) не отменяет ожидающих: они заходят
+        в do() снова, и один из них становится ведущим.
+        """
+        while True:
+            existing = self._inflight.get(key)
+            if existing is None:
+                break
+            try:
+                with tracing.span("singleflight.join"):
+                    return await asyncio.shield(existing)
+            except _LeaderCancelled:
+                continue
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        lock: Optional[_FileLock] = None
+        try:
+            with tracing.span("singleflight.lock") as span:
+                lock, waited = await self._acquire(key)
+                span.set_attribute("waited", waited)
+            # recheck читает общий кеш (SQLite) — не в цикле событий
+            result = await asyncio.to_thread(recheck) if (recheck is not None and waited) else None
+            if result is None:
+                result = await factory()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Ключ освобождается до пробуждения ожидающих, чтобы они не
+            # нашли отменённый future снова
+            self._release_key(key, future)
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже отдано вызывающему; ожидающим — через future
+            future.exception()
+            raise
+        finally:
+            if lock is not None:
+                lock.release()
+            self._release_key(key, future)
+
+    def _release_key(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
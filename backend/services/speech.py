@@ -0,0 +1,107 @@
+"""Озвучка текста через кеш: общий путь для /api/tts, /api/qa и прогрева.
+
+Порядок: кеш (память -> SQLite -> Redis) -> single-flight по ключу
+(в процессе и между воркерами) -> синтез -> запись во все уровни кеша.
+Ключ кеша и синтез строятся по канонической форме текста
+(services/tts_text): эмодзи, пробелы и запись чисел не плодят промахов.
+Класс записи (services/cache_policy: озвучка слайда, ответа, прочее)
+задаёт её срок жизни и долю памяти кеша.
+
+На общих уровнях аудио хранится сжатым; его (де)кодирование занимает
+десятки-сотни миллисекунд CPU, поэтому идёт в потоке, а не в event loop.
+
+Заглушка (тишина, когда все провайдеры TTS недоступны) не кешируется ни
+на одном уровне; вызывающий может потребовать ошибку вместо неё
+(allow_fallback=False -> SpeechUnavailable).
+"""
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+from services import audio_meta, tracing
+from services.cache import CacheService
+from services.cache_policy import ADHOC
+from services.huggingface_tts import HuggingFaceTTS
+from services.metrics import TTS_CHARACTERS
+from services.singleflight import SingleFlight
+from services.tts_text import canonicalize
+
+
+class SpeechUnavailable(RuntimeError):
+    """Провайдеры TTS недоступны: вместо озвучки получена заглушка"""
+
+    def __init__(self, audio_data: bytes):
+        self.audio_data = audio_data
+        super().__init__("TTS providers are unavailable, got placeholder audio")
+
+
+class SpeechService:
+    def __init__(self, tts_service: HuggingFaceTTS, cache: CacheService, single_flight: SingleFlight):
+        self.tts_service = tts_service
+        self.cache = cache
+        self.single_flight = single_flight
+
+    def is_cached(self, text: str, language: str) -> bool:
+        return self.cache.has_tts_cache(canonicalize(text, language), language)
+
+    async def get_cached(self, text: str, language: str, entry_class: str = ADHOC) -> Optional[bytes]:
+        """Аудио из кеша (любой уровень) без обращения к провайдеру"""
+        text = canonicalize(text, language)
+        if self.cache.has_tts_cache(text, language):
+            audio_data = self.cache.get_tts_cache(text, language, entry_class)
+            if audio_data:
+                return audio_data
+        return await asyncio.to_thread(self.cache.get_tts_cache, text, language, entry_class)
+
+    async def get_meta(self, text: str, language: str, audio_data: bytes) -> Optional[Dict[str, Any]]:
+        """Метаданные озвучки (длительность, громкость, пики) — из кеша
+        или расчётом; None — аудио не WAV"""
+        text = canonicalize(text, language)
+
+        def load() -> Optional[Dict[str, Any]]:
+            meta = self.cache.get_tts_meta(text, language)
+            # Запись могла остаться от другой версии аудио под тем же ключом
+            if meta is None or meta.get("bytes") != len(audio_data):
+                meta = audio_meta.analyze(audio_data)
+                if meta is not None:
+                    self.cache.set_tts_meta(text, meta, language)
+            return meta
+
+        return await asyncio.to_thread(load)
+
+    async def get_audio(
+        self, text: str, language: str, entry_class: str = ADHOC, allow_fallback: bool = True
+    ) -> Tuple[bytes, bool]:
+        """Вернуть (аудио WAV, было ли оно в кеше).
+
+        allow_fallback=False — вместо заглушки поднять SpeechUnavailable
+        (для записи в файлы, прогрева и задач).
+        """
+        with tracing.span("speech.get_audio", language=language, chars=len(text), entry_class=entry_class) as span:
+            audio_data, cached, cacheable = await self._get_audio(text, language, entry_class)
+            span.set_attribute("cached", cached)
+            span.set_attribute("fallback", not cacheable)
+            if not cacheable and not allow_fallback:
+                raise SpeechUnavailable(audio_data)
+            return audio_data, cached
+
+    async def _get_audio(self, text: str, language: str, entry_class: str) -> Tuple[bytes, bool, bool]:
+        TTS_CHARACTERS.inc(len(text), stage="requested")
+        text = canonicalize(text, language)
+        cached = await self.get_cached(text, language, entry_class)
+        if cached:
+            return cached, True, True
+
+        async def synthesize() -> Tuple[bytes, bool]:
+            audio_data, cacheable = await self.tts_service.synthesize_cacheable(text, language)
+            if cacheable:
+                await asyncio.to_thread(self.cache.set_tts_cache, text, audio_data, language, entry_class)
+            return audio_data, cacheable
+
+        def recheck() -> Optional[Tuple[bytes, bool]]:
+            audio_data = self.cache.get_tts_cache_shared(text, language, entry_class)
+            return (audio_data, True) if audio_data is not None else None
+
+        audio_data, cacheable = await self.single_flight.do(
+            self.cache.tts_key(text, language), synthesize, recheck=recheck
+        )
+        return audio_data, False, cacheable
@@ -0,0 +1,485 @@
+"""Трассировка запросов в стиле OpenTelemetry без внешних зависимостей.
+
+Каждый HTTP-запрос (и каждая фоновая задача) — трасса: корневой span
+и вложенные span-ы вызовов сервисов, уровней кеша, попыток провайдеров.
+Текущий span хранится в contextvars, поэтому вложенность сохраняется
+через await, asyncio.to_thread и задачи, созданные внутри запроса.
+
+Совместимость:
+    * входящий заголовок W3C `traceparent` продолжает чужую трассу;
+    * в ответе — `traceparent` и `X-Trace-Id` (по нему трассу ищут в логах);
+    * экспорт в OTLP/HTTP JSON, если задан OTEL_EXPORTER_OTLP_ENDPOINT.
+
+Выборка. Span-ы трассы копятся в памяти до конца корневого span-а, и
+только тогда решается, экспортировать ли её:
+    * head-выборка — доля TRACE_SAMPLE_RATE (или флаг sampled у входящего
+      traceparent);
+    * tail-выборка — всегда экспортируются трассы дольше TRACE_SLOW_MS и
+      завершившиеся ошибкой; именно они нужны для разбора хвостов латентности.
+Экспорт идёт в фоновом потоке и не задерживает ответы.
+
+Настройки:
+    TRACING_ENABLED=true
+    TRACE_SAMPLE_RATE=0.01
+    TRACE_SLOW_MS=2000
+    TRACE_EXPORTERS=file            через запятую: file, console, otlp
+    TRACE_FILE=data/traces/traces.jsonl
+    TRACE_FILE_MAX_MB=50            при превышении файл переименовывается в .1
+    TRACE_MAX_SPANS=256             span-ов на трассу, остальные отбрасываются
+    OTEL_SERVICE_NAME=presentation-backend
+    OTEL_EXPORTER_OTLP_ENDPOINT=    например http://collector:4318
+    OTEL_EXPORTER_OTLP_HEADERS=     key=value,key2=value2
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from services.decks import DATA_DIR
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TRACES_EXPORTED = registry.counter(
+    "traces_exported_total", "Finished traces by export decision", ("reason",)
+)
+TRACES_DROPPED = registry.counter(
+    "traces_dropped_total", "Traces dropped because the export queue was full"
+)
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+class _Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "max_spans", "dropped")
+
+    def __init__(self, trace_id: str, sampled: bool, max_spans: int):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.max_spans = max_spans
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status",
+                 "status_message", "events")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.events: List[Tuple[int, str, Dict[str, Any]]] = []
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+        self.add_event("exception", type=type(error).__name__, message=str(error)[:500])
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+        }
+        if self.status == STATUS_ERROR:
+            data["error"] = self.status_message
+        if self.events:
+            data["events"] = [{"t_ms": round((t - self.start_ns) / 1e6, 3), "name": n, **a} for t, n, a in self.events]
+        return data
+
+
+class _NoopSpan:
+    """Заглушка вне трассы или при выключенной трассировке"""
+
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes: Any):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+# Завершённая трасса для экспортёров: запись для JSON (файл, консоль)
+# и сами span-ы (OTLP) — объекты Span в JSON не попадают
+ExportItem = Tuple[Dict[str, Any], List[Span]]
+
+
+# --- экспорт ---
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class FileExporter:
+    """Трасса — строка JSON в файле (удобно для jq и grep по trace_id)"""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, traces: List[ExportItem]):
+        try:
+            if self.path.stat().st_size > self.max_bytes:
+                os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            for trace, _ in traces:
+                f.write(json.dumps(trace, ensure_ascii=False, default=str) + "\n")
+
+
+class ConsoleExporter:
+    def export(self, traces: List[ExportItem]):
+        for trace, _ in traces:
+            spans = sorted(trace["spans"], key=lambda s: s["start_ns"])
+            lines = [f"trace {trace['trace_id']} {trace['name']} {trace['duration_ms']:.1f} ms ({trace['reason']})"]
+            depth: Dict[Optional[str], int] = {}
+            for span in spans:
+                level = depth.get(span["parent_id"], 0) + 1 if span["parent_id"] in depth else 0
+                depth[span["span_id"]] = level
+                error = f" ERROR {span['error']}" if "error" in span else ""
+                lines.append(f"  {'  ' * level}{span['name']} {span['duration_ms']:.1f} ms{error}")
+            logger.info("\n".join(lines))
+
+
+class OTLPExporter:
+    """OTLP/HTTP с JSON-кодированием (коллектор OpenTelemetry, Jaeger, Tempo)"""
+
+    def __init__(self, endpoint: str, headers: Dict[str, str], service_name: str):
+        self.url = endpoint if endpoint.endswith("/v1/traces") else endpoint.rstrip("/") + "/v1/traces"
+        self.headers = dict(headers, **{"Content-Type": "application/json"})
+        self.service_name = service_name
+        self._client = None
+
+    def _encode(self, traces: List[ExportItem]) -> Dict[str, Any]:
+        spans = []
+        for _, raw in traces:
+            for span in raw:
+                item: Dict[str, Any] = {
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": _otlp_attributes(span.attributes),
+                    "status": {"code": span.status, "message": span.status_message},
+                }
+                if span.parent_id:
+                    item["parentSpanId"] = span.parent_id
+                if span.events:
+                    item["events"] = [
+                        {"timeUnixNano": str(t), "name": n, "attributes": _otlp_attributes(a)} for t, n, a in span.events
+                    ]
+                spans.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{"scope": {"name": "presentation.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def export(self, traces: List[ExportItem]):
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.Client(timeout=5.0)
+        response = self._client.post(self.url, headers=self.headers, content=json.dumps(self._encode(traces)))
+        if response.status_code >= 300:
+            logger.warning(f"OTLP export failed: HTTP {response.status_code}")
+
+
+def _parse_headers(raw: str) -> Dict[str, str]:
+    headers = {}
+    for item in raw.split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip():
+            headers[key.strip()] = value.strip()
+    return headers
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = _env_bool("TRACING_ENABLED", "true")
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+        self.slow_ms = float(os.getenv("TRACE_SLOW_MS", "2000"))
+        self.max_spans = int(os.getenv("TRACE_MAX_SPANS", "256"))
+        self.service_name = os.getenv("OTEL_SERVICE_NAME", "presentation-backend")
+        self._queue: "queue.Queue[ExportItem]" = queue.Queue(maxsize=1000)
+        self._exporters: Optional[list] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _build_exporters(self) -> list:
+        names = {n.strip().lower() for n in os.getenv("TRACE_EXPORTERS", "file").split(",") if n.strip()}
+        endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+        exporters: list = []
+        if "file" in names:
+            path = Path(os.getenv("TRACE_FILE", "") or DATA_DIR / "traces" / "traces.jsonl")
+            max_mb = float(os.getenv("TRACE_FILE_MAX_MB", "50"))
+            exporters.append(FileExporter(path, int(max_mb * 1024 * 1024)))
+        if "console" in names:
+            exporters.append(ConsoleExporter())
+        if endpoint.strip():
+            headers = _parse_headers(os.getenv("OTEL_EXPORTER_OTLP_HEADERS", ""))
+            exporters.append(OTLPExporter(endpoint.strip(), headers, self.service_name))
+        return exporters
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._exporters = self._build_exporters()
+                self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Всё, что накопилось, — одной пачкой
+            while len(batch) < 64:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for exporter in self._exporters or []:
+                try:
+                    exporter.export(batch)
+                except Exception as e:
+                    logger.warning(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+    def flush(self, timeout: float = 2.0):
+        """Дождаться выгрузки очереди (для остановки и тестов)"""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _finish(self, root: Span):
+        trace = root.trace
+        duration_ms = root.duration_ms
+        if trace.sampled:
+            reason = "sampled"
+        elif root.status == STATUS_ERROR or any(s.status == STATUS_ERROR for s in trace.spans):
+            reason = "error"
+        elif duration_ms >= self.slow_ms:
+            reason = "slow"
+        else:
+            TRACES_EXPORTED.inc(reason="discarded")
+            return
+        TRACES_EXPORTED.inc(reason=reason)
+        self._ensure_worker()
+        record = {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "service": self.service_name,
+            "reason": reason,
+            "start_ns": root.start_ns,
+            "duration_ms": round(duration_ms, 3),
+            "dropped_spans": trace.dropped,
+            "spans": [s.to_dict() for s in trace.spans],
+        }
+        try:
+            self._queue.put_nowait((record, list(trace.spans)))
+        except queue.Full:
+            TRACES_DROPPED.inc()
+
+    # --- API ---
+
+    @contextmanager
+    def start_trace(self, name: str, traceparent: Optional[str] = None, kind: int = KIND_SERVER,
+                    **attributes: Any) -> Iterator[Any]:
+        """Корневой span (запрос, фоновая задача). Внутри уже идущей трассы — обычный span"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        if _current.get() is not None:
+            with self.span(name, kind=kind, **attributes) as child:
+                yield child
+            return
+
+        parent_id = None
+        match = _TRACEPARENT.match((traceparent or "").strip().lower())
+        if match and match.group(1) != "0" * 32:
+            trace_id, parent_id = match.group(1), match.group(2)
+            sampled = bool(int(match.group(3), 16) & 1)
+        else:
+            trace_id = random.getrandbits(128).to_bytes(16, "big").hex()
+            sampled = random.random() < self.sample_rate
+        trace = _Trace(trace_id, sampled, self.max_spans)
+        root = Span(trace, name, parent_id, kind, attributes)
+        trace.spans.append(root)
+        token = _current.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            # Как и в span(): отмена — не ошибка и не повод сохранять трассу
+            if isinstance(e, Exception):
+                root.record_exception(e)
+            else:
+                root.set_attribute("cancelled", True)
+            raise
+        finally:
+            _current.reset(token)
+            root.end_ns = time.time_ns()
+            self._finish(root)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Any]:
+        """Вложенный span; вне трассы — заглушка без накладных расходов"""
+        parent = _current.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        trace = parent.trace
+        if len(trace.spans) >= trace.max_spans:
+            trace.dropped += 1
+            yield NOOP_SPAN
+            return
+        span = Span(trace, name, parent.span_id, kind, attributes)
+        trace.spans.append(span)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            # Отмена (клиент ушёл, проигравшая hedged-попытка) — не ошибка
+            if isinstance(e, Exception):
+                span.record_exception(e)
+            else:
+                span.set_attribute("cancelled", True)
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+
+
+tracer = Tracer()
+span = tracer.span
+start_trace = tracer.start_trace
+
+
+def current_span() -> Any:
+    return _current.get() or NOOP_SPAN
+
+
+def traceparent() -> Optional[str]:
+    """traceparent текущего span-а для исходящих запросов и ответа"""
+    current = _current.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-{'01' if current.trace.sampled else '00'}"
+
+
+class TracingMiddleware:
+    """Корневой span на HTTP-запрос; trace id возвращается в заголовках ответа"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                incoming = value.decode("latin-1")
+                break
+
+        method = scope["method"]
+        with tracer.start_trace(f"{method} {scope['path']}", traceparent=incoming,
+                                **{"http.method": method, "http.target": scope["path"]}) as root:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    root.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        root.set_error(f"HTTP {status}")
+                    headers = list(message.get("headers", []))
+                    headers.append((b"traceparent", (traceparent() or "").encode("latin-1")))
+                    headers.append((b"x-trace-id", root.trace_id.encode("latin-1")))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Шаблон маршрута известен после роутинга: GET /api/slides/{slide_id}
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.name = f"{method} {route}"
+                    root.set_attribute("http.route", route)
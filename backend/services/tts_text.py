@@ -0,0 +1,453 @@
+"""Канонизация текста перед синтезом речи (ky/ru).
+
+Тексты слайдов и ответов содержат эмодзи, маркеры списков и лишние
+пробелы, которые провайдер TTS тарифицирует как символы, а кеш — как
+разные ключи. Перед хешированием и синтезом текст приводится к одной
+форме:
+
+    * Unicode NFC, типографские дефисы/пробелы/кавычки -> обычные,
+      «...» -> «…»;
+    * эмодзи, пиктограммы и маркеры списков удаляются, строки списка
+      превращаются в отдельные предложения; «№» и «°» читаются словами;
+    * латинские буквы-двойники внутри кириллических слов заменяются
+      кириллическими («Pоссия» с латинской P -> «Россия»);
+    * пробелы схлопываются;
+    * числа и сокращения раскрываются словами там, где форма однозначна:
+      годы перед «год/года/году/г.» (ru) и «N-жылы» (ky) — порядковыми;
+      в кыргызском числительное не согласуется с существительным, и
+      отдельные целые читаются количественными. В русском количественное
+      согласуется в роде и падеже («одна минута», «в 30 странах»),
+      поэтому словами — только номер («№ 5») и градусы, остальные числа
+      остаются цифрами: их склоняет провайдер, а неверная форма хуже цифр.
+      Разряды через пробел («15 000», «1 000 000») — одно число; числа с
+      ведущим нулём и группы цифр подряд (телефоны, коды) не трогаются.
+
+Функция идемпотентна: повторная канонизация текст не меняет, поэтому
+её можно вызывать и в SpeechService (ключ кеша), и перед провайдером.
+
+split_for_tts делит длинный (канонический) текст на части, которые
+провайдер примет за один запрос (OpenAI TTS — до 4096 символов).
+
+Настройки:
+    TTS_CANONICALIZE=true
+    TTS_MAX_INPUT_CHARS=4096
+"""
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("TTS_CANONICALIZE", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+MAX_INPUT_CHARS = int(os.getenv("TTS_MAX_INPUT_CHARS", "4096"))
+
+# --- символы ---
+
+_CHAR_MAP = {
+    "\u00a0": " ", "\u2002": " ", "\u2003": " ", "\u2009": " ", "\u200a": " ", "\u202f": " ", "\u3000": " ",
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2212": "-",
+    "\u2013": "—", "\u2015": "—",
+    "“": "\"", "”": "\"", "„": "\"", "‟": "\"",
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+}
+# Невидимые символы: ZWSP/ZWNJ/ZWJ, word joiner, BOM, мягкий перенос
+_INVISIBLE = {"\u200b", "\u200c", "\u200d", "\u2060", "\ufeff", "\u00ad"}
+_BULLETS = set("•‣◦⁃∙·▪▫■□●○◆◇►▶➤➢✓✔✗✘★☆")
+_TRANSLATE = str.maketrans({**_CHAR_MAP, **{ch: "" for ch in _INVISIBLE}})
+
+# Латиница, совпадающая по начертанию с кириллицей
+_LOOKALIKES = str.maketrans("AaBCcEeHKMOoPpTXxy", "АаВСсЕеНКМОоРрТХху")
+_LATIN_LOOKALIKE = re.compile(r"[AaBCcEeHKMOoPpTXxy]")
+_WORD = re.compile(r"\w+")
+
+
+# Блоки, где символы категории So — эмодзи и пиктограммы: стрелки,
+# технические знаки, рамки и геометрические фигуры, разные символы
+# и дингбаты, эмодзи. Остальные So (№, ©, ®, ™) несут смысл и остаются
+_PICTOGRAPHIC_RANGES = (
+    (0x2190, 0x21FF), (0x2300, 0x23FF), (0x2500, 0x27BF), (0x2B00, 0x2BFF),
+    (0x3030, 0x303D), (0x3297, 0x3299), (0x1F000, 0x1FAFF),
+)
+
+
+def _is_decorative(ch: str) -> bool:
+    if ch in _BULLETS:
+        return True
+    code = ord(ch)
+    category = unicodedata.category(ch)
+    # Co — private use (иконочные шрифты), Sk — модификаторы тона кожи,
+    # Mn в диапазоне селекторов вариантов (U+FE0F и др.)
+    if category == "Co":
+        return True
+    if category == "So":
+        return any(low <= code <= high for low, high in _PICTOGRAPHIC_RANGES)
+    if category == "Sk" and code > 0x2000:
+        return True
+    return 0xFE00 <= code <= 0xFE0F or 0xE0000 <= code <= 0xE007F
+
+
+def _strip_decorative(text: str) -> str:
+    return "".join(" " if _is_decorative(ch) else ch for ch in text)
+
+
+def _fix_lookalikes(text: str) -> str:
+    def fix(match: "re.Match[str]") -> str:
+        word = match.group()
+        if _LATIN_LOOKALIKE.search(word) and any("Ѐ" <= ch <= "ӿ" for ch in word):
+            return word.translate(_LOOKALIKES)
+        return word
+
+    return _WORD.sub(fix, text)
+
+
+def _lines_to_sentences(text: str) -> str:
+    """Строки списков -> предложения (пауза вместо склеивания строк)"""
+    lines = [line.strip(" \t-—") for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    out = []
+    for line in lines:
+        if line[-1] not in ".!?:;,…" and len(lines) > 1:
+            line += "."
+        out.append(line)
+    return " ".join(out)
+
+
+# --- числа: русский ---
+
+_RU_UNITS_M = ["", "один", "два", "три", "четыре", "пять", "шесть", "семь", "восемь", "девять"]
+_RU_UNITS_F = ["", "одна", "две", "три", "четыре", "пять", "шесть", "семь", "восемь", "девять"]
+_RU_TEENS = ["десять", "одиннадцать", "двенадцать", "тринадцать", "четырнадцать", "пятнадцать",
+             "шестнадцать", "семнадцать", "восемнадцать", "девятнадцать"]
+_RU_TENS = ["", "", "двадцать", "тридцать", "сорок", "пятьдесят", "шестьдесят", "семьдесят", "восемьдесят", "девяносто"]
+_RU_HUNDREDS = ["", "сто", "двести", "триста", "четыреста", "пятьсот", "шестьсот", "семьсот", "восемьсот", "девятьсот"]
+# (единственное, 2–4, 5+) и род
+_RU_SCALES = [
+    (("тысяча", "тысячи", "тысяч"), True),
+    (("миллион", "миллиона", "миллионов"), False),
+    (("миллиард", "миллиарда", "миллиардов"), False),
+]
+
+# Порядковые: основа + окончание именительного падежа (м. р.)
+_RU_ORD_UNITS = [None, ("перв", "ый"), ("втор", "ой"), None, ("четвёрт", "ый"), ("пят", "ый"), ("шест", "ой"),
+                 ("седьм", "ой"), ("восьм", "ой"), ("девят", "ый")]
+_RU_ORD_TEENS = [("десят", "ый"), ("одиннадцат", "ый"), ("двенадцат", "ый"), ("тринадцат", "ый"),
+                 ("четырнадцат", "ый"), ("пятнадцат", "ый"), ("шестнадцат", "ый"), ("семнадцат", "ый"),
+                 ("восемнадцат", "ый"), ("девятнадцат", "ый")]
+_RU_ORD_TENS = [None, None, ("двадцат", "ый"), ("тридцат", "ый"), ("сороков", "ой"), ("пятидесят", "ый"),
+                ("шестидесят", "ый"), ("семидесят", "ый"), ("восьмидесят", "ый"), ("девяност", "ый")]
+_RU_ORD_HUNDREDS = [None, ("сот", "ый"), ("двухсот", "ый"), ("трёхсот", "ый"), ("четырёхсот", "ый"),
+                    ("пятисот", "ый"), ("шестисот", "ый"), ("семисот", "ый"), ("восьмисот", "ый"), ("девятисот", "ый")]
+_RU_ORD_THOUSANDS = [None, ("тысячн", "ый"), ("двухтысячн", "ый"), ("трёхтысячн", "ый"), ("четырёхтысячн", "ый"),
+                     ("пятитысячн", "ый"), ("шеститысячн", "ый"), ("семитысячн", "ый"), ("восьмитысячн", "ый"),
+                     ("девятитысячн", "ый")]
+# Окончания порядковых по падежам: nom, gen, dat, ins, prep
+_RU_ORD_ENDINGS = {"nom": None, "gen": "ого", "dat": "ому", "ins": "ым", "prep": "ом"}
+_RU_THIRD = {"nom": "третий", "gen": "третьего", "dat": "третьему", "ins": "третьим", "prep": "третьем"}
+
+
+def _ru_plural(n: int, forms: Tuple[str, str, str]) -> str:
+    if n % 10 == 1 and n % 100 != 11:
+        return forms[0]
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+def _ru_triplet(n: int, feminine: bool) -> List[str]:
+    words = [_RU_HUNDREDS[n // 100]]
+    rest = n % 100
+    if 10 <= rest < 20:
+        words.append(_RU_TEENS[rest - 10])
+    else:
+        words.append(_RU_TENS[rest // 10])
+        words.append((_RU_UNITS_F if feminine else _RU_UNITS_M)[rest % 10])
+    return [w for w in words if w]
+
+
+def ru_cardinal(n: int) -> str:
+    if n == 0:
+        return "ноль"
+    words: List[str] = []
+    groups = []
+    while n:
+        groups.append(n % 1000)
+        n //= 1000
+    for scale in range(len(groups) - 1, -1, -1):
+        group = groups[scale]
+        if not group:
+            continue
+        if scale == 0:
+            words += _ru_triplet(group, False)
+        elif scale - 1 < len(_RU_SCALES):
+            forms, feminine = _RU_SCALES[scale - 1]
+            # «тысяча», а не «одна тысяча»
+            words += [] if (group == 1 and scale == 1) else _ru_triplet(group, feminine)
+            words.append(_ru_plural(group, forms))
+    return " ".join(words)
+
+
+def _ru_ordinal_word(stem_ending: Tuple[str, str], case: str) -> str:
+    stem, nominative = stem_ending
+    ending = _RU_ORD_ENDINGS[case]
+    if ending is None:
+        return stem + nominative
+    return stem + ending
+
+
+def ru_ordinal(n: int, case: str = "nom") -> Optional[str]:
+    """Порядковое (м. р.) в падеже; None — форма не поддерживается"""
+    if n <= 0 or n >= 10000:
+        return None
+    thousands, rest = divmod(n, 1000)
+    if rest == 0:
+        return _ru_ordinal_word(_RU_ORD_THOUSANDS[thousands], case)
+    prefix = ru_cardinal(thousands * 1000).split() if thousands else []
+    hundreds, below = divmod(rest, 100)
+    if below == 0:
+        return " ".join(prefix + [_ru_ordinal_word(_RU_ORD_HUNDREDS[hundreds], case)])
+    if hundreds:
+        prefix.append(_RU_HUNDREDS[hundreds])
+    if below < 10:
+        last = _RU_THIRD[case] if below == 3 else _ru_ordinal_word(_RU_ORD_UNITS[below], case)
+    elif below < 20:
+        last = _ru_ordinal_word(_RU_ORD_TEENS[below - 10], case)
+    elif below % 10 == 0:
+        last = _ru_ordinal_word(_RU_ORD_TENS[below // 10], case)
+    else:
+        prefix.append(_RU_TENS[below // 10])
+        unit = below % 10
+        last = _RU_THIRD[case] if unit == 3 else _ru_ordinal_word(_RU_ORD_UNITS[unit], case)
+    return " ".join(prefix + [last])
+
+
+# Падеж после предлога перед «г.»
+_RU_PREP_CASE = {
+    "в": "prep", "во": "prep", "о": "prep", "об": "prep", "на": "prep", "при": "prep",
+    "с": "gen", "со": "gen", "до": "gen", "от": "gen", "после": "gen", "около": "gen", "из": "gen",
+    "для": "gen", "без": "gen", "начиная": "gen", "к": "dat", "ко": "dat", "по": "dat",
+}
+_RU_YEAR_WORDS = {"год": "nom", "года": "gen", "году": "prep", "годом": "ins"}
+_RU_YEAR_FORMS = {"nom": "год", "gen": "года", "dat": "году", "ins": "годом", "prep": "году"}
+# После этих предлогов количественное числительное склоняется — цифры не трогаем
+_RU_CASE_PREPOSITIONS = {
+    "в", "во", "о", "об", "на", "при", "с", "со", "до", "от", "после", "около", "из", "для", "без",
+    "к", "ко", "по", "у", "более", "менее", "свыше", "против", "среди", "между", "из-за", "кроме",
+}
+_RU_ABBREVIATIONS = [
+    (re.compile(r"\bт\.\s?е\.", re.IGNORECASE), "то есть"),
+    (re.compile(r"\bт\.\s?д\."), "так далее"),
+    (re.compile(r"\bт\.\s?п\."), "тому подобное"),
+    (re.compile(r"\bт\.\s?к\."), "так как"),
+    (re.compile(r"\bи\s+др\."), "и другие"),
+    (re.compile(r"\bсм\.\s"), "смотри "),
+    (re.compile(r"\bнапр\."), "например"),
+    (re.compile(r"\bруб\.(?=\s|$)"), "рублей"),
+    (re.compile(r"\bмин\.(?=\s|$)"), "минут"),
+]
+
+
+def _previous_word(text: str, position: int) -> str:
+    match = re.search(r"([\w-]+)\W*$", text[max(0, position - 40):position])
+    return match.group(1).lower() if match else ""
+
+
+def _ru_numbers(text: str) -> str:
+    def year(match: "re.Match[str]") -> str:
+        number, word = int(match.group(1)), match.group(2)
+        if word == "г.":
+            case = _RU_PREP_CASE.get(_previous_word(text, match.start()), "nom")
+            word = _RU_YEAR_FORMS[case]
+        else:
+            case = _RU_YEAR_WORDS[word]
+        ordinal = ru_ordinal(number, case)
+        return f"{ordinal} {word}" if ordinal else match.group()
+
+    text = re.sub(r"(?<![\w.,])(\d{1,4})\s+(годом|году|года|год|г\.)(?!\w)", year, text)
+
+    def cardinal(match: "re.Match[str]") -> str:
+        if match.group(2) and _previous_word(text, match.start()) in _RU_CASE_PREPOSITIONS:
+            return match.group()
+        return ru_cardinal(int(match.group()))
+
+    return _RU_KNOWN_FORM.sub(cardinal, text)
+
+
+# --- числа: кыргызский ---
+
+_KY_UNITS = ["", "бир", "эки", "үч", "төрт", "беш", "алты", "жети", "сегиз", "тогуз"]
+_KY_TENS = ["", "он", "жыйырма", "отуз", "кырк", "элүү", "алтымыш", "жетимиш", "сексен", "токсон"]
+_KY_SCALES = ["", "миң", "миллион", "миллиард"]
+_KY_VOWELS = "аеёиоөуүыэюя"
+# Гармония гласных: последний гласный основы -> гласный суффикса
+_KY_HARMONY = {"а": "ы", "ы": "ы", "я": "ы", "е": "и", "и": "и", "э": "и", "о": "у", "у": "у", "ё": "у", "ю": "у",
+               "ө": "ү", "ү": "ү"}
+
+
+def ky_cardinal(n: int) -> str:
+    if n == 0:
+        return "нөл"
+    words: List[str] = []
+    groups = []
+    while n:
+        groups.append(n % 1000)
+        n //= 1000
+    for scale in range(len(groups) - 1, -1, -1):
+        group = groups[scale]
+        if not group or scale >= len(_KY_SCALES):
+            continue
+        hundreds, rest = divmod(group, 100)
+        if hundreds:
+            # «жүз», а не «бир жүз»
+            words += (["жүз"] if hundreds == 1 else [_KY_UNITS[hundreds], "жүз"])
+        words += [w for w in (_KY_TENS[rest // 10], _KY_UNITS[rest % 10]) if w]
+        if scale:
+            words.append(_KY_SCALES[scale])
+    return " ".join(words)
+
+
+def ky_ordinal(n: int) -> str:
+    words = ky_cardinal(n).split()
+    last = words[-1]
+    vowel = next((ch for ch in reversed(last) if ch in _KY_VOWELS), "ы")
+    harmony = _KY_HARMONY.get(vowel, "ы")
+    suffix = f"нч{harmony}" if last[-1] in _KY_VOWELS else f"{harmony}нч{harmony}"
+    words[-1] = last + suffix
+    return " ".join(words)
+
+
+_KY_ABBREVIATIONS = [
+    (re.compile(r"\bж\.\s?б\."), "жана башка"),
+    (re.compile(r"\bб\.\s?а\."), "башкача айтканда"),
+    (re.compile(r"\bмис\."), "мисалы"),
+]
+
+
+def _ky_numbers(text: str) -> str:
+    # 1948-жылы, 5-класс: число с суффиксом через дефис — порядковое
+    def ordinal(match: "re.Match[str]") -> str:
+        return f"{ky_ordinal(int(match.group(1)))} {match.group(2)}"
+
+    text = re.sub(r"(?<![\w.,])([1-9]\d{0,8})-([^\W\d_]+)", ordinal, text)
+    text = re.sub(r"(?<![\w.,])(\d{1,4})\s?ж\.(?=\s|$)", lambda m: f"{ky_ordinal(int(m.group(1)))} жылы", text)
+    return _STANDALONE_INT.sub(lambda m: ky_cardinal(int(m.group())), text)
+
+
+# Разряды через пробел: «15 000», «1 000 000» (NBSP и узкие пробелы
+# к этому моменту уже обычные). Не с нуля и не продолжение другого
+# числа — иначе телефон «+996 555 123 456» склеился бы в одно число
+_GROUPED_INT = re.compile(r"(?<![\w.,:/+\-])(?<!\d )[1-9]\d{0,2}(?: \d{3})+(?!\w|-|/|[.,:]\d| \d)")
+
+
+def _merge_thousands(text: str) -> str:
+    return _GROUPED_INT.sub(lambda m: m.group().replace(" ", ""), text)
+
+
+_DEGREES = re.compile(r"(?<![\w.,])(\d{1,12})\s?°\s?([CС](?!\w))?")
+_RU_DEGREE_FORMS = ("градус", "градуса", "градусов")
+
+
+def _spell_symbols(text: str, language: str) -> str:
+    """«№» и «°» словами (число остаётся цифрами — его раскроют дальше)"""
+    def degrees(match: "re.Match[str]") -> str:
+        number = match.group(1)
+        if language != "ru":
+            # В кыргызском после числительного существительное не склоняется
+            return f"{number} градус"
+        celsius = " Цельсия" if match.group(2) else ""
+        return f"{number} {_ru_plural(int(number), _RU_DEGREE_FORMS)}{celsius}"
+
+    text = _DEGREES.sub(degrees, text)
+    text = text.replace("°", " градус ")
+    text = re.sub(r"№\s*№\s*", "номера " if language == "ru" else "номерлер ", text)
+    return re.sub(r"№\s*", "номер ", text)
+
+
+# Отдельное целое: не часть 2FA, 10,5, 12:30, +996..., не «0555» (ноль
+# пропал бы) и не одна из групп цифр подряд («0555 123 456»)
+_INT = r"(?:0|[1-9]\d{0,11})(?!\w|-|/|[.,:]\d| \d)"
+_STANDALONE_INT = re.compile(r"(?<![\w.,:/+\-])(?<!\d )" + _INT)
+# Русские числа известной формы: после «номер» (именительный, как
+# название) и перед «градус/градуса/градусов» (мужской род)
+_RU_KNOWN_FORM = re.compile(
+    r"(?<=\bномер )(" + _INT + r")|(?<![\w.,:/+\-])(?<!\d )(" + _INT + r")(?= градус(?:а|ов)?\b)",
+    re.IGNORECASE,
+)
+# «1)» в начале строки — маркер пункта списка
+_LIST_NUMBER = re.compile(r"^(\s*)(\d{1,2})\)\s*", re.MULTILINE)
+
+_LANGUAGES: Dict[str, Tuple[list, Callable[[str], str]]] = {
+    "ru": (_RU_ABBREVIATIONS, _ru_numbers),
+    "ky": (_KY_ABBREVIATIONS, _ky_numbers),
+}
+
+
+@lru_cache(maxsize=4096)
+def canonicalize(text: str, language: str = "ky") -> str:
+    """Каноническая форма текста для синтеза и ключа кеша"""
+    if not ENABLED or not text:
+        return text
+    text = unicodedata.normalize("NFC", text).translate(_TRANSLATE).replace("...", "…")
+    text = _strip_decorative(text)
+    text = _LIST_NUMBER.sub(r"\1\2. ", text)
+    text = _lines_to_sentences(text)
+    text = _fix_lookalikes(text)
+
+    abbreviations, numbers = _LANGUAGES.get(language, ([], None))
+    for pattern, replacement in abbreviations:
+        text = pattern.sub(replacement, text)
+    if numbers is not None:
+        text = _spell_symbols(text, language)
+        text = numbers(_merge_thousands(text))
+
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s+([.,!?;:])", r"\1", text)
+    text = re.sub(r"([.!?])(?:\s*[.])+", r"\1", text)
+    return text.strip()
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _split_words(sentence: str, max_chars: int) -> List[str]:
+    """Предложение длиннее max_chars — по словам; слово длиннее — по символам"""
+    pieces: List[str] = []
+    current = ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) <= max_chars:
+            current += " " + word
+        else:
+            if current:
+                pieces.append(current)
+            current = word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_for_tts(text: str, max_chars: int = MAX_INPUT_CHARS) -> List[str]:
+    """Разбить текст на части не длиннее max_chars по границам предложений.
+
+    Соседние предложения собираются в одну часть, пока она помещается в
+    лимит, — частей (запросов к провайдеру и швов в аудио) минимум.
+    """
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        for piece in _split_words(sentence, max_chars) if len(sentence) > max_chars else [sentence]:
+            if not piece:
+                continue
+            if current and len(current) + 1 + len(piece) <= max_chars:
+                current += " " + piece
+            else:
+                if current:
+                    chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,147 @@
+"""Фоновый прогрев озвучки следующих слайдов.
+
+Когда клиент запрашивает слайд (или его озвучку), в очередь с низким
+приоритетом ставится синтез следующих WARMUP_AHEAD слайдов той же колоды.
+Задачи дедуплицируются между клиентами, число одновременных синтезов
+ограничено WARMUP_CONCURRENCY, результат кладётся в CacheService —
+так /api/tts отдаёт переход на следующий слайд уже из кеша.
+"""
+import asyncio
+import itertools
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import decks
+from services.audio_pack import AudioPackRegistry
+from services.cache_policy import ADHOC, NARRATION
+from services.faq import FAQService
+from services.speech import SpeechService
+from services.metrics import WARMUP_QUEUE_DEPTH, WARMUP_TASKS
+
+logger = logging.getLogger(__name__)
+
+# Файлы меньше этого размера считаются заглушками (см. generate_all_audio.py)
+PRERENDERED_MIN_BYTES = 120 * 1024
+
+# Приоритеты: меньше — раньше. Ближайший слайд прогревается первым.
+PRIORITY_NEXT = 10
+
+
+class WarmupScheduler:
+    """Очередь прогрева с дедупликацией и ограничением параллелизма"""
+
+    def __init__(self, speech: SpeechService, faq_service: FAQService, audio_packs: AudioPackRegistry):
+        self.speech = speech
+        self.audio_packs = audio_packs
+        self.cache = speech.cache
+        self.faq_service = faq_service
+        self.enabled = os.getenv("WARMUP_ENABLED", "true").strip().lower() in {"1", "true", "yes", "y", "on"}
+        self.ahead = int(os.getenv("WARMUP_AHEAD", "2"))
+        self.concurrency = max(1, int(os.getenv("WARMUP_CONCURRENCY", "1")))
+        self.queue_max = int(os.getenv("WARMUP_QUEUE_MAX", "256"))
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        # Ключи, которые стоят в очереди или синтезируются прямо сейчас
+        self._pending: Set[str] = set()
+        # Ключ TTS-кеша -> (язык, колода, позиция слайда): чтобы по запросу
+        # /api/tts понять, какой слайд сейчас играет, и прогреть следующие.
+        self._positions: Dict[str, Tuple[str, str, int]] = {}
+        self._registered: Set[Tuple[str, str]] = set()
+
+    def _ensure_started(self):
+        if self._queue is not None and self._workers and not all(w.done() for w in self._workers):
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_max)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+
+    def _register_deck(self, language: str, deck_name: str, slides: List[Dict]):
+        if (language, deck_name) in self._registered:
+            return
+        for position, slide in enumerate(slides):
+            text = decks.speak_text(slide)
+            if text:
+                self._positions[self.cache.tts_key(text, language)] = (language, deck_name, position)
+        self._registered.add((language, deck_name))
+
+    def schedule_after(self, language: str, deck_name: str, position: int, slides: Optional[List[Dict]] = None):
+        """Прогреть слайды, следующие за позицией `position` (0-based)"""
+        if not self.enabled or self.ahead <= 0:
+            return
+        try:
+            if slides is None:
+                slides = decks.load_slides(language, deck_name)
+        except Exception as e:
+            logger.warning(f"Warm-up skipped, deck {language}/{deck_name} is not readable: {e}")
+            return
+
+        self._register_deck(language, deck_name, slides)
+        # Контекст для QA — индекс FAQ колоды — подгружаем заранее
+        self.faq_service.get_index(language, deck_name)
+
+        for offset, slide in enumerate(slides[position + 1:position + 1 + self.ahead]):
+            self._enqueue_slide(language, deck_name, position + 1 + offset, slide, PRIORITY_NEXT + offset)
+
+    def schedule_for_text(self, text: str, language: str):
+        """Если текст — озвучка известного слайда, прогреть следующие за ним"""
+        known = self._positions.get(self.cache.tts_key(text, language))
+        if known:
+            known_language, deck_name, position = known
+            self.schedule_after(known_language, deck_name, position)
+
+    def entry_class(self, text: str, language: str) -> str:
+        """Класс записи кеша для озвучки: текст известного слайда или прочий"""
+        return NARRATION if self.cache.tts_key(text, language) in self._positions else ADHOC
+
+    def _enqueue_slide(self, language: str, deck_name: str, position: int, slide: Dict, priority: int):
+        text = decks.speak_text(slide)
+        if not text:
+            return
+
+        slide_id = int(slide.get("id", position + 1))
+        # Готовая озвучка (в архиве колоды или отдельным файлом) прогрева не требует
+        if self.audio_packs.asset_size(language, deck_name, decks.audio_filename(slide_id)) > PRERENDERED_MIN_BYTES:
+            return
+
+        key = self.cache.tts_key(text, language)
+        if key in self._pending or self.speech.is_cached(text, language):
+            return
+
+        self._ensure_started()
+        assert self._queue is not None
+        try:
+            self._queue.put_nowait((priority, next(self._seq), key, text, language))
+        except asyncio.QueueFull:
+            WARMUP_TASKS.inc(result="dropped")
+            logger.debug("Warm-up queue is full, dropping task")
+            return
+        self._pending.add(key)
+        WARMUP_TASKS.inc(result="queued")
+        WARMUP_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _worker(self):
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            _, _, key, text, language = await queue.get()
+            WARMUP_QUEUE_DEPTH.set(queue.qsize())
+            try:
+                # Заглушку при недоступных провайдерах прогрев не кеширует — это сбой
+                await self.speech.get_audio(text, language, NARRATION, allow_fallback=False)
+                WARMUP_TASKS.inc(result="done")
+            except Exception as e:
+                WARMUP_TASKS.inc(result="failed")
+                logger.warning(f"Warm-up synthesis failed: {e}")
+            finally:
+                self._pending.discard(key)
+                queue.task_done()
@@ -1,12 +1,15 @@
+import importlib.util
 import os
 from typing import Optional
 import logging
-import tempfile
+import time
 
-try:
-    import openai
-except ImportError:
-    openai = None
+from services import tracing
+from services.metrics import PROVIDER_ERRORS, PROVIDER_IN_FLIGHT, STT_SECONDS
+from services.resilience import get_provider
+
+# SDK импортируется лениво, при первом запросе к API
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +20,19 @@ class WhisperSTT:
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY", "")
-        if self.api_key and openai:
-            openai.api_key = self.api_key
+        self.available = bool(self.api_key) and OPENAI_AVAILABLE
+        self.timeout = float(os.getenv("STT_TIMEOUT", "60"))
+        # Без hedged-запросов: распознавание дорогое и оплачивается по длительности
+        self.provider = get_provider("stt.openai", timeout=self.timeout)
+        self._client = None
+
+    def _get_client(self):
+        """Общий асинхронный клиент OpenAI (создаётся при первом запросе)"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+        return self._client
     
     async def transcribe(
         self,
@@ -36,55 +50,53 @@ class WhisperSTT:
         Returns:
             str: Распознанный текст
         """
-        if not self.api_key or not openai:
+        if not self.available:
             logger.warning("OPENAI_API_KEY not set, returning mock transcription")
             return "Бул тест транскрипциясы. API ачкычын коюңуз."
         
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.api_key)
-            
-            # Сохранение аудио во временный файл
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as temp_file:
-                temp_file.write(audio_data)
-                temp_path = temp_file.name
-            
-            # Распознавание через Whisper API
-            # Важно: Whisper API не поддерживает language="ky" (Kyrgyz) и вернёт 400.
-            # Поэтому для кыргызского используем авто-определение языка (не передаём параметр language).
-            provided_hint_raw = (language_hint or "").strip().lower()
-            provided_hint: Optional[str] = provided_hint_raw if provided_hint_raw and provided_hint_raw not in {"ky", "kyrgyz", "kirghiz"} else None
+        # Распознавание через Whisper API
+        # Важно: Whisper API не поддерживает language="ky" (Kyrgyz) и вернёт 400.
+        # Поэтому для кыргызского используем авто-определение языка (не передаём параметр language).
+        provided_hint_raw = (language_hint or "").strip().lower()
+        provided_hint: Optional[str] = provided_hint_raw if provided_hint_raw and provided_hint_raw not in {"ky", "kyrgyz", "kirghiz"} else None
 
-            env_hint_raw = (os.getenv("STT_LANGUAGE", "ky") or "").strip().lower()
-            env_hint: Optional[str] = env_hint_raw if env_hint_raw and env_hint_raw not in {"ky", "kyrgyz", "kirghiz"} else None
+        env_hint_raw = (os.getenv("STT_LANGUAGE", "ky") or "").strip().lower()
+        env_hint: Optional[str] = env_hint_raw if env_hint_raw and env_hint_raw not in {"ky", "kyrgyz", "kirghiz"} else None
 
-            effective_hint = provided_hint or env_hint
+        effective_hint = provided_hint or env_hint
 
-            with open(temp_path, "rb") as audio_file:
-                params = {
-                    "model": "whisper-1",
-                    "file": audio_file,
-                }
-                if effective_hint:
-                    params["language"] = effective_hint
+        async def call_whisper():
+            # Файл передаётся из памяти, без временного файла на диске
+            params = {
+                "model": "whisper-1",
+                "file": (filename, audio_data),
+            }
+            if effective_hint:
+                params["language"] = effective_hint
 
+            client = self._get_client()
+            with PROVIDER_IN_FLIGHT.track_inprogress(service="stt"):
                 try:
-                    transcript = client.audio.transcriptions.create(**params)
+                    return await client.audio.transcriptions.create(**params)
                 except Exception as e:
                     # Если язык не поддерживается (часто это происходит для ky) — пробуем ещё раз без language
                     msg = str(e)
                     if ("unsupported_language" in msg) or ("Language 'ky' is not supported" in msg):
                         params.pop("language", None)
-                        transcript = client.audio.transcriptions.create(**params)
-                    else:
-                        raise
-            
-            # Удаление временного файла
-            os.unlink(temp_path)
-            
+                        return await client.audio.transcriptions.create(**params)
+                    raise
+
+        start = time.perf_counter()
+        tracing.current_span().set_attribute("stt.bytes", len(audio_data))
+        try:
+            transcript = await self.provider.call(call_whisper)
+
+            STT_SECONDS.observe(time.perf_counter() - start, status="ok")
             return transcript.text
             
         except Exception as e:
+            STT_SECONDS.observe(time.perf_counter() - start, status="error")
+            PROVIDER_ERRORS.inc(service="stt", provider="openai")
             # Важно: не маскируем причину ошибки, иначе на фронте всегда будет
             # одно и то же сообщение и невозможно понять, что именно сломалось
             # (ключ/квота/формат/лимиты/сеть).
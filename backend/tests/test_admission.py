@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from services.admission import (
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    AdmissionController,
+    AdmissionRejected,
+    AdmissionService,
+)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("ADMISSION_ENABLED", "true")
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "1")
+    monkeypatch.setenv("RATE_LIMIT_BURST", "3")
+    monkeypatch.setenv("RATE_LIMIT_IP_PER_MINUTE", "1")
+    monkeypatch.setenv("RATE_LIMIT_IP_BURST", "5")
+    return AdmissionService()
+
+
+def _allowed(service, client_id, attempts, priority=PRIORITY_NORMAL):
+    allowed = 0
+    for _ in range(attempts):
+        try:
+            service.check_rate_limit("qa", client_id, priority)
+            allowed += 1
+        except AdmissionRejected as e:
+            assert e.reason == "rate_limit"
+            assert e.retry_after > 0
+    return allowed
+
+
+def test_client_limit_allows_burst_then_rejects(service):
+    assert _allowed(service, "10.0.0.1/a", 5) == 3
+
+
+def test_ip_ceiling_applies_across_client_ids(service):
+    # Два клиента за одним NAT: по 3 на клиента, но не больше 5 на IP
+    assert _allowed(service, "10.0.0.1/a", 3) == 3
+    assert _allowed(service, "10.0.0.1/b", 3) == 2
+    # Другой IP считается отдельно
+    assert _allowed(service, "10.0.0.2/a", 3) == 3
+
+
+def test_rejected_request_does_not_spend_tokens(service):
+    assert _allowed(service, "10.0.0.1/a", 3) == 3
+    assert _allowed(service, "10.0.0.1/a", 10) == 0
+    # IP-потолок не тронут отказами клиента a
+    assert _allowed(service, "10.0.0.1/b", 3) == 2
+
+
+def test_presenter_is_not_rate_limited(service):
+    assert _allowed(service, "10.0.0.1/a", 20, PRIORITY_HIGH) == 20
+
+
+def test_cost_is_capped_at_burst(service):
+    service.check_rate_limit("tts", "10.0.0.1/a", cost=50)
+    with pytest.raises(AdmissionRejected):
+        service.check_rate_limit("tts", "10.0.0.1/a")
+
+
+def test_concurrency_limit_and_priority_order():
+    controller = AdmissionController("qa", concurrency=1, queue_max=10, max_wait=5)
+    order = []
+
+    async def request(name, priority, delay=0.0):
+        await asyncio.sleep(delay)
+        async with controller.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(
+            request("first", PRIORITY_NORMAL),
+            request("student", PRIORITY_NORMAL, 0.005),
+            request("presenter", PRIORITY_HIGH, 0.01),
+        )
+        return controller.active, controller.queued
+
+    assert asyncio.run(main()) == (0, 0)
+    # Ведущий пришёл позже ученика, но получает слот раньше
+    assert order == ["first", "presenter", "student"]
+
+
+def test_full_queue_rejects_and_presenter_displaces_student():
+    controller = AdmissionController("qa", concurrency=1, queue_max=1, max_wait=5)
+
+    async def main():
+        await controller.acquire()
+        student = asyncio.create_task(controller.acquire(PRIORITY_NORMAL))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire(PRIORITY_NORMAL)
+        presenter = asyncio.create_task(controller.acquire(PRIORITY_HIGH))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as displaced:
+            await student
+        controller.release()
+        await presenter
+        controller.release()
+        return full.value.reason, displaced.value.reason, controller.active, controller.queued
+
+    assert asyncio.run(main()) == ("queue_full", "displaced", 0, 0)
+
+
+def test_wait_timeout_rejects_and_frees_queue_place():
+    controller = AdmissionController("tts", concurrency=1, queue_max=5, max_wait=0.02)
+
+    async def main():
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as timeout:
+            await controller.acquire()
+        controller.release()
+        return timeout.value.reason, controller.active, controller.queued
+
+    assert asyncio.run(main()) == ("timeout", 0, 0)
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    controller = AdmissionController("stt", concurrency=1, queue_max=5, max_wait=5)
+
+    async def main():
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        controller.release()
+        # Слот свободен: следующий запрос проходит сразу
+        await asyncio.wait_for(controller.acquire(), timeout=0.1)
+        controller.release()
+        return controller.active, controller.queued
+
+    assert asyncio.run(main()) == (0, 0)
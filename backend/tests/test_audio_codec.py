@@ -0,0 +1,69 @@
+import struct
+
+import numpy as np
+import pytest
+
+from services import audio_codec
+from services.audio_codec import MAGIC, AudioCodec, AudioCodecError
+
+
+def _wav(samples: np.ndarray, sample_rate: int = 24000, tail: bytes = b"") -> bytes:
+    pcm = samples.astype("<i2").tobytes()
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm) + len(tail), b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", len(pcm),
+    )
+    return header + pcm + tail
+
+
+def _speech_like(n: int = 48000) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(n)
+    signal = np.sin(t / 15) * 8000 + rng.normal(0, 200, n)
+    samples = signal.clip(-32768, 32767).astype("<i2")
+    # Крайние значения: остаток предсказателя переполняет int16
+    samples[100:110] = [32767, -32768] * 5
+    return samples
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_wav_round_trip(codec):
+    data = _wav(_speech_like(), tail=b"LIST\x04\x00\x00\x00abcd")
+    blob = AudioCodec(codec).encode(data)
+    assert blob.startswith(MAGIC)
+    assert len(blob) < len(data)
+    assert AudioCodec.decode(blob) == data
+
+
+def test_numpy_and_python_transforms_match():
+    pcm = _speech_like(10001).tobytes()
+    planes = audio_codec._encode_pcm16(pcm)
+    assert planes == audio_codec._encode_pcm16_py(pcm)
+    assert audio_codec._decode_pcm16(planes) == pcm
+    assert audio_codec._decode_pcm16_py(planes) == pcm
+
+
+def test_non_wav_and_legacy_entries():
+    codec = AudioCodec("zlib")
+    text = b"not audio " * 200
+    assert AudioCodec.decode(codec.encode(text)) == text
+    # Записи до сжатия читаются как есть
+    legacy = _wav(_speech_like(200))
+    assert AudioCodec.decode(legacy) == legacy
+
+
+def test_incompressible_data_is_stored_as_is():
+    noise = np.random.default_rng(1).integers(0, 256, 4096, dtype=np.uint8).tobytes()
+    assert AudioCodec("zlib").encode(noise) == noise
+    assert AudioCodec("none").encode(noise) == noise
+
+
+def test_corrupt_entries_raise():
+    with pytest.raises(AudioCodecError):
+        AudioCodec.decode(MAGIC + b"\x01")
+    blob = bytearray(AudioCodec("zlib").encode(_wav(_speech_like())))
+    blob[4] = 99
+    with pytest.raises(AudioCodecError):
+        AudioCodec.decode(bytes(blob))
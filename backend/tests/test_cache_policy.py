@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import cache_policy
+from services.cache_policy import EntryClass, FrequencySketch, PolicyCache
+
+VALUE = b"x" * 20
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache_policy, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    classes = {
+        "narration": EntryClass("narration", ttl=100, share=0.5, sliding=True),
+        "adhoc": EntryClass("adhoc", ttl=100, share=0.5, sliding=False),
+    }
+    return PolicyCache(max_bytes=100, classes=classes, sketch_width=64)
+
+
+def _fill(cache, entry_class, count, reads):
+    for n in range(count):
+        key = f"{entry_class}{n}"
+        for _ in range(reads):
+            cache.get(key)
+        cache.set(key, VALUE, entry_class)
+
+
+def test_sketch_counts_saturate_and_age():
+    sketch = FrequencySketch(width=16)
+    for _ in range(20):
+        sketch.increment("hot")
+    assert sketch.frequency("hot") == sketch.max_count
+    assert sketch.frequency("cold") == 0
+    # После sample_size приращений все счётчики делятся пополам
+    for n in range(sketch.sample_size):
+        sketch.increment(f"k{n}")
+    assert sketch.frequency("hot") < sketch.max_count
+
+
+def test_rare_key_does_not_evict_popular_entries(cache):
+    _fill(cache, "adhoc", 5, reads=3)
+    cache.get("once")
+    cache.set("once", VALUE, "adhoc")
+    assert "once" not in cache
+    assert all(f"adhoc{n}" in cache for n in range(5))
+    assert cache.stats()["adhoc"]["rejected"] == 1
+
+
+def test_more_popular_key_evicts_least_recently_used(cache):
+    _fill(cache, "adhoc", 5, reads=3)
+    cache.get("adhoc0")
+    for _ in range(6):
+        cache.get("hot")
+    cache.set("hot", VALUE, "adhoc")
+    assert "hot" in cache
+    # adhoc0 читали недавно — вытеснена следующая по давности
+    assert "adhoc0" in cache
+    assert "adhoc1" not in cache
+
+
+def test_class_within_share_evicts_class_over_share(cache):
+    _fill(cache, "adhoc", 5, reads=10)
+    # Озвучка в пределах своей доли вытесняет adhoc без сравнения частот
+    cache.set("slide1", VALUE, "narration")
+    assert "slide1" in cache
+    assert cache.stats()["adhoc"]["evicted"] == 1
+    assert cache.size == 100
+
+
+def test_expired_entries_are_evicted_first(cache, clock):
+    _fill(cache, "adhoc", 2, reads=10)
+    clock.now += 50
+    _fill(cache, "narration", 3, reads=10)
+    clock.now += 60
+    # adhoc истекли (без продления), narration — нет
+    cache.get("new")
+    cache.set("new", VALUE, "adhoc")
+    assert "new" in cache
+    assert all(f"narration{n}" in cache for n in range(3))
+    assert cache.get("adhoc0") is None
+
+
+def test_sliding_ttl_is_extended_on_hit(cache, clock):
+    cache.set("slide", VALUE, "narration")
+    cache.set("text", VALUE, "adhoc")
+    clock.now += 90
+    assert cache.get("slide") == VALUE
+    assert cache.get("text") == VALUE
+    clock.now += 20
+    assert cache.get("slide") == VALUE
+    assert cache.get("text") is None
+
+
+def test_too_large_value_is_rejected(cache):
+    cache.set("huge", b"x" * 101, "adhoc")
+    assert "huge" not in cache
+    assert cache.size == 0
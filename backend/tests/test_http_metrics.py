@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+import main
+from services import metrics
+
+
+def _route_labels():
+    labels = set()
+    for line in metrics.registry.render().splitlines():
+        if line.startswith(("http_request_duration_seconds_count", "http_requests_in_flight")):
+            labels.add(line.split('route="', 1)[1].split('"', 1)[0])
+    return labels
+
+
+def test_route_group_uses_known_routes_only():
+    assert main._route_group("/api/slides/3") == "/api/slides"
+    assert main._route_group("/audio/ru/rights/slide_01.wav") == "/audio"
+    assert main._route_group("/") == "/"
+    assert main._route_group("/zz0/yy0") == main.UNMATCHED_ROUTE
+    assert main._route_group("/api/zz") == main.UNMATCHED_ROUTE
+
+
+def test_unrouted_requests_share_one_series():
+    client = TestClient(main.app)
+    for n in range(5):
+        assert client.get(f"/scan{n}/probe{n}").status_code == 404
+    labels = _route_labels()
+    assert main.UNMATCHED_ROUTE in labels
+    assert not any(label.startswith("/scan") for label in labels)
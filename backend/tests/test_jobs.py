@@ -0,0 +1,161 @@
+import asyncio
+import io
+import time
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services import jobs
+from services.admission import AdmissionService
+from services.container import get_admission_service, get_job_manager
+from services.jobs import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobConflict, JobManager, JobStore
+from services.tts_text import MAX_INPUT_CHARS
+
+
+class _Manager:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, kind, params, idempotency_key=None):
+        self.submitted.append(params)
+        return {"id": str(len(self.submitted)), "kind": kind, "status": "queued"}, True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "1")
+    monkeypatch.setenv("RATE_LIMIT_BURST", "4")
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    manager = _Manager()
+    admission = AdmissionService()
+    main.app.dependency_overrides[get_job_manager] = lambda: manager
+    main.app.dependency_overrides[get_admission_service] = lambda: admission
+    yield TestClient(main.app), manager
+    main.app.dependency_overrides.clear()
+
+
+def _long_text(parts):
+    sentence = "Мыйзам бардыгы үчүн бирдей. "
+    return sentence * (parts * MAX_INPUT_CHARS // len(sentence))
+
+
+def test_tts_job_is_charged_per_chunk(client):
+    http, manager = client
+    # Длинный текст забирает всю «пачку» лимита — следующий запрос ждёт
+    response = http.post("/api/jobs", json={"kind": "tts", "params": {"text": _long_text(4)}})
+    assert response.status_code == 202
+    response = http.post("/api/jobs", json={"kind": "tts", "params": {"text": "Салам"}})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert len(manager.submitted) == 1
+
+
+def test_short_tts_jobs_share_the_client_limit(client):
+    http, manager = client
+    statuses = [
+        http.post("/api/jobs", json={"kind": "tts", "params": {"text": f"Салам {n}"}}).status_code
+        for n in range(6)
+    ]
+    assert statuses == [202] * 4 + [429] * 2
+
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.sqlite3")
+
+
+def _wav(frames=800):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\x01\x00" * frames)
+    return buffer.getvalue()
+
+
+class _Speech:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.synthesized = []
+
+    async def get_cached(self, text, language, entry_class):
+        return None
+
+    async def get_audio(self, text, language, entry_class, allow_fallback=True):
+        if self.fail:
+            raise RuntimeError("provider down")
+        self.synthesized.append(text)
+        return _wav(), False
+
+
+def test_idempotency_key_returns_same_job_or_conflicts(store):
+    job, created = store.create("tts", {"text": "a"}, "key-1")
+    again, created_again = store.create("tts", {"text": "a"}, "key-1")
+    assert created and not created_again
+    assert again["id"] == job["id"]
+    with pytest.raises(JobConflict):
+        store.create("tts", {"text": "b"}, "key-1")
+
+
+def test_claim_takes_each_job_once_in_order(store):
+    first, _ = store.create("tts", {"text": "1"})
+    second, _ = store.create("tts", {"text": "2"})
+    claimed = [store.claim(), store.claim(), store.claim()]
+    assert [job["id"] for job in claimed[:2]] == [first["id"], second["id"]]
+    assert claimed[2] is None
+    assert store.get(first["id"])["status"] == RUNNING
+
+
+def test_cancel_only_unfinished_jobs(store):
+    queued, _ = store.create("tts", {"text": "1"})
+    done, _ = store.create("tts", {"text": "2"})
+    store.update(done["id"], status=SUCCEEDED)
+    assert store.cancel(queued["id"])
+    assert not store.cancel(done["id"])
+    assert store.get(queued["id"])["status"] == CANCELLED
+
+
+def test_stale_running_jobs_are_requeued_and_old_ones_pruned(store):
+    job, _ = store.create("tts", {"text": "1"})
+    store.claim()
+    assert store.requeue_stale(stale_seconds=60) == 0
+    store._connect().execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 120, job["id"]))
+    assert store.requeue_stale(stale_seconds=60) == 1
+    assert store.get(job["id"])["status"] == QUEUED
+
+    store.update(job["id"], status=FAILED)
+    assert store.prune(retention_seconds=3600) == []
+    store._connect().execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time() - 7200, job["id"]))
+    assert [pruned["id"] for pruned in store.prune(retention_seconds=3600)] == [job["id"]]
+    assert store.get(job["id"]) is None
+
+
+def _run(store, speech, text, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_AUDIO_DIR", tmp_path / "audio")
+    manager = JobManager(store, speech)
+    job, _ = store.create("tts", {"text": text, "language": "ky"})
+    asyncio.run(manager._execute(store.claim()))
+    return store.get(job["id"])
+
+
+def test_long_tts_job_is_synthesized_in_chunks(store, tmp_path, monkeypatch):
+    speech = _Speech()
+    text = _long_text(3)
+    job = _run(store, speech, text, tmp_path, monkeypatch)
+
+    assert job["status"] == SUCCEEDED
+    assert job["result"]["chunks"] == len(speech.synthesized) > 1
+    assert job["progress"] == job["total"] == len(speech.synthesized)
+    with wave.open(str(tmp_path / "audio" / f"{job['id']}.wav")) as f:
+        assert f.getnframes() >= 800 * len(speech.synthesized)
+
+
+def test_provider_outage_fails_the_job(store, tmp_path, monkeypatch):
+    job = _run(store, _Speech(fail=True), "Салам.", tmp_path, monkeypatch)
+    assert job["status"] == FAILED
+    assert "provider down" in job["error"]
+    assert not (tmp_path / "audio" / f"{job['id']}.wav").exists()
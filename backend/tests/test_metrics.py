@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+from services.metrics import Registry
+
+DEAD_PID = 2 ** 30
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = Registry(multiprocess_dir=tmp_path)
+    registry.counter("jobs_total", "Jobs", ("kind",)).inc(2, kind="tts")
+    registry.gauge("in_flight", "In flight").inc(3)
+    registry.gauge("breaker", "Breaker", ("provider",), multiprocess_mode="max").set(0, provider="openai")
+    registry.gauge("subscribers", "Subscribers", multiprocess_mode="pid").set(4)
+    registry.histogram("latency", "Latency", buckets=(0.1, 1.0)).observe(0.05)
+    return registry
+
+
+def _worker_snapshot(directory, pid, name="other"):
+    data = {
+        "pid": pid,
+        "metrics": {
+            "jobs_total": [[["tts"], 5], [["deck_audio"], 1]],
+            "in_flight": [[[], 2]],
+            "breaker": [[["openai"], 2]],
+            "subscribers": [[[], 7]],
+            "latency": [[[], [0, 1, 1], 2.5]],
+        },
+    }
+    (directory / f"{pid}_{name}.json").write_text(json.dumps(data), encoding="utf-8")
+
+
+def _samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_single_process_renders_local_values():
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs", ("kind",)).inc(kind="tts")
+    assert _samples(registry.render()) == {'jobs_total{kind="tts"}': "1"}
+
+
+def test_counters_and_histograms_are_summed_over_workers(registry, tmp_path):
+    _worker_snapshot(tmp_path, os.getppid())
+    samples = _samples(registry.render())
+
+    assert samples['jobs_total{kind="tts"}'] == "7"
+    assert samples['jobs_total{kind="deck_audio"}'] == "1"
+    assert samples['latency_bucket{le="0.1"}'] == "1"
+    assert samples['latency_bucket{le="1"}'] == "2"
+    assert samples['latency_bucket{le="+Inf"}'] == "3"
+    assert samples["latency_count"] == "3"
+    assert float(samples["latency_sum"]) == pytest.approx(2.55)
+
+
+def test_gauges_follow_their_multiprocess_mode(registry, tmp_path):
+    _worker_snapshot(tmp_path, os.getppid())
+    samples = _samples(registry.render())
+
+    assert samples["in_flight"] == "5"
+    assert samples['breaker{provider="openai"}'] == "2"
+    assert samples[f'subscribers{{pid="{os.getpid()}"}}'] == "4"
+    assert samples[f'subscribers{{pid="{os.getppid()}"}}'] == "7"
+
+
+def test_dead_workers_keep_counters_but_not_gauges(registry, tmp_path):
+    _worker_snapshot(tmp_path, DEAD_PID)
+    samples = _samples(registry.render())
+
+    assert samples['jobs_total{kind="tts"}'] == "7"
+    assert samples["in_flight"] == "3"
+    assert samples['breaker{provider="openai"}'] == "0"
+    assert f'subscribers{{pid="{DEAD_PID}"}}' not in samples
+
+
+def test_clear_snapshots_forgets_previous_run(registry, tmp_path):
+    _worker_snapshot(tmp_path, DEAD_PID)
+    registry.write_snapshot()
+    registry.clear_snapshots()
+    assert list(tmp_path.iterdir()) == []
+    assert _samples(registry.render())['jobs_total{kind="tts"}'] == "2"
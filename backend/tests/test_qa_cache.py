@@ -0,0 +1,25 @@
+import pytest
+
+from services.cache import CacheService
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "shared.sqlite3"))
+    return CacheService()
+
+
+def test_answers_are_separated_by_deck_and_context(cache):
+    cache.set_qa_cache("Что такое право?", 1, {"answer": "rights"}, "ru", deck="rights", context="Слайд о правах")
+
+    assert cache.get_qa_cache("Что такое право?", 1, "ru", deck="rights", context="Слайд о правах") == {"answer": "rights"}
+    # Тот же id слайда в другой колоде и другой контекст — другой ответ
+    assert cache.get_qa_cache("Что такое право?", 1, "ru", deck="mvd", context="Слайд о правах") is None
+    assert cache.get_qa_cache("Что такое право?", 1, "ru", deck="rights", context="Другой слайд") is None
+
+
+def test_question_and_context_whitespace_and_case_do_not_matter(cache):
+    cache.set_qa_cache("Что такое право?", 1, {"answer": "a"}, "ru", deck="rights", context="Слайд  о правах")
+    assert cache.qa_key(" что такое право? ", 1, "ru", "rights", "Слайд о правах") == \
+        cache.qa_key("Что такое право?", 1, "ru", "rights", "Слайд о правах")
+    assert cache.get_qa_cache("ЧТО ТАКОЕ ПРАВО?", 1, "ru", deck="rights", context="Слайд о правах") == {"answer": "a"}
@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services import resilience
+from services.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AllProvidersFailed,
+    CircuitBreaker,
+    CircuitOpenError,
+    FallbackChain,
+    Provider,
+)
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    # Подменяется модуль time только в resilience — цикл событий идёт по настоящему времени
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_breaker_opens_after_threshold_and_probes_once(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock[0] += 30
+    # После паузы — ровно один пробный запрос
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize(
+    "error, failure",
+    [
+        (asyncio.TimeoutError(), True),
+        (ConnectionError(), True),
+        (_StatusError(429), True),
+        (_StatusError(503), True),
+        (_StatusError(400), False),
+        (ValueError("bad input"), False),
+    ],
+)
+def test_only_provider_failures_count(error, failure):
+    assert resilience.is_provider_failure(error) is failure
+
+
+def _provider(threshold=2):
+    provider = Provider("test", timeout=1.0)
+    provider.breaker = CircuitBreaker("test", failure_threshold=threshold, reset_timeout=60)
+    return provider
+
+
+def test_client_errors_do_not_open_the_circuit():
+    provider = _provider(threshold=1)
+
+    async def bad_request():
+        raise _StatusError(400)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(_StatusError):
+                await provider.call(bad_request)
+
+    asyncio.run(main())
+    assert provider.breaker.state == CLOSED
+
+
+def test_deadline_counts_as_failure_and_opens_circuit():
+    provider = _provider(threshold=2)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await provider.call(slow, timeout=0.01)
+        with pytest.raises(CircuitOpenError):
+            await provider.call(slow)
+
+    asyncio.run(main())
+    assert provider.breaker.state == OPEN
+
+
+def test_cancelled_probe_is_released(clock):
+    provider = _provider(threshold=1)
+    provider.breaker.record_failure()
+    clock[0] += 60
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.ensure_future(provider.call(hang))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    # Отменённая проба не занимает место следующей
+    assert provider.breaker.state == HALF_OPEN
+    assert provider.breaker.allow()
+
+
+def test_fallback_chain_skips_open_circuit_and_reports_errors():
+    primary, secondary = _provider(), _provider()
+    primary.name, secondary.name = "primary", "secondary"
+    primary.breaker.state = OPEN
+    primary.breaker.opened_at = float("inf")
+    fallbacks = []
+    calls = []
+
+    async def answer(name):
+        calls.append(name)
+        return name
+
+    async def failing():
+        raise ConnectionError("down")
+
+    chain = FallbackChain("tts", on_fallback=fallbacks.append)
+    assert asyncio.run(chain.run([(primary, lambda: answer("primary")), (secondary, lambda: answer("secondary"))])) == "secondary"
+    assert calls == ["secondary"]
+    assert fallbacks == ["secondary"]
+
+    with pytest.raises(AllProvidersFailed) as failed:
+        asyncio.run(chain.run([(primary, failing), (secondary, failing)]))
+    assert [name for name, _ in failed.value.errors] == ["primary", "secondary"]
+    assert isinstance(failed.value.errors[0][1], CircuitOpenError)
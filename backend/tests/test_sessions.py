@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+from services.sessions import SessionForbidden, SessionHub, SessionNotFound, SessionStore, Subscriber
+
+
+class _Warmup:
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule_after(self, language, deck_name, index):
+        self.scheduled.append((language, deck_name, index))
+
+
+class _AudioPacks:
+    def asset_size(self, language, deck_name, filename):
+        return 0
+
+
+def _hub(store, backend="local"):
+    hub = SessionHub(store, _Warmup(), _AudioPacks())
+    hub.backend = backend
+    hub.poll_interval = 0.01
+    hub.prefetch_ahead = 2
+    return hub
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / "sessions.sqlite3")
+
+
+def test_only_presenter_can_switch_slides(store):
+    hub = _hub(store)
+    session = hub.create(None, None)
+    session_id, token = session["session_id"], session["presenter_token"]
+    assert session["state"]["index"] == 0 and session["state"]["version"] == 1
+    assert hub.is_presenter(session_id, token)
+    assert not hub.is_presenter(session_id, "wrong")
+
+    async def main():
+        with pytest.raises(SessionForbidden):
+            await hub.goto(session_id, "wrong", 1)
+        with pytest.raises(SessionNotFound):
+            await hub.goto("missing", token, 1)
+        return await hub.goto(session_id, token, 3)
+
+    state = asyncio.run(main())
+    assert state["index"] == 3 and state["version"] == 2
+    assert hub.get_state(session_id) == state
+
+
+def test_goto_fans_out_once_with_prefetch_hints(store):
+    hub = _hub(store)
+    session = hub.create(None, None)
+    session_id, token = session["session_id"], session["presenter_token"]
+
+    async def main():
+        viewers = [hub.subscribe(session_id) for _ in range(3)]
+        other = hub.subscribe("other-session")
+        state = await hub.goto(session_id, token, 10_000)
+        messages = [json.loads(await viewer.get()) for viewer in viewers]
+        return state, messages, other.queue.qsize()
+
+    state, messages, other_queued = asyncio.run(main())
+    # Индекс ограничен последним слайдом, следующих слайдов для подсказок нет
+    assert state["index"] == state["total"] - 1
+    assert [len(message["prefetch"]) for message in messages] == [1, 1, 1]
+    assert all(message == state for message in messages)
+    assert other_queued == 0
+    assert hub.warmup_scheduler.scheduled[-1] == (state["language"], state["deck"], state["index"])
+
+
+def test_slow_subscriber_keeps_latest_messages():
+    async def main():
+        subscriber = Subscriber(maxsize=2)
+        for n in range(5):
+            subscriber.push(str(n))
+        return [await subscriber.get(), await subscriber.get()]
+
+    assert asyncio.run(main()) == ["3", "4"]
+
+
+def test_sqlite_backend_delivers_across_processes_once(store):
+    presenter_hub = _hub(store, backend="sqlite")
+    viewer_hub = _hub(store, backend="sqlite")
+    session = presenter_hub.create(None, None)
+    session_id, token = session["session_id"], session["presenter_token"]
+
+    async def main():
+        viewer = viewer_hub.subscribe(session_id)
+        await asyncio.sleep(0.03)
+        await presenter_hub.goto(session_id, token, 2)
+        # Повторные опросы не присылают ту же версию снова
+        await asyncio.sleep(0.1)
+        messages = []
+        while not viewer.queue.empty():
+            messages.append(json.loads(viewer.queue.get_nowait()))
+        await viewer_hub.stop()
+        await presenter_hub.stop()
+        return messages
+
+    messages = asyncio.run(main())
+    versions = [message["version"] for message in messages]
+    assert versions == sorted(set(versions))
+    assert messages[-1]["index"] == 2 and messages[-1]["version"] == 2
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from services import shared_cache
+from services.shared_cache import SharedCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache(tmp_path / "shared.sqlite3")
+
+
+def _row(cache, key):
+    return cache._connect().execute(
+        "SELECT accessed_at, expires_at FROM entries WHERE key = ?", (key,)
+    ).fetchone()
+
+
+def test_hits_do_not_write_until_flush(cache, monkeypatch):
+    monkeypatch.setattr(shared_cache, "TOUCH_FLUSH_SECONDS", 3600)
+    cache.touch_interval = 0
+    cache.set("k", b"v", ttl=100)
+    before = _row(cache, "k")
+
+    time.sleep(0.01)
+    assert cache.get("k", refresh_ttl=1000) == b"v"
+    # Отметка о чтении ждёт пачки — запись в SQLite не изменилась
+    assert _row(cache, "k") == before
+
+    cache.flush_touches()
+    accessed_at, expires_at = _row(cache, "k")
+    assert accessed_at > before[0]
+    assert expires_at > before[1] + 800
+
+
+def test_recently_touched_entries_are_not_touched_again(cache):
+    cache.touch_interval = 60
+    cache.set("k", b"v", ttl=1000)
+    for _ in range(10):
+        assert cache.get("k", refresh_ttl=1000) == b"v"
+    assert cache._touches == {}
+
+
+def test_touches_are_flushed_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(shared_cache, "TOUCH_FLUSH_SIZE", 3)
+    monkeypatch.setattr(shared_cache, "TOUCH_FLUSH_SECONDS", 3600)
+    cache.touch_interval = 0
+    for n in range(3):
+        cache.set(f"k{n}", b"v", ttl=100)
+    cache.get("k0")
+    cache.get("k1")
+    assert len(cache._touches) == 2
+    cache.get("k2")
+    assert cache._touches == {}
+
+
+def test_prune_sees_pending_touches(cache, monkeypatch):
+    monkeypatch.setattr(shared_cache, "TOUCH_FLUSH_SECONDS", 3600)
+    cache.touch_interval = 0
+    cache.set("old", b"x" * 100, ttl=100)
+    time.sleep(0.01)
+    cache.set("new", b"x" * 100, ttl=100)
+    time.sleep(0.01)
+    # «old» прочитан последним — вытесняется «new»
+    cache.get("old")
+    cache.max_bytes = 150
+    cache.prune()
+    assert cache.get("old") == b"x" * 100
+    assert cache.get("new") is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+@pytest.fixture
+def flight(tmp_path):
+    return SingleFlight(lock_dir=tmp_path)
+
+
+def test_concurrent_calls_share_one_factory_call(flight):
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", factory) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_leader_cancellation_does_not_cancel_followers(flight):
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", factory))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do("key", factory)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    # Один из ожидающих стал ведущим и повторил вызов — для всех
+    assert asyncio.run(main()) == [2, 2, 2]
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_leaves_leader_running(flight):
+    async def factory():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", factory))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", factory))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == "value"
+
+
+def test_errors_reach_all_callers_and_free_the_key(flight):
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+        return results, await flight.do("key", ok)
+
+    results, after = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert after == "ok"
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from services import tracing
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRACE_EXPORTERS", "file")
+    monkeypatch.setenv("TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "")
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "0")
+    return tracing.Tracer()
+
+
+def _exported(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_file_export_is_plain_json(tracer, tmp_path):
+    tracer.sample_rate = 1.0
+    with tracer.start_trace("GET /api/slides", route="/api/slides"):
+        with tracer.span("cache.get", hit=True):
+            pass
+    tracer.flush()
+
+    [trace] = _exported(tmp_path)
+    assert trace["reason"] == "sampled"
+    assert set(trace) == {"trace_id", "name", "service", "reason", "start_ns", "duration_ms", "dropped_spans", "spans"}
+    assert [span["name"] for span in trace["spans"]] == ["GET /api/slides", "cache.get"]
+    assert trace["spans"][1]["parent_id"] == trace["spans"][0]["span_id"]
+
+
+def test_errors_are_exported_without_sampling(tracer, tmp_path):
+    with pytest.raises(ValueError):
+        with tracer.start_trace("job tts"):
+            raise ValueError("boom")
+    tracer.flush()
+
+    [trace] = _exported(tmp_path)
+    assert trace["reason"] == "error"
+    assert trace["spans"][0]["error"] == "ValueError: boom"
+
+
+def test_cancellation_is_not_an_error(tracer, tmp_path):
+    roots = []
+    with pytest.raises(asyncio.CancelledError):
+        with tracer.start_trace("POST /api/qa") as root:
+            roots.append(root)
+            with tracer.span("openai.chat"):
+                raise asyncio.CancelledError()
+    tracer.flush()
+
+    assert roots[0].status == tracing.STATUS_UNSET
+    assert roots[0].attributes["cancelled"] is True
+    # Не ошибка и не медленная — трасса отбрасывается
+    assert _exported(tmp_path) == []
+
+
+def test_otlp_encoding_uses_span_objects(tracer):
+    tracer.sample_rate = 1.0
+    items = []
+    tracer._queue.put_nowait = items.append
+    with tracer.start_trace("GET /ready"):
+        with tracer.span("redis.ping", kind=tracing.KIND_CLIENT):
+            pass
+
+    exporter = tracing.OTLPExporter("http://collector:4318", {}, "test")
+    spans = exporter._encode(items)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["GET /ready", "redis.ping"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert spans[1]["kind"] == tracing.KIND_CLIENT
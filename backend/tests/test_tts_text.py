@@ -0,0 +1,79 @@
+import pytest
+
+from services.tts_text import canonicalize, split_for_tts
+
+
+@pytest.mark.parametrize(
+    "text, language, expected",
+    [
+        # Разряды через обычный, неразрывный и узкий пробел — одно число
+        ("Тираж 15 000 экземпляров.", "ru", "Тираж 15000 экземпляров."),
+        ("Тираж 15 000 экземпляров.", "ru", "Тираж 15000 экземпляров."),
+        ("Бюджет 1 000 000 сом.", "ru", "Бюджет 1000000 сом."),
+        ("15 000 сом", "ky", "он беш миң сом"),
+        # Род и падеж неизвестны — русское число остаётся цифрами
+        ("Осталась 1 минута, 21 неделя.", "ru", "Осталась 1 минута, 21 неделя."),
+        ("5 китеп", "ky", "беш китеп"),
+        # Телефон — не одно число и не числа словами; ведущий ноль сохраняется
+        ("Телефон +996 555 123 456", "ru", "Телефон +996 555 123 456"),
+        ("Телефон 0555 123 456", "ky", "Телефон 0555 123 456"),
+        ("Код 007", "ky", "Код 007"),
+        # После предлога число склоняет провайдер — остаётся цифрами
+        ("в 15 000 странах", "ru", "в 15000 странах"),
+        ("Закон принят в 1948 году.", "ru", "Закон принят в тысяча девятьсот сорок восьмом году."),
+        ("1948-жылы кабыл алынган.", "ky", "бир миң тогуз жүз кырк сегизинчи жылы кабыл алынган."),
+    ],
+)
+def test_numbers(text, language, expected):
+    assert canonicalize(text, language) == expected
+
+
+@pytest.mark.parametrize(
+    "text, language, expected",
+    [
+        ("Приказ № 5", "ru", "Приказ номер пять"),
+        ("№5 мектеп", "ky", "номер беш мектеп"),
+        ("Температура 25°C.", "ru", "Температура двадцать пять градусов Цельсия."),
+        ("Нагреть до 25°C.", "ru", "Нагреть до 25 градусов Цельсия."),
+        ("Вчера 21 °С.", "ru", "Вчера двадцать один градус Цельсия."),
+        ("Бүгүн 25°", "ky", "Бүгүн жыйырма беш градус"),
+        # Знаки со смыслом остаются, эмодзи и пиктограммы — нет
+        ("© МВД ✅ 🚀 ⭐", "ru", "© МВД"),
+    ],
+)
+def test_symbols(text, language, expected):
+    assert canonicalize(text, language) == expected
+
+
+def test_lists_lookalikes_and_whitespace():
+    text = "• Первый пункт\n• Второй пункт\n\n1) Pоссия   и  мир"
+    assert canonicalize(text, "ru") == "Первый пункт. Второй пункт. 1. Россия и мир."
+
+
+@pytest.mark.parametrize(
+    "text, language",
+    [
+        ("Тираж 15 000 экземпляров, № 3, 25°C 👍", "ru"),
+        ("1948-жылы 15 000 адам, № 2", "ky"),
+        ("т.е. 5 руб. и т.д.", "ru"),
+    ],
+)
+def test_idempotent(text, language):
+    once = canonicalize(text, language)
+    assert canonicalize(once, language) == once
+
+
+def test_split_for_tts_respects_limit_and_sentences():
+    text = " ".join(f"Сүйлөм номер {i}." for i in range(500))
+    chunks = split_for_tts(text, max_chars=200)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_split_for_tts_long_sentence_and_word():
+    chunks = split_for_tts("слово " * 100 + "x" * 250, max_chars=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == ("слово" * 100 + "x" * 250)
+    assert split_for_tts("   ") == []
@@ -2,7 +2,8 @@ import React, { useState, useEffect, useRef } from 'react';
 import Slide from './Slide';
 import AudioPlayer from './AudioPlayer';
 import VoiceRecorder from './VoiceRecorder';
-import { fetchSlides, textToSpeech, speechToText, askQuestion, Slide as SlideType, API_ORIGIN } from '../services/api';
+import { fetchSlides, textToSpeech, speechToText, askQuestion, Slide as SlideType, API_ORIGIN, resolveAudioUrl } from '../services/api';
+import { useSessionSync } from '../hooks/useSessionSync';
 
 const pad2 = (n: number) => String(n).padStart(2, '0');
 
@@ -39,6 +40,22 @@ const Presentation: React.FC = () => {
     setIsSttErrorOpen(true);
   };
   
+  // Синхронный показ: зрители следуют за ведущим, а озвучку следующих
+  // слайдов загружают заранее по подсказкам сервера
+  const sessionIndexRef = useRef<number | null>(null);
+  const session = useSessionSync((state) => {
+    sessionIndexRef.current = state.index;
+    setCurrentSlideIndex(state.index);
+    state.prefetch.forEach((hint) => {
+      if (hint.audio_url) void prefetchAudioUrl(hint.slide_id, `${API_ORIGIN}${hint.audio_url}`);
+    });
+  });
+
+  // Ведущий публикует свои переходы
+  useEffect(() => {
+    if (session.isPresenter) session.goto(currentSlideIndex);
+  }, [currentSlideIndex, session.isPresenter]);
+
   // Загрузка слайдов при монтировании
   useEffect(() => {
     loadSlides('ru');
@@ -65,7 +82,7 @@ const Presentation: React.FC = () => {
       setIsLoading(true);
       const data = await fetchSlides(language);
       setSlides(data.slides);
-      setCurrentSlideIndex(0);
+      setCurrentSlideIndex(sessionIndexRef.current ?? 0);
       setError(null);
     } catch (err) {
       setError('Ошибка загрузки слайдов');
@@ -87,7 +104,7 @@ const Presentation: React.FC = () => {
       }
 
       // 1) Пытаемся взять готовый файл озвучки для слайда
-      const audioUrl = `${API_ORIGIN}/audio/ru/slide_${pad2(slide.id)}.wav`;
+      const audioUrl = resolveAudioUrl(slide.audio?.url ?? `/audio/ru/slide_${pad2(slide.id)}.wav`);
       const audioResponse = await fetch(audioUrl);
 
       if (audioResponse.ok) {
@@ -110,6 +127,23 @@ const Presentation: React.FC = () => {
     }
   };
 
+  const prefetchAudioUrl = async (slideId: number, audioUrl: string) => {
+    if (audioCacheRef.current.has(slideId)) return;
+    if (audioPrefetchInFlightRef.current.has(slideId)) return;
+
+    audioPrefetchInFlightRef.current.add(slideId);
+    try {
+      const audioResponse = await fetch(audioUrl);
+      if (audioResponse.ok) {
+        audioCacheRef.current.set(slideId, await audioResponse.blob());
+      }
+    } catch (err) {
+      console.warn('Prefetch audio failed:', err);
+    } finally {
+      audioPrefetchInFlightRef.current.delete(slideId);
+    }
+  };
+
   const prefetchSlideAudio = async (slide: SlideType) => {
     if (!slide) return;
     if (audioCacheRef.current.has(slide.id)) return;
@@ -117,7 +151,7 @@ const Presentation: React.FC = () => {
 
     audioPrefetchInFlightRef.current.add(slide.id);
     try {
-      const audioUrl = `${API_ORIGIN}/audio/ru/slide_${pad2(slide.id)}.wav`;
+      const audioUrl = resolveAudioUrl(slide.audio?.url ?? `/audio/ru/slide_${pad2(slide.id)}.wav`);
       const audioResponse = await fetch(audioUrl);
 
       if (audioResponse.ok) {
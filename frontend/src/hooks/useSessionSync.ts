@@ -0,0 +1,92 @@
+import { useEffect, useRef, useState } from 'react';
+import { API_BASE_URL } from '../services/api';
+
+export interface PrefetchHint {
+  slide_id: number;
+  audio_url: string | null;
+}
+
+export interface SessionState {
+  type: 'slide';
+  session_id: string;
+  language: string;
+  deck: string;
+  index: number;
+  slide_id: number | null;
+  total: number;
+  version: number;
+  prefetch: PrefetchHint[];
+  role?: 'presenter' | 'viewer';
+}
+
+// Синхронный показ: ?session=<id> — следовать за ведущим,
+// ?session=<id>&token=<presenter_token> — вести показ самому.
+export const useSessionSync = (onState: (state: SessionState) => void) => {
+  const params = new URLSearchParams(window.location.search);
+  const sessionId = params.get('session') || '';
+  const token = params.get('token') || '';
+
+  const [isConnected, setIsConnected] = useState(false);
+  const [isPresenter, setIsPresenter] = useState(false);
+  const socketRef = useRef<WebSocket | null>(null);
+  // Последний слайд сессии: не отправляем переход, который уже произошёл
+  const lastIndexRef = useRef<number | null>(null);
+  const onStateRef = useRef(onState);
+  onStateRef.current = onState;
+
+  useEffect(() => {
+    if (!sessionId) return;
+
+    let closed = false;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let attempt = 0;
+
+    const connect = () => {
+      const wsBase = API_BASE_URL.replace(/^http/, 'ws');
+      const query = token ? `?token=${encodeURIComponent(token)}` : '';
+      const socket = new WebSocket(`${wsBase}/sessions/${encodeURIComponent(sessionId)}/ws${query}`);
+      socketRef.current = socket;
+
+      socket.onopen = () => {
+        attempt = 0;
+        setIsConnected(true);
+      };
+      socket.onmessage = (event) => {
+        try {
+          const message = JSON.parse(event.data);
+          if (message.type !== 'slide') return;
+          if (message.role) setIsPresenter(message.role === 'presenter');
+          lastIndexRef.current = message.index;
+          onStateRef.current(message as SessionState);
+        } catch (err) {
+          console.warn('Bad session message:', err);
+        }
+      };
+      socket.onclose = () => {
+        setIsConnected(false);
+        socketRef.current = null;
+        if (closed) return;
+        // Переподключение с нарастающей паузой; после него придёт текущий слайд
+        const delay = Math.min(10000, 500 * 2 ** attempt++);
+        retryTimer = setTimeout(connect, delay);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      socketRef.current?.close();
+    };
+  }, [sessionId, token]);
+
+  const goto = (index: number) => {
+    const socket = socketRef.current;
+    if (!isPresenter || !socket || socket.readyState !== WebSocket.OPEN) return;
+    if (lastIndexRef.current === index) return;
+    lastIndexRef.current = index;
+    socket.send(JSON.stringify({ type: 'goto', index }));
+  };
+
+  return { enabled: Boolean(sessionId), isConnected, isPresenter, goto };
+};
@@ -1,17 +1,68 @@
 import axios from 'axios';
 
-const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
+export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
 
 // Нужен для статики вне /api (например, /audio/slide_01.wav)
 export const API_ORIGIN = new URL(API_BASE_URL).origin;
 
+// Статический бандл колод (backend/export_bundle.py): слайды и озвучка
+// берутся с CDN, бэкенд нужен только для QA и STT
+export const BUNDLE_URL = import.meta.env.VITE_BUNDLE_URL || '';
+
+// URL озвучки: относительные пути — от бэкенда, абсолютные (бандл) — как есть
+export const resolveAudioUrl = (url: string): string => new URL(url, API_ORIGIN).href;
+
+// Случайный id браузера: бэкенд ограничивает частоту запросов на клиента,
+// а весь класс обычно выходит в сеть с одного IP
+const getClientId = (): string => {
+  const key = 'clientId';
+  try {
+    let id = localStorage.getItem(key);
+    if (!id) {
+      id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+      localStorage.setItem(key, id);
+    }
+    return id;
+  } catch {
+    return '';
+  }
+};
+
+// Ведущий синхронного показа (?session=<id>&token=<presenter_token>):
+// его запросы обслуживаются вне очереди — бэкенд проверяет токен
+const getPresenterHeaders = (): Record<string, string> => {
+  try {
+    const params = new URLSearchParams(window.location.search);
+    const session = params.get('session') || '';
+    const token = params.get('token') || '';
+    return session && token ? { 'X-Session-Id': session, 'X-Presenter-Token': token } : {};
+  } catch {
+    return {};
+  }
+};
+
+const defaultHeaders: Record<string, string> = {
+  'Content-Type': 'application/json',
+  ...getPresenterHeaders(),
+};
+const clientId = getClientId();
+if (clientId) defaultHeaders['X-Client-Id'] = clientId;
+
 const api = axios.create({
   baseURL: API_BASE_URL,
-  headers: {
-    'Content-Type': 'application/json',
-  },
+  headers: defaultHeaders,
 });
 
+// Готовая озвучка слайда и её метаданные (считаются на сервере заранее)
+export interface SlideAudio {
+  url: string;
+  duration: number;  // секунды
+  loudness_lufs?: number | null;
+  gain_db?: number;  // усиление до целевой громкости
+  peaks?: number[];  // 0..1, для waveform
+  mime?: string;  // в статическом бандле: audio/ogg, audio/mpeg или audio/wav
+}
+
 export interface Slide {
   id: number;
   title: string;
@@ -19,6 +70,7 @@ export interface Slide {
   image_url?: string;
   tts?: string;
   notes?: string;
+  audio?: SlideAudio | null;
 }
 
 export interface SlidesResponse {
@@ -40,8 +92,42 @@ export interface QAResponse {
   audio_format: string;
 }
 
+interface BundleIndex {
+  bundles: Array<{ language: string; deck: string; default: boolean; manifest: string }>;
+}
+
+interface BundleManifest {
+  slides: string;
+  faq: string | null;
+}
+
+const fetchJson = async <T>(url: string): Promise<T> => {
+  const response = await fetch(url);
+  if (!response.ok) throw new Error(`${url}: HTTP ${response.status}`);
+  return response.json() as Promise<T>;
+};
+
+const fetchBundleSlides = async (language: string, deck?: string): Promise<SlidesResponse> => {
+  const indexUrl = new URL('index.json', BUNDLE_URL.endsWith('/') ? BUNDLE_URL : `${BUNDLE_URL}/`);
+  // index.json и manifest.json меняются при каждом экспорте, остальное — по хешу в имени
+  const index = await fetchJson<BundleIndex>(indexUrl.href);
+  const entry = index.bundles.find(
+    (b) => b.language === language && (deck ? b.deck === deck : b.default)
+  );
+  if (!entry) throw new Error(`No bundle for ${language}/${deck ?? 'default'}`);
+
+  const manifestUrl = new URL(entry.manifest, indexUrl);
+  const manifest = await fetchJson<BundleManifest>(manifestUrl.href);
+  const data = await fetchJson<SlidesResponse>(new URL(manifest.slides, manifestUrl).href);
+  for (const slide of data.slides) {
+    if (slide.audio) slide.audio.url = new URL(slide.audio.url, manifestUrl).href;
+  }
+  return data;
+};
+
 // Получить все слайды
 export const fetchSlides = async (language: string = 'ru', deck?: string): Promise<SlidesResponse> => {
+  if (BUNDLE_URL) return fetchBundleSlides(language, deck);
   const response = await api.get<SlidesResponse>('/slides', {
     params: { lang: language, deck },
   });
@@ -93,4 +179,58 @@ export const askQuestion = async (request: QARequest): Promise<QAResponse> => {
   return response.data;
 };
 
+export interface QABatchRequest {
+  questions: string[];
+  slide_context: string;
+  slide_id: number;
+  language?: string;
+  deck?: string;
+}
+
+export interface QABatchResult {
+  indices: number[];  // позиции вопроса (и его дублей) в запросе
+  question: string;
+  answer?: string;
+  audio?: string;  // base64
+  audio_format?: string;
+  source?: string;
+  error?: string;
+  retry_after?: number;
+}
+
+// Пакет вопросов (например, собранных за лекцию): ответы приходят по мере готовности.
+// Поток NDJSON читается через fetch — axios в браузере не отдаёт тело по частям.
+export const askQuestionsBatch = async (
+  request: QABatchRequest,
+  onResult: (result: QABatchResult) => void
+): Promise<void> => {
+  const response = await fetch(`${API_BASE_URL}/qa/batch`, {
+    method: 'POST',
+    headers: defaultHeaders,
+    body: JSON.stringify(request),
+  });
+  if (!response.ok || !response.body) {
+    const detail = await response.json().then((data) => data?.detail, () => undefined);
+    throw new Error(typeof detail === 'string' ? detail : `QA batch error: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let newline: number;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (!line) continue;
+      const item = JSON.parse(line);
+      if (item.done) return;
+      onResult(item as QABatchResult);
+    }
+  }
+};
+
 export default api;